@@ -0,0 +1,130 @@
+import random
+from abc import ABC, abstractmethod
+from math import exp
+
+"""
+Acceptance criteria of the iterated local search
+
+After each perturbation + local search, ILS decides whether the new local
+optimum replaces the current solution (the one the next perturbation starts
+from). Accepting everything makes it a random walk over local optima, which
+wanders away from the good ones; accepting only improvements makes it stay
+around the first good one it finds. The criteria in between:
+
+    AlwaysAcceptance:    every new solution (what ILS always did)
+    BetterAcceptance:    only if better than the current one
+    AnnealingAcceptance: better ones, and worse ones with probability
+                         exp(-increase / T), T cooling down at every call
+                         (simulated annealing style)
+    ThresholdAcceptance: anything at most 'threshold' (relative) worse than
+                         the incumbent (record-to-record travel)
+    RestartAcceptance:   another criterion, plus a restart from a new random
+                         solution after k iterations without improving the
+                         incumbent
+
+Like the stop criteria, they keep state, so ILS takes a function that makes
+a new one (see criterion.py).
+"""
+
+class Acceptance(ABC):
+    @abstractmethod
+    def accept(self, weight: int, new_weight: int, inc_weight: int, rng=random) -> bool:
+        pass
+
+    # Called once per iteration, after accept(): whether to start over
+    def restart(self, inc_weight: int) -> bool:
+        return False
+
+class AlwaysAcceptance(Acceptance):
+    def accept(self, weight, new_weight, inc_weight, rng=random):
+        return True
+
+class BetterAcceptance(Acceptance):
+    def accept(self, weight, new_weight, inc_weight, rng=random):
+        return new_weight < weight
+
+"""
+The temperature is relative to the weight of the current solution, so the
+same parameters mean the same thing on any instance: with temperature 0.01,
+a solution 1% worse is accepted with probability 1/e
+"""
+class AnnealingAcceptance(Acceptance):
+    def __init__(self, temperature, cooling):
+        self.temperature = temperature
+        self.cooling = cooling
+
+    def accept(self, weight, new_weight, inc_weight, rng=random):
+        t = self.temperature
+        self.temperature *= self.cooling
+        if new_weight <= weight:
+            return True
+        if t <= 0:
+            return False
+        return rng.random() < exp(-(new_weight - weight) / (t * weight))
+
+class ThresholdAcceptance(Acceptance):
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def accept(self, weight, new_weight, inc_weight, rng=random):
+        return new_weight <= inc_weight * (1 + self.threshold)
+
+class RestartAcceptance(Acceptance):
+    def __init__(self, k, acceptance=None):
+        self.k = k
+        self.acceptance = acceptance if acceptance is not None else BetterAcceptance()
+        self.stagnant = 0
+        self.best = float('inf')
+
+    def accept(self, weight, new_weight, inc_weight, rng=random):
+        return self.acceptance.accept(weight, new_weight, inc_weight, rng)
+
+    def restart(self, inc_weight):
+        if inc_weight < self.best:
+            self.best = inc_weight
+            self.stagnant = 0
+            return False
+        self.stagnant += 1
+        if self.stagnant >= self.k:
+            self.stagnant = 0
+            return True
+        return False
+
+"""
+Perturbation strength
+
+FixedStrength is the fixed perturbance_percentage ILS used to take.
+AdaptiveStrength starts at 'perc' and grows by 'growth' times (up to
+max_perc) after every local search that didn't improve on the solution it
+started from, and goes back to 'perc' as soon as one does: small kicks while
+they're enough to find better solutions nearby, bigger ones to get out of a
+basin they can't leave.
+"""
+
+ADAPTIVE_GROWTH = 1.5
+
+class FixedStrength:
+    def __init__(self, perc):
+        self.perc = perc
+
+    def update(self, improved: bool):
+        pass
+
+    def reset(self):
+        pass
+
+class AdaptiveStrength(FixedStrength):
+    def __init__(self, perc, max_perc, growth=ADAPTIVE_GROWTH):
+        super().__init__(perc)
+        self.base = perc
+        self.max_perc = max_perc
+        self.growth = growth
+
+    def update(self, improved: bool):
+        if improved:
+            self.perc = self.base
+        else:
+            self.perc = min(self.perc * self.growth, self.max_perc)
+
+    def reset(self):
+        self.perc = self.base
@@ -0,0 +1,422 @@
+from criterion import *
+from common import *
+from local_search import *
+from construction import *
+from instance import from_problem, load_cached
+from tracing import Trace
+from kernels import NUMBA, kernel_evaluate, kernel_best_neighbour, kernel_best_two_opt_neighbour, kernel_perturb, kernel_randomized_local_search
+from genetic import population_weights, order_crossover, edge_recombination, genetic_algorithm
+from stats import instances
+import tsplib95
+import argparse as argp
+import gc
+import json
+import platform
+import random
+import sys
+import tracemalloc
+
+"""
+Benchmarks of the hot paths
+
+Each benchmark is a function that takes the instance and an rng, does any
+preparation it needs and returns the operation to time, which takes a Trace.
+The instrumented functions count their own evaluations in the trace, the
+others add them by hand, so evaluations/sec means the same thing (neighbours
+or solutions evaluated) everywhere.
+
+Operations that change the solution they're given restore it from a snapshot
+first, so every repetition times the same work (the restore is a memcpy, it
+doesn't show next to the evaluations).
+
+For each (instance, benchmark) the operation is repeated until it's taken at
+least --mintime seconds, and that is done --rounds times, keeping the fastest
+round (the others are the slower ones because of noise, not of the code).
+The peak memory is measured separately, in one more call with tracemalloc on,
+since tracing the allocations slows everything down.
+"""
+
+RLS_PROBABILITY = 0.4
+ILS_PERTURBANCE_PERC = 0.1
+ALPHA = 0.1
+
+def bench_evaluate(graph, rng):
+    sol = random_cycle(graph.nodes, rng)
+    def op(trace):
+        evaluate(graph, sol)
+        trace.evaluated += 1
+    return op
+
+# The whole swap neighbourhood, one delta at a time
+def bench_neighborhood(graph, rng):
+    sol = random_cycle(graph.nodes, rng)
+    d = graph.rows
+    def op(trace):
+        for i in neighborhood(sol):
+            swap_delta(d, sol, i)
+        trace.evaluated += len(sol)
+    return op
+
+def selection_bench(select_neighbour):
+    def bench(graph, rng):
+        tour = Tour(random_cycle(graph.nodes, rng))
+        weight = evaluate(graph, tour.order)
+        snap = tour.snapshot()
+        def op(trace):
+            tour.restore(snap)
+            select_neighbour(graph, tour, weight, trace)
+        return op
+    return bench
+
+def bench_greedy(graph, rng):
+    def op(trace):
+        greedy(graph)
+        trace.evaluated += 1
+    return op
+
+def bench_greedy_alpha(graph, rng):
+    def op(trace):
+        greedy_alpha(graph, ALPHA, rng)
+        trace.evaluated += 1
+    return op
+
+def bench_greedy_vectorized(graph, rng):
+    def op(trace):
+        greedy_vectorized(graph)
+        trace.evaluated += 1
+    return op
+
+def bench_greedy_alpha_vectorized(graph, rng):
+    def op(trace):
+        greedy_alpha_vectorized(graph, ALPHA, rng)
+        trace.evaluated += 1
+    return op
+
+def bench_perturb(graph, rng):
+    tour = Tour(random_cycle(graph.nodes, rng))
+    snap = tour.snapshot()
+    def op(trace):
+        tour.restore(snap)
+        perturb(tour, ILS_PERTURBANCE_PERC, rng)
+        trace.evaluated += 1
+    return op
+
+# Full runs with fixed numbers of iterations (so they do the same work on
+# every machine, unlike the time criteria)
+
+RUN_ITERS = 1000
+SUPER_ITERS = 10
+SUB_ITERS = 100
+
+def bench_rls(graph, rng):
+    def op(trace):
+        randomized_local_search(graph, RLS_PROBABILITY, lambda: IterationCriterion(RUN_ITERS), rng=rng, trace=trace)
+    return op
+
+def sub_rls(rng, trace):
+    return lambda graph, initial: randomized_local_search(graph, RLS_PROBABILITY, lambda: IterationCriterion(SUB_ITERS), initial, rng, trace)
+
+def bench_ils(graph, rng):
+    def op(trace):
+        iterated_local_search(graph, sub_rls(rng, trace), lambda: IterationCriterion(SUPER_ITERS), ILS_PERTURBANCE_PERC, rng=rng, trace=trace)
+    return op
+
+def bench_grasp(graph, rng):
+    def op(trace):
+        grasp(\
+            graph,\
+            lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng),\
+            sub_rls(rng, trace),\
+            lambda: IterationCriterion(SUPER_ITERS),\
+            trace\
+        )
+    return op
+
+# The same operations in the kernels (see kernels.py), compiled if Numba is
+# installed. The warm-up call of run_benchmark does the compilation.
+
+def bench_kernel_evaluate(graph, rng):
+    sol = array('i', random_cycle(graph.nodes, rng))
+    def op(trace):
+        kernel_evaluate(graph, sol)
+        trace.evaluated += 1
+    return op
+
+def bench_kernel_perturb(graph, rng):
+    tour = Tour(random_cycle(graph.nodes, rng))
+    snap = tour.snapshot()
+    def op(trace):
+        tour.restore(snap)
+        kernel_perturb(tour, ILS_PERTURBANCE_PERC, rng)
+        trace.evaluated += 1
+    return op
+
+def bench_kernel_rls(graph, rng):
+    def op(trace):
+        kernel_randomized_local_search(graph, RLS_PROBABILITY, lambda: IterationCriterion(RUN_ITERS), rng=rng, trace=trace)
+    return op
+
+def sub_kernel_rls(rng, trace):
+    return lambda graph, initial: kernel_randomized_local_search(graph, RLS_PROBABILITY, lambda: IterationCriterion(SUB_ITERS), initial, rng, trace)
+
+def bench_kernel_ils(graph, rng):
+    def op(trace):
+        iterated_local_search(graph, sub_kernel_rls(rng, trace), lambda: IterationCriterion(SUPER_ITERS), ILS_PERTURBANCE_PERC,\
+            rng=rng, trace=trace, perturbation=kernel_perturb)
+    return op
+
+# The genetic algorithm (see genetic.py): the population evaluated and
+# crossed over as a whole, and a few generations with 2-opt as mutation
+
+POPULATION = 50
+
+def random_population(graph, rng):
+    return np.array([random_cycle(graph.nodes, rng) for _ in range(POPULATION)], dtype=np.int32)
+
+def bench_population_weights(graph, rng):
+    population = random_population(graph, rng)
+    def op(trace):
+        population_weights(graph.matrix, population)
+        trace.evaluated += POPULATION
+    return op
+
+def crossover_bench(crossover):
+    def bench(graph, rng):
+        (first, second) = (random_population(graph, rng), random_population(graph, rng))
+        gen = np.random.default_rng(rng.getrandbits(64))
+        def op(trace):
+            crossover(first, second, gen)
+            trace.evaluated += POPULATION
+        return op
+    return bench
+
+def bench_ga(graph, rng):
+    def op(trace):
+        genetic_algorithm(\
+            graph,\
+            lambda: IterationCriterion(SUPER_ITERS),\
+            lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng),\
+            lambda graph, initial: two_opt_local_search(graph, lambda: IterationCriterion(SUB_ITERS), initial, rng=rng, trace=trace),\
+            POPULATION,\
+            rng=rng,\
+            trace=trace\
+        )
+    return op
+
+# Ant colony optimization (see construction.py): a batch of ants, and a few
+# iterations with 2-opt on the best ant
+
+def bench_ants(graph, rng):
+    n = graph.number_of_nodes()
+    cand = np.array(graph.candidates(ACO_CANDIDATES), dtype=np.int64)
+    choice = 1 / np.maximum(np.asarray(graph.matrix, dtype=np.float64), 1e-9) ** ACO_BETA
+    np.fill_diagonal(choice, 0)
+    attraction = choice[np.arange(n)[:, None], cand]
+    gen = np.random.default_rng(rng.getrandbits(64))
+    def op(trace):
+        build_ants(choice, cand, attraction, ACO_ANTS, gen)
+        trace.evaluated += ACO_ANTS
+    return op
+
+def bench_aco(graph, rng):
+    def op(trace):
+        ant_colony(\
+            graph,\
+            lambda: IterationCriterion(SUPER_ITERS),\
+            lambda graph, initial: two_opt_local_search(graph, lambda: IterationCriterion(SUB_ITERS), initial, rng=rng, trace=trace),\
+            rng=rng,\
+            trace=trace\
+        )
+    return op
+
+benchmarks = {
+    'evaluate':                bench_evaluate,
+    'neighborhood':            bench_neighborhood,
+    'best_neighbour':          selection_bench(best_neighbour),
+    'first_better_neighbour':  selection_bench(first_better_neighbour),
+    'greedy':                  bench_greedy,
+    'greedy_alpha':            bench_greedy_alpha,
+    'greedy_vectorized':       bench_greedy_vectorized,
+    'greedy_alpha_vectorized': bench_greedy_alpha_vectorized,
+    'perturb':                 bench_perturb,
+    'RLS':                     bench_rls,
+    'ILS':                     bench_ils,
+    'GRASP':                   bench_grasp,
+    'kernel_evaluate':         bench_kernel_evaluate,
+    'kernel_best_neighbour':   selection_bench(kernel_best_neighbour),
+    'kernel_best_two_opt':     selection_bench(kernel_best_two_opt_neighbour),
+    'kernel_perturb':          bench_kernel_perturb,
+    'kernel_RLS':              bench_kernel_rls,
+    'kernel_ILS':              bench_kernel_ils,
+    'population_weights':      bench_population_weights,
+    'order_crossover':         crossover_bench(order_crossover),
+    'edge_recombination':      crossover_bench(edge_recombination),
+    'GA':                      bench_ga,
+    'ants':                    bench_ants,
+    'ACO':                     bench_aco,
+}
+
+DEFAULT_INSTANCES = 'bayg29,berlin52,kroA100,kroA150,a280'
+
+parser = argp.ArgumentParser(description='Benchmarks: ' + ', '.join(benchmarks.keys()))
+
+parser.add_argument('--benchmarks', type=str, default='all',\
+    help='Which benchmarks to run, separated by comma (no spaces!), or \'all\' (default all)')
+
+parser.add_argument('--instances', type=str, default=DEFAULT_INSTANCES,\
+    help=f'Which instances to run them on, separated by comma (no spaces!), or \'all\' for all the bundled ones (default {DEFAULT_INSTANCES})')
+
+parser.add_argument('--mintime', type=float, default=0.2,\
+    help='Minimum time of each round, in seconds (default 0.2)')
+
+parser.add_argument('--rounds', type=int, default=5,\
+    help='Number of rounds, the fastest one is reported (default 5)')
+
+parser.add_argument('--seed', type=str, default='0',\
+    help='Seed of the random solutions and choices (default 0)')
+
+parser.add_argument('--save', type=str,\
+    help='Save the results as a JSON baseline to this file')
+
+parser.add_argument('--baseline', type=str,\
+    help='Compare the results to the baseline in this file, and exit with status 1 if any of them regressed')
+
+parser.add_argument('--tolerance', type=float, default=0.1,\
+    help='How much slower (or bigger in peak memory) than the baseline a result can be before it counts as a regression (default 0.1, i.e. 10%%)')
+
+parser.add_argument('--nocache', action='store_true',\
+    help='Parse the instances from the .tsp files instead of using the cache')
+
+def numba_version():
+    if not NUMBA:
+        return None
+    import numba
+    return numba.__version__
+
+def load_graph(name, use_cache):
+    instance = instances[name]
+    if use_cache:
+        return load_cached(instance['path'], name, instance['bks'])
+    return from_problem(tsplib95.load(instance['path']), name)
+
+def time_round(op, mintime_ns):
+    trace = Trace()
+    ops = 0
+    start = perf_counter_ns()
+    elapsed = 0
+    while elapsed < mintime_ns:
+        op(trace)
+        ops += 1
+        elapsed = perf_counter_ns() - start
+    return (elapsed, ops, trace.evaluated)
+
+def peak_memory(op):
+    gc.collect()
+    tracemalloc.start()
+    op(Trace())
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def run_benchmark(bench, graph, seed, rounds, mintime_ns):
+    rng = random.Random(seed)
+    op = bench(graph, rng)
+    op(Trace())  # warm up (candidate lists, caches, ...)
+
+    best = None
+    for _ in range(rounds):
+        (elapsed, ops, evaluated) = time_round(op, mintime_ns)
+        if best is None or elapsed / ops < best[0] / best[1]:
+            best = (elapsed, ops, evaluated)
+    (elapsed, ops, evaluated) = best
+
+    return {
+        'ns_per_op': elapsed / ops,
+        'ops': ops,
+        'evaluations_per_second': evaluated / (elapsed / 1e9),
+        # with a fresh op, so it's the same path every time
+        'peak_memory_bytes': peak_memory(bench(graph, random.Random(seed))),
+    }
+
+"""
+Regressions: a result is flagged when its time per operation or its peak
+memory is more than (1 + tolerance) times the baseline's
+Benchmarks or instances missing from either side are just skipped
+"""
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name in results:
+        for bench in results[name]:
+            if bench not in baseline.get(name, {}):
+                continue
+            curr = results[name][bench]
+            base = baseline[name][bench]
+            for key in ['ns_per_op', 'peak_memory_bytes']:
+                ratio = curr[key] / base[key] if base[key] > 0 else 1
+                curr[key + '_ratio'] = ratio
+                if ratio > 1 + tolerance:
+                    regressions.append((name, bench, key, base[key], curr[key], ratio))
+    return regressions
+
+if __name__ == '__main__':
+
+    args = parser.parse_args()
+
+    benchmarks_to_run = benchmarks.keys() if args.benchmarks == 'all' else args.benchmarks.split(',')
+    instances_to_run = [name for name in instances if not instances[name].get('large')] if args.instances == 'all' else args.instances.split(',')
+
+    mintime_ns = int(args.mintime * 1e9)
+
+    results = {}
+    for name in instances_to_run:
+        graph = load_graph(name, not args.nocache)
+        print(f'{name} (n = {graph.n})')
+        results[name] = {}
+        for bench in benchmarks_to_run:
+            result = run_benchmark(benchmarks[bench], graph, f'{args.seed}:{name}:{bench}', args.rounds, mintime_ns)
+            results[name][bench] = result
+            print('    {0:<24}{1:>16.0f} ns/op{2:>16.0f} evals/s{3:>12.1f} KiB'.format(\
+                bench,\
+                result['ns_per_op'],\
+                result['evaluations_per_second'],\
+                result['peak_memory_bytes'] / 1024\
+            ))
+        print()
+
+    output = {
+        'machine': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'numba': numba_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+        },
+        'settings': {
+            'mintime': args.mintime,
+            'rounds': args.rounds,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f'Regressions (more than {args.tolerance * 100:.0f}% over the baseline):')
+            for (name, bench, key, base, curr, ratio) in regressions:
+                print(f'    {name} {bench} {key}: {base:.0f} -> {curr:.0f} ({ratio:.2f}x)')
+        else:
+            print('No regressions against ' + args.baseline)
+        print()
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            f.write(json.dumps(output, indent=4, sort_keys=True))
+            print('Saved baseline to ' + args.save)
+
+    if regressions:
+        sys.exit(1)
@@ -0,0 +1,132 @@
+import numpy as np
+from math import ceil
+from common import evaluate
+
+"""
+Lower bounds (symmetric instances)
+
+A 1-tree is a spanning tree of the nodes 1..n-1 plus the two cheapest edges
+of node 0. Every tour is a 1-tree (the path through 1..n-1 is a spanning
+tree of them, plus the two edges of 0), so the cheapest 1-tree weighs at
+most as much as the optimal tour.
+
+That alone is a weak bound (the cheapest 1-tree has nodes of degree 1 and
+of degree 3 or more), but adding penalties pi[v] to the weights,
+
+    d'(v, w) = d(v, w) + pi[v] + pi[w]
+
+adds exactly 2 * sum(pi) to every tour, since every node has two edges in
+it, and not to every 1-tree, so
+
+    L(pi) = (cheapest 1-tree with d') - 2 * sum(pi)
+
+is a lower bound for any pi. The Held-Karp (Lagrangian) bound is the best
+of them, approached by subgradient ascent: raising the penalty of the nodes
+of degree more than 2 and lowering the one of the leaves, which pushes the
+1-tree towards a tour. It usually ends within 1% of the optimum.
+"""
+
+"""
+Cheapest 1-tree of the matrix m (with inf on the diagonal), by Prim with
+NumPy (O(n^2)), as (weight, degree of each node)
+"""
+def one_tree(m):
+    n = len(m)
+    degree = np.zeros(n, dtype=np.int64)
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[0] = True  # node 0 stays out of the tree, this just skips it
+    in_tree[1] = True
+    dist = m[1].copy()
+    parent = np.ones(n, dtype=np.int64)
+    weight = 0.0
+    for _ in range(n - 2):
+        dist[in_tree] = np.inf
+        u = int(np.argmin(dist))
+        weight += dist[u]
+        degree[u] += 1
+        degree[parent[u]] += 1
+        in_tree[u] = True
+        closer = m[u] < dist
+        dist[closer] = m[u][closer]
+        parent[closer] = u
+    (a, b) = np.argpartition(m[0], 1)[:2]
+    weight += m[0, a] + m[0, b]
+    degree[[0, a, b]] += [2, 1, 1]
+    return (weight, degree)
+
+# Weight of the minimum spanning tree of the matrix m (inf on the diagonal)
+def spanning_tree_weight(m):
+    dist = m[0].copy()
+    in_tree = np.zeros(len(m), dtype=bool)
+    in_tree[0] = True
+    weight = 0.0
+    for _ in range(len(m) - 1):
+        dist[in_tree] = np.inf
+        u = int(np.argmin(dist))
+        weight += dist[u]
+        in_tree[u] = True
+        np.minimum(dist, m[u], out=dist)
+    return weight
+
+"""
+Subgradient ascent of L(pi), returns (bound, pi) for the best one found
+
+'upper' is the weight of any tour (the closer to the optimum the faster it
+converges), it sets the step: t = step * (upper - L) / |degree - 2|^2, with
+'step' halved every time 'patience' iterations go by without a better bound.
+It stops when a 1-tree is a tour (then it's optimal), after 'iterations'
+iterations or when the step gets too small to matter.
+"""
+
+ASCENT_ITERATIONS = 1000
+ASCENT_PATIENCE = 20
+
+def lagrangian_bound(graph, upper, iterations=ASCENT_ITERATIONS, patience=ASCENT_PATIENCE):
+    m = np.asarray(graph.matrix, dtype=np.float64).copy()
+    np.fill_diagonal(m, np.inf)
+    n = len(m)
+    pi = np.zeros(n)
+    (best, best_pi) = (-np.inf, pi.copy())
+    step = 2.0
+    stale = 0
+    for _ in range(iterations):
+        (weight, degree) = one_tree(m + pi[:, None] + pi[None, :])
+        bound = weight - 2 * pi.sum()
+        if bound > best + 1e-9:
+            (best, best_pi) = (bound, pi.copy())
+            stale = 0
+        else:
+            stale += 1
+            if stale >= patience:
+                (step, stale) = (step / 2, 0)
+        g = degree - 2
+        norm = (g * g).sum()
+        if norm == 0 or step < 1e-6:
+            break
+        pi = pi + step * max(upper - bound, 0) / norm * g
+    return (best, best_pi)
+
+"""
+Lower bound of an instance (for stats.py): the Held-Karp bound, rounded up
+when the weights are integers, since then so are the tours. The ascent
+starts from the best known solution if the instance has one, or else from
+the nearest neighbour tour. None when there's no matrix (LazyInstance, the
+bound would be O(n^2) memory anyway) or it isn't symmetric.
+"""
+def lower_bound(graph):
+    if not isinstance(graph.matrix, np.ndarray):
+        return None
+    m = np.asarray(graph.matrix)
+    if not np.array_equal(m, m.T):
+        return None
+    if graph.n <= 3:  # only one tour
+        return evaluate(graph, list(graph.nodes))
+
+    from construction import nearest_neighbour
+    upper = nearest_neighbour(graph)[0]
+    if graph.bks is not None:
+        upper = min(upper, graph.bks)
+    (bound, _) = lagrangian_bound(graph, upper)
+    if np.issubdtype(m.dtype, np.integer):
+        return int(ceil(bound * (1 - 1e-9)))  # not up past an integer on rounding errors
+    return float(bound)
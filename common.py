@@ -3,39 +3,55 @@ import tsplib95 as tsplib
 import networkx as nx
 import random
 from itertools import permutations
+from instance import Instance, from_problem, from_graph
+from moves import swap_delta, apply_swap
+
+"""
+Every function that makes random choices takes an 'rng' argument: anything
+with the interface of the random module (usually a random.Random). It
+defaults to the random module itself, i.e. the global random state, but
+giving each run its own random.Random makes it replayable and independent
+of whatever else runs in the same process.
+"""
 
 def parse_instance(filename):
-    return tsplib.load(filename).get_graph()
+    return from_problem(tsplib.load(filename))
 
-def brute_force(g: nx.Graph) -> Tuple[float, list]:
+# O(n!), see exact.py for exact solvers that go further
+def brute_force(g: Instance) -> Tuple[float, list]:
     all_cycles = map(list, permutations(list(g.nodes)))
     return min(map(lambda s: (evaluate(g, s), s), all_cycles))
 
-def random_walk(graph, make_criterion):
+def random_walk(graph, make_criterion, rng=random, trace=None):
     n = graph.number_of_nodes()
-    sol = random_cycle(graph.nodes)
+    sol = random_cycle(graph.nodes, rng)
     weight = evaluate(graph, sol)
     criterion = make_criterion()
     while not criterion.stop():
-        v = random.randrange(0, n)
-        w = (v + 1) % n
-        sol[v], sol[w] = sol[w], sol[v]
-        weight = evaluate(graph, sol)
+        v = rng.randrange(0, n)
+        weight += swap_delta(graph.rows, sol, v)
+        apply_swap(sol, v)
         criterion.update(weight)
+        if trace is not None:
+            trace.evaluated += 1
+            trace.moves += 1
+            trace.step(weight)
     return (weight, sol)
 
 
 def evaluate(graph, solution):
+    if len(solution) == 0:
+        return 0
+    d = graph.rows
     s = 0
-    n = len(solution)
-    for i in range(n):
-        v = solution[i]
-        w = solution[(i+1)%n]
-        s += graph.edges[v, w]['weight']
+    v = solution[-1]
+    for w in solution:
+        s += d[v][w]
+        v = w
     return s
 
-def random_cycle(nodes):
+def random_cycle(nodes, rng=random):
     nodes = list(nodes)
-    random.shuffle(nodes)
+    rng.shuffle(nodes)
     return nodes
 
@@ -4,26 +4,33 @@ import random
 from common import *
 from criterion import *
 from local_search import randomized_local_search
+from distances import weight_of_distance
+from memo import memoized
+from genetic import population_weights
 
+import numpy as np
 from math import ceil
 from heapq import heappush, heappushpop
 
 """
 Greedy (nearest neighbour)
 Greedy-alpha
+Vectorized greedy and greedy-alpha
+Ant colony optimization (MAX-MIN ant system, vectorized over the ants)
+Nearest neighbour, greedy edge and space-filling curve (w/ the spatial index)
+(a trace given to the constructors records the constructed solution as one step, see tracing.py)
 Repeated greedy (w/ construct_solution as arg)
 GRASP (w/ construct_solution AND local_search as args)
 """
 
-def greedy(graph):
+def greedy(graph, trace=None):
     nodes = list(graph.nodes)
     num_nodes = graph.number_of_nodes()
+    d = graph.rows
 
     cycle = []
 
-    marked = {}
-    for node in graph.nodes:
-        marked[node] = False
+    marked = [False] * num_nodes
 
     visited = 0
 
@@ -36,10 +43,11 @@ def greedy(graph):
     while visited < num_nodes:
         min_adjacent_node = -1
         min_weight = float('inf')
+        row = d[curr_node]
         for other_node in nodes:
             if marked[other_node]:
                 continue
-            weight = graph.edges[curr_node, other_node]['weight']
+            weight = row[other_node]
             if weight < min_weight:
                 min_weight = weight
                 min_adjacent_node = other_node
@@ -49,78 +57,56 @@ def greedy(graph):
         visited += 1
         marked[curr_node] = True
     
-    return (evaluate(graph, cycle), cycle)
+    weight = evaluate(graph, cycle)
+    if trace is not None:
+        trace.step(weight)
+    return (weight, cycle)
 
 """
 For euclidean graphs, this implementation evaluates
 edges according to their manhattan distance, instead
-of their euclidean distance. Takes a TSP problem
-(return of tsplib95.load()) directly so it can access
-the actual coordinates of the nodes in 2D space.
+of their euclidean distance. Needs the instance to
+have been loaded with coordinates (instance.coords)
+so it can access the actual coordinates of the nodes
+in 2D space.
 """
-def greedy_manhattan(tsp_problem):
-
-    node_coords = tsp_problem.node_coords
-
-    cycle = []
-
-    num_visited = 0
-    visited = {}
-
-    for k in node_coords:
-        visited[k] = False
-
-    curr_node = 1
-
-    cycle.append(curr_node)
-    visited[curr_node] = True
-    num_visited += 1
-
-    num_nodes = len(node_coords)
-
-    while num_visited < num_nodes:
-        min_adjacent_node = -1
-        min_weight = float('inf')
+def greedy_manhattan(graph, trace=None):
+    coords = np.asarray(graph.coords)
+    n = graph.number_of_nodes()
 
-        for other_node in range(1, num_nodes+1):
+    # Nearest unvisited node by the spatial index (see spatial.py), which
+    # gives the same node as scanning all of them (the first one on ties),
+    # but only looks at the cells around the current node
+    grid = graph.grid()
+    alive = np.ones(n, dtype=bool)
 
-            if other_node == curr_node:
-                continue
+    curr_node = 0
+    alive[curr_node] = False
+    cycle = [curr_node]
 
-            if visited[other_node]:
-                continue
+    for _ in range(n - 1):
+        curr = coords[curr_node]
+        manhattan = lambda others: np.abs(coords[others, 0] - curr[0]) + np.abs(coords[others, 1] - curr[1])
+        # the manhattan distance is at least the euclidean one
+        curr_node = grid.nearest(curr_node, alive, manhattan, lambda distance: distance)
+        alive[curr_node] = False
+        cycle.append(curr_node)
 
-            other_node_coord = node_coords[other_node]
+    weight = evaluate(graph, cycle)
+    if trace is not None:
+        trace.step(weight)
+    return (weight, cycle)
 
-            # manhattan distance
-            [ curr_x,  curr_y] = node_coords[curr_node]
-            [other_x, other_y] = other_node_coord
-            weight = abs(other_x - curr_x)\
-                   + abs(other_y - curr_y)
 
-            if weight < min_weight:
-                min_weight = weight
-                min_adjacent_node = other_node
-
-        cycle.append(min_adjacent_node)
-        num_visited += 1
-        visited[min_adjacent_node] = True
-        
-        curr_node = min_adjacent_node
-
-    return (evaluate(tsp_problem.get_graph(), cycle), cycle)
-
-
-def greedy_alpha(graph, alpha):
+def greedy_alpha(graph, alpha, rng=random, trace=None):
     nodes = list(graph.nodes)
     n = graph.number_of_nodes()
+    d = graph.rows
 
     cycle = []
     cycle_weight = 0
 
-    marked = {}
-    for node in nodes:
-        marked[node] = False
+    marked = [False] * n
     visited = 0
 
     # Start at 0
@@ -135,18 +121,19 @@ def greedy_alpha(graph, alpha):
         k = ceil(alpha * n_left)
 
         bestk = []
+        row = d[curr_node]
 
         for other_node in nodes:
             if marked[other_node]:
                 continue
-            weight = graph.edges[curr_node, other_node]['weight']
+            weight = row[other_node]
 
             if len(bestk) < k:
                 heappush(bestk, (-weight, other_node))
             else:
                 heappushpop(bestk, (-weight, other_node))
 
-        (neg_weight, chosen_node) = random.choice(bestk)
+        (neg_weight, chosen_node) = rng.choice(bestk)
         cycle.append(chosen_node)
         cycle_weight += -neg_weight
 
@@ -154,15 +141,396 @@ def greedy_alpha(graph, alpha):
         visited += 1
         curr_node = chosen_node
 
-    cycle_weight += graph.edges[cycle[-1], cycle[0]]['weight']
+    cycle_weight += d[cycle[-1]][cycle[0]]
 
+    if trace is not None:
+        trace.step(cycle_weight)
     return (cycle_weight, cycle)
 
+"""
+Vectorized greedy and greedy-alpha
+
+Same algorithms, but each step looks at the whole row of the distance matrix
+at once instead of going through the nodes one by one. Visited nodes get an
+infinite penalty added to their distance, so they're never picked by argmin
+or among the k nearest (found with argpartition, no heap needed).
+Faster from ~100 nodes up; for tiny instances the NumPy call overhead makes
+them a bit slower than the loops above.
+greedy_vectorized gives exactly the same cycle as greedy (argmin also keeps
+the first node on ties).
+"""
+
+def greedy_vectorized(graph, trace=None):
+    n = graph.number_of_nodes()
+    matrix = graph.matrix
+
+    penalty = np.zeros(n)
+
+    # Start at 0
+    curr_node = 0
+    penalty[curr_node] = np.inf
+    cycle = [curr_node]
+
+    for _ in range(n - 1):
+        curr_node = int(np.argmin(matrix[curr_node] + penalty))
+        penalty[curr_node] = np.inf
+        cycle.append(curr_node)
+
+    weight = evaluate(graph, cycle)
+    if trace is not None:
+        trace.step(weight)
+    return (weight, cycle)
+
+def greedy_alpha_vectorized(graph, alpha, rng=random, trace=None):
+    n = graph.number_of_nodes()
+    matrix = graph.matrix
+
+    penalty = np.zeros(n)
+
+    # Start at 0
+    curr_node = 0
+    penalty[curr_node] = np.inf
+    cycle = [curr_node]
+
+    for visited in range(1, n):
+        k = max(1, ceil(alpha * (n - visited)))
+        weights = matrix[curr_node] + penalty
+        if k == 1:
+            curr_node = int(np.argmin(weights))
+        else:
+            bestk = np.argpartition(weights, k - 1)[:k]
+            curr_node = int(rng.choice(bestk))
+        penalty[curr_node] = np.inf
+        cycle.append(curr_node)
+
+    weight = evaluate(graph, cycle)
+    if trace is not None:
+        trace.step(weight)
+    return (weight, cycle)
+
+"""
+Ant colony optimization (MAX-MIN ant system)
+
+Like repeated greedy-alpha, it builds tour after tour node by node, but each
+ant picks the next node at random with probability proportional to
+
+    tau[v][w]^alpha * eta[v][w]^beta
+
+where eta = 1/d is how good an edge looks on its own and tau, the pheromone,
+is how good it turned out in the tours built so far. After each iteration
+all the pheromone evaporates (tau *= 1 - evaporation) and the best ant of
+the iteration (the best tour so far, every ACO_BEST_SO_FAR_EVERY iterations)
+deposits 1/weight on its edges, so the next ants build tours more like it.
+MMAS keeps tau between tau_min and tau_max (set by the best weight so far),
+so no edge ever gets so little pheromone that it stops being tried, and it
+starts everything at tau_max, which makes the first iterations explore.
+
+The iteration-best ant goes through the local search, if one is given, before
+it deposits (the tours ants build on their own are far from local optima).
+
+Per iteration, tau^alpha * eta^beta is computed for the whole matrix at
+once, and then taken only at the ACO_CANDIDATES nearest nodes of each node:
+the ants are built together, 'ants' at a time, and each step of all of them
+is a roulette over their candidates (a cumulative sum and a comparison). An
+ant whose candidates have all been visited goes to the unvisited node with
+the biggest tau^alpha * eta^beta in the whole row. So the cost per ant is a
+few NumPy operations on (ants x ACO_CANDIDATES) arrays per node, instead of
+the n-node Python loop of greedy_alpha, and the weights of all the tours
+are computed at once as in genetic.py.
+
+The matrices are n x n, so this is for instances with a matrix (not for
+LazyInstance). The random choices are made by a NumPy Generator seeded from
+rng, like in genetic.py.
+"""
+
+ACO_ANTS              = 20
+ACO_ALPHA             = 1.0
+ACO_BETA              = 3.0
+ACO_EVAPORATION       = 0.02
+ACO_CANDIDATES        = 20
+ACO_P_BEST            = 0.05  # sets tau_min, see pheromone_limits
+ACO_BEST_SO_FAR_EVERY = 10
+
+"""
+tau_max is the pheromone an edge would end up with if it were in the best
+tour at every iteration. tau_min is set so that, once everything converged,
+an ant would still build that best tour with probability ACO_P_BEST
+(Stützle and Hoos' formula, with n/2 as the average number of choices).
+On a handful of nodes that comes out above tau_max, and then it's tau_max.
+"""
+def pheromone_limits(best_weight, evaporation, n):
+    tau_max = 1 / (evaporation * best_weight)
+    root = ACO_P_BEST ** (1 / n)
+    tau_min = tau_max * (1 - root) / (max(n / 2 - 1, 1) * root)
+    return (min(tau_min, tau_max), tau_max)
+
+# 'ants' tours, attraction[v] being the tau^alpha * eta^beta of the
+# candidates cand[v] and choice the whole matrix of it
+def build_ants(choice, cand, attraction, ants, gen):
+    (n, k) = cand.shape
+    rows = np.arange(ants)
+    tours = np.empty((ants, n), dtype=np.int32)
+    visited = np.zeros((ants, n), dtype=bool)
+    current = gen.integers(0, n, size=ants)
+    for step in range(n):
+        tours[:, step] = current
+        visited[rows, current] = True
+        if step == n - 1:
+            break
+
+        options = cand[current]
+        w = np.where(visited[rows[:, None], options], 0, attraction[current])
+        cumulative = np.cumsum(w, axis=1)
+        total = cumulative[:, -1]
+        # the first candidate whose cumulative sum is past a random point of [0, total)
+        pick = (cumulative <= (gen.random(ants) * total)[:, None]).sum(axis=1)
+        following = options[rows, np.minimum(pick, k - 1)]
+
+        stuck = total <= 0
+        if stuck.any():
+            best = choice[current[stuck]]
+            best[visited[stuck]] = -1
+            following[stuck] = np.argmax(best, axis=1)
+        current = following
+    return tours
+
+def ant_colony(graph, make_criterion, local_search=None, ants=ACO_ANTS, alpha=ACO_ALPHA, beta=ACO_BETA, evaporation=ACO_EVAPORATION,\
+        rng=random, trace=None):
+    # Created first so a time limit also covers the setup
+    criterion = make_criterion()
+    gen = np.random.default_rng(rng.getrandbits(64))
+    n = graph.number_of_nodes()
+
+    m = np.asarray(graph.matrix, dtype=np.float64)
+    symmetric = np.array_equal(m, m.T)
+    eta = 1 / np.maximum(m, 1e-9) ** beta  # (a weight of 0 makes an edge as good as it gets)
+    np.fill_diagonal(eta, 0)
+    cand = np.array(graph.candidates(ACO_CANDIDATES), dtype=np.int64)
+    k_rows = np.arange(n)[:, None]
+
+    (inc_weight, inc_sol) = nearest_neighbour(graph)
+    (tau_min, tau_max) = pheromone_limits(inc_weight, evaporation, n)
+    tau = np.full((n, n), tau_max)
+
+    iteration = 0
+    while not criterion.stop():
+        choice = tau ** alpha * eta if alpha != 1 else tau * eta
+        tours = build_ants(choice, cand, choice[k_rows, cand], ants, gen)
+        weights = population_weights(graph.matrix, tours)
+        if trace is not None:
+            trace.evaluated += ants
+
+        best = int(np.argmin(weights))
+        (weight, sol) = (weights[best].item(), tours[best])
+        if local_search is not None:
+            (weight, sol) = local_search(graph, sol.tolist())
+        if weight < inc_weight:
+            (inc_weight, inc_sol) = (weight, list(sol))
+            (tau_min, tau_max) = pheromone_limits(inc_weight, evaporation, n)
+
+        iteration += 1
+        if iteration % ACO_BEST_SO_FAR_EVERY == 0:
+            (weight, sol) = (inc_weight, inc_sol)
+        sol = np.asarray(sol)
+        (a, b) = (sol, np.roll(sol, -1))
+        tau *= 1 - evaporation
+        tau[a, b] += 1 / weight
+        if symmetric:
+            tau[b, a] += 1 / weight
+        np.clip(tau, tau_min, tau_max, out=tau)
+
+        criterion.update(inc_weight)
+        if trace is not None:
+            trace.step(inc_weight)
+
+    return (inc_weight, [int(v) for v in inc_sol])
+
+"""
+Constructors on the spatial index
+
+For the instances whose weights only depend on the euclidean distance
+between the coordinates (EUC_2D, CEIL_2D, ATT), the nearest unvisited node
+can be found by the spatial index instead of scanning the whole row, so the
+nearest neighbour construction is close to O(n log n) instead of O(n^2)
+(and it's the only way for big instances, see LazyInstance).
+
+(weights_of, bound) for Grid.nearest, or None if the grid can't be used
+"""
+
+SPATIAL_TYPES = ('EUC_2D', 'CEIL_2D', 'ATT')
+
+def spatial_weights(graph, v):
+    if graph.coords is None or graph.edge_weight_type not in SPATIAL_TYPES:
+        return None
+    weights_of = lambda others: graph.matrix[v, others]
+    bound = lambda distance: weight_of_distance(graph.edge_weight_type, distance)
+    return (weights_of, bound)
+
+"""
+Nearest neighbour by the spatial index when possible, greedy_vectorized
+otherwise. Either way it's the same cycle as greedy.
+"""
+def nearest_neighbour(graph, trace=None):
+    if spatial_weights(graph, 0) is None:
+        return greedy_vectorized(graph, trace)
+
+    n = graph.number_of_nodes()
+    grid = graph.grid()
+    alive = np.ones(n, dtype=bool)
+
+    curr_node = 0
+    alive[curr_node] = False
+    cycle = [curr_node]
+
+    for _ in range(n - 1):
+        (weights_of, bound) = spatial_weights(graph, curr_node)
+        curr_node = grid.nearest(curr_node, alive, weights_of, bound)
+        alive[curr_node] = False
+        cycle.append(curr_node)
+
+    weight = evaluate(graph, cycle)
+    if trace is not None:
+        trace.step(weight)
+    return (weight, cycle)
+
+"""
+Greedy edge (greedy matching)
+
+Goes through the edges from the shortest up, adding each one that doesn't
+give a node a third edge or close a cycle. Only the edges to the
+GREEDY_EDGE_CANDIDATES nearest nodes of each node are considered (the
+candidate lists), so this leaves some paths (fragments) instead of a tour;
+they're then joined nearest neighbour style: from the end of a fragment to
+the nearest end of a fragment not in the tour yet, through it to its other
+end, and so on. Usually better than nearest neighbour, though not always.
+"""
+
+GREEDY_EDGE_CANDIDATES = 10
+
+def greedy_edge(graph, trace=None):
+    n = graph.number_of_nodes()
+    if n < 3:
+        cycle = list(graph.nodes)
+        weight = evaluate(graph, cycle)
+        if trace is not None:
+            trace.step(weight)
+        return (weight, cycle)
+
+    cand = np.array(graph.candidates(GREEDY_EDGE_CANDIDATES), dtype=np.int64)
+    k = cand.shape[1]
+    u = np.repeat(np.arange(n), k)
+    v = cand.ravel()
+    keys = np.unique(np.minimum(u, v) * n + np.maximum(u, v))
+    (a, b) = (keys // n, keys % n)
+    w = np.asarray(graph.matrix[a, b])
+    by_weight = np.lexsort((b, a, w))
+
+    degree = [0] * n
+    adjacent = [[] for _ in range(n)]
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for (x, y) in zip(a[by_weight].tolist(), b[by_weight].tolist()):
+        if degree[x] == 2 or degree[y] == 2:
+            continue
+        (rx, ry) = (find(x), find(y))
+        if rx == ry:
+            continue
+        parent[rx] = ry
+        degree[x] += 1
+        degree[y] += 1
+        adjacent[x].append(y)
+        adjacent[y].append(x)
+
+    # The fragments' ends (nodes with no edge are fragments of their own)
+    alive = np.array([d < 2 for d in degree])
+    grid = graph.grid() if spatial_weights(graph, 0) is not None else None
+
+    def nearest_end(t):
+        if grid is not None:
+            (weights_of, bound) = spatial_weights(graph, t)
+            return grid.nearest(t, alive, weights_of, bound)
+        row = np.where(alive, graph.matrix[t], np.inf)
+        return int(np.argmin(row))
+
+    cycle = []
+    end = int(np.argmax(alive))
+    while True:
+        # Through the fragment, from one end to the other
+        (prev, curr) = (-1, end)
+        alive[curr] = False
+        while True:
+            cycle.append(curr)
+            following = [x for x in adjacent[curr] if x != prev]
+            if not following:
+                break
+            (prev, curr) = (curr, following[0])
+        alive[curr] = False
+        if len(cycle) == n:
+            break
+        end = nearest_end(curr)
+
+    weight = evaluate(graph, cycle)
+    if trace is not None:
+        trace.step(weight)
+    return (weight, cycle)
+
+"""
+Space-filling curve
+
+Visits the nodes in the order of a Hilbert curve through their coordinates
+(scaled to a 2^16 x 2^16 grid). It's just a sort, O(n log n) and vectorized,
+so it's the fastest constructor by far, though its tours are worse than
+nearest neighbour's (30-60% above the optimum): a cheap start for the
+local searches on big instances.
+"""
+
+HILBERT_ORDER = 16
+
+def hilbert_index(x, y, order=HILBERT_ORDER):
+    side = 1 << order
+    d = np.zeros(len(x), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve inside it has the right orientation
+        flip = ~ry & rx
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        (x, y) = (np.where(ry, x, y), np.where(ry, y, x))
+        s >>= 1
+    return d
+
+def space_filling_curve(graph, trace=None):
+    # Without coordinates there's no curve to follow
+    if graph.coords is None:
+        return nearest_neighbour(graph, trace)
+
+    coords = np.asarray(graph.coords, dtype=np.float64)
+    lo = coords.min(axis=0)
+    extent = max((coords.max(axis=0) - lo).max(), 1e-12)
+    scaled = ((coords - lo) / extent * ((1 << HILBERT_ORDER) - 1)).astype(np.int64)
+
+    d = hilbert_index(scaled[:, 0], scaled[:, 1])
+    cycle = np.argsort(d, kind='stable').tolist()
+
+    weight = evaluate(graph, cycle)
+    if trace is not None:
+        trace.step(weight)
+    return (weight, cycle)
+
 """
 Repeated greedy
 """
 
-def repeated_greedy(graph, construct_solution, make_criterion):
+def repeated_greedy(graph, construct_solution, make_criterion, trace=None):
     (inc_weight, inc_sol) = construct_solution(graph)
     criterion = make_criterion()
     while not criterion.stop():
@@ -170,13 +538,17 @@ def repeated_greedy(graph, construct_solution, make_criterion):
         if weight < inc_weight:
             inc_weight, inc_sol = weight, sol
         criterion.update(inc_weight)
+        if trace is not None:
+            trace.step(inc_weight)
     return (inc_weight, inc_sol)
 
 """
 GRASP
+With a TourCache (see memo.py), constructed tours seen before skip the local search
 """
 
-def grasp(graph, construct_solution, local_search, make_criterion):
+def grasp(graph, construct_solution, local_search, make_criterion, trace=None, cache=None):
+    local_search = memoized(local_search, cache)
     (inc_weight, inc_sol) = construct_solution(graph)
 
     criterion = make_criterion()
@@ -188,6 +560,8 @@ def grasp(graph, construct_solution, local_search, make_criterion):
             inc_weight, inc_sol = weight, sol
         
         criterion.update(inc_weight)
+        if trace is not None:
+            trace.step(inc_weight)
 
     return (inc_weight, inc_sol)
 
@@ -204,7 +578,7 @@ if __name__ == '__main__':
 
     print('Greedy:')
     (weight, greedy_sol) = greedy(graph)
-    print((weight, greedy_sol), end='\n\n')
+    print((weight, graph.labelled(greedy_sol)), end='\n\n')
 
     #print('Greedy followed by randomized local search for 1 min:')
     #print(randomized_local_search(graph, 0.4, lambda: TimeCriterion(20), greedy_sol), end='\n\n')
@@ -229,6 +603,6 @@ if __name__ == '__main__':
         lambda graph, initial: randomized_local_search(graph, 0.4, lambda: TimeCriterion(20), initial), \
         lambda: IterationCriterion(10)
     )
-    print((grasp_weight, grasp_sol), end='\n\n')
+    print((grasp_weight, graph.labelled(grasp_sol)), end='\n\n')
 
     #output_image(sys.argv[1], graph, solution)
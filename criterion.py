@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from time import time
+from contextlib import contextmanager
+from time import perf_counter_ns
 
 """
 The optimization functions generally take a function that returns a StopCriterion
@@ -17,6 +18,22 @@ class StopCriterion(ABC):
     def stop(self) -> bool:
         pass
 
+    """
+    For loops that run many iterations at once without coming back to Python
+    (see kernels.py): remaining() is how many iterations can run before the
+    criterion could possibly stop (None if it can't tell, e.g. a deadline),
+    and update_many() does the same as 'iterations' calls to update(), where
+    the weight was solution_weight in the last 'stalled' of them and bigger
+    in the ones before (stalled == iterations if it didn't change at all).
+    The defaults are exact for any criterion: one iteration at a time.
+    """
+    def remaining(self):
+        return 1
+
+    def update_many(self, solution_weight: int, iterations: int, stalled: int):
+        for _ in range(iterations):
+            self.update(solution_weight)
+
 class IterationCriterion(StopCriterion):
     def __init__(self, max_iters):
         self.max_iters = max_iters
@@ -28,20 +45,114 @@ class IterationCriterion(StopCriterion):
     def stop(self) -> bool:
         return self.iters >= self.max_iters
 
+    def remaining(self):
+        return max(self.max_iters - self.iters, 1)
+
+    def update_many(self, solution_weight: int, iterations: int, stalled: int):
+        self.iters += iterations
+
 """
-Time in seconds
-Not a very precise implementation, but close enough
+Deadlines
+
+A Deadline is a point in time (perf_counter_ns) after which the optimization
+has to stop. DeadlineCriterion stops at a given deadline, and TimeCriterion
+is just a DeadlineCriterion with its own deadline, time_limit seconds from now.
+
+Reading the clock costs about as much as the rest of a call to stop(), so a
+loop of very fast iterations only reads it every 'every' calls. 'every'
+doubles, up to MAX_CHECK_EVERY, while the calls between two readings took
+less than SLOW_CALL_NS each, and goes back to 1 as soon as they didn't: an
+iteration that does any real work (a few microseconds, in Python) reads the
+clock on every call. So the stop is late by at most one iteration while the
+loop keeps its speed, and by at most MAX_CHECK_EVERY iterations, once, when
+fast iterations turn slow between two readings.
+
+CHECK_INTERVAL_NS is how long the batches of kernels.py aim to take.
+"""
+
+CHECK_INTERVAL_NS = 1_000_000  # 1ms
+SLOW_CALL_NS      = 1_000      # 1us
+MAX_CHECK_EVERY   = 16
+
+class Deadline:
+    def __init__(self, seconds):
+        self.end_ns = perf_counter_ns() + int(seconds * 1e9)
+
+    def expired(self) -> bool:
+        return perf_counter_ns() >= self.end_ns
+
+"""
+Deadline shared across nested calls: algorithms like ILS and GRASP run a
+whole sub-search per iteration, with its own criterion, so a sub-search
+started near the end of the outer time budget would overrun it.
+Inside 'with shared_deadline(seconds):', every DeadlineCriterion() created
+without an explicit deadline stops at that one (the innermost one, if nested).
 """
-class TimeCriterion(StopCriterion):
-    def __init__(self, time_limit):
-        self.start_time = time()
-        self.time_limit = time_limit
+
+deadlines = []
+
+@contextmanager
+def shared_deadline(seconds):
+    with use_deadline(Deadline(seconds)) as deadline:
+        yield deadline
+
+# Makes an existing deadline the active one, e.g. the one of the parent in a
+# worker process (perf_counter_ns is the same clock in every process)
+@contextmanager
+def use_deadline(deadline):
+    deadlines.append(deadline)
+    try:
+        yield deadline
+    finally:
+        deadlines.pop()
+
+def active_deadline():
+    return deadlines[-1] if deadlines else None
+
+class DeadlineCriterion(StopCriterion):
+    def __init__(self, deadline=None):
+        self.deadline = deadline if deadline is not None else active_deadline()
+        if self.deadline is None:
+            raise ValueError('DeadlineCriterion needs a deadline: give one or create it inside shared_deadline/use_deadline')
+        self.every = 1
+        self.countdown = 1
+        self.last_check = perf_counter_ns()
 
     def update(self, solution_weight: int):
         pass
 
     def stop(self) -> bool:
-        return time() - self.start_time >= self.time_limit
+        self.countdown -= 1
+        if self.countdown > 0:
+            return False
+
+        now = perf_counter_ns()
+        if now >= self.deadline.end_ns:
+            self.countdown = 1  # keep checking, so it keeps returning True
+            return True
+
+        elapsed = now - self.last_check
+        self.last_check = now
+        if elapsed >= SLOW_CALL_NS * self.every:
+            self.every = 1
+        elif self.every < MAX_CHECK_EVERY:
+            self.every *= 2
+        self.countdown = self.every
+        return False
+
+    def remaining(self):
+        return None
+
+    def update_many(self, solution_weight: int, iterations: int, stalled: int):
+        pass
+
+"""
+Time in seconds
+"""
+class TimeCriterion(DeadlineCriterion):
+    def __init__(self, time_limit):
+        super().__init__(Deadline(time_limit))
+        self.time_limit = time_limit
 
 """
 Will stop after seeing the current best solution k times
@@ -62,3 +173,89 @@ class TimesSeenBestCriterion(StopCriterion):
 
     def stop(self) -> bool:
         return self.times_seen >= self.k
+
+    # An improvement only puts the stop further away
+    def remaining(self):
+        return max(self.k - self.times_seen, 1)
+
+    # The first of the 'stalled' iterations is the improvement, which update()
+    # counts as seen 0 times, the others one more time each
+    def update_many(self, solution_weight: int, iterations: int, stalled: int):
+        if solution_weight < self.current_best_weight:
+            self.current_best_weight = solution_weight
+            self.times_seen = stalled - 1
+        elif solution_weight == self.current_best_weight:
+            self.times_seen += stalled
+
+"""
+Will stop as soon as the incumbent weighs at most 'target' (e.g. the best
+known solution, or within some gap of it or of a lower bound, see --target
+in stats.py), so runs that already got there don't use up the rest of their
+budget. It can stop at any iteration, so like a deadline it can't tell how
+many are left, and loops that run many at once stop at the end of the batch
+in which it got there.
+"""
+class TargetCriterion(StopCriterion):
+    def __init__(self, target):
+        self.target = target
+        self.reached = False
+
+    def update(self, solution_weight: int):
+        if solution_weight <= self.target:
+            self.reached = True
+
+    def stop(self) -> bool:
+        return self.reached
+
+    def remaining(self):
+        return None
+
+    def update_many(self, solution_weight: int, iterations: int, stalled: int):
+        self.update(solution_weight)
+
+"""
+Combinations of criteria, e.g. AnyCriterion(IterationCriterion(3000), TimeCriterion(60), TimesSeenBestCriterion(50))
+stops at 3000 iterations or 60 seconds or stagnation, whichever comes first
+"""
+
+def min_remaining(criteria):
+    known = [r for r in (criterion.remaining() for criterion in criteria) if r is not None]
+    return min(known) if known else None
+
+class AnyCriterion(StopCriterion):
+    def __init__(self, *criteria):
+        self.criteria = criteria
+
+    def update(self, solution_weight: int):
+        for criterion in self.criteria:
+            criterion.update(solution_weight)
+
+    def stop(self) -> bool:
+        return any(criterion.stop() for criterion in self.criteria)
+
+    def remaining(self):
+        return min_remaining(self.criteria)
+
+    def update_many(self, solution_weight: int, iterations: int, stalled: int):
+        for criterion in self.criteria:
+            criterion.update_many(solution_weight, iterations, stalled)
+
+class AllCriterion(StopCriterion):
+    def __init__(self, *criteria):
+        self.criteria = criteria
+
+    def update(self, solution_weight: int):
+        for criterion in self.criteria:
+            criterion.update(solution_weight)
+
+    def stop(self) -> bool:
+        return all(criterion.stop() for criterion in self.criteria)
+
+    # Stopping early is always safe (the loop checks stop() and goes on), so
+    # the soonest any of them could stop is a bound for all of them too
+    def remaining(self):
+        return min_remaining(self.criteria)
+
+    def update_many(self, solution_weight: int, iterations: int, stalled: int):
+        for criterion in self.criteria:
+            criterion.update_many(solution_weight, iterations, stalled)
@@ -0,0 +1,164 @@
+import numpy as np
+from math import sqrt, ceil, cos, acos
+
+"""
+TSPLIB distances computed from the coordinates
+
+For instances too big for a distance matrix (see LazyInstance in instance.py)
+the weights are computed when they're asked for, with the same rounding as
+tsplib95 (so the weights are exactly the ones from_problem would put in the
+matrix):
+
+    EUC_2D:  nint(euclidean)
+    CEIL_2D: ceil(euclidean)
+    ATT:     nint(euclidean / sqrt(10)), plus 1 if that rounded down
+    GEO:     great-circle distance, truncated after adding 1
+
+Like the matrix, they come in two flavours: rows, whose row[w] computes one
+weight with plain python floats, for the interpreted loops, and LazyMatrix,
+whose m[i] and m[a, b] compute whole rows and arrays of weights with NumPy,
+for the vectorized code.
+"""
+
+LAZY_TYPES = ('EUC_2D', 'CEIL_2D', 'ATT', 'GEO')
+
+RADIUS = 6378.388
+
+"""
+GEO coordinates are DDD.MM (degrees and minutes), converted to radians here
+"""
+def geo_radians(coords):
+    degrees = np.trunc(coords)
+    return np.radians(degrees + (coords - degrees) * 5 / 3)
+
+"""
+Vectorized weights between the points p and q (arrays of the same shape,
+or one of them a single point), as int64
+"""
+def weights(edge_weight_type, p, q):
+    if edge_weight_type == 'GEO':
+        q1 = np.cos(p[..., 1] - q[..., 1])
+        q2 = np.cos(p[..., 0] - q[..., 0])
+        q3 = np.cos(p[..., 0] + q[..., 0])
+        x = np.clip(0.5 * ((1 + q1) * q2 - (1 - q1) * q3), -1, 1)
+        return np.floor(RADIUS * np.arccos(x) + 1).astype(np.int64)
+
+    dx = q[..., 0] - p[..., 0]
+    dy = q[..., 1] - p[..., 1]
+    squared = dx * dx + dy * dy
+    if edge_weight_type == 'EUC_2D':
+        return np.floor(np.sqrt(squared) + 0.5).astype(np.int64)
+    if edge_weight_type == 'CEIL_2D':
+        return np.ceil(np.sqrt(squared)).astype(np.int64)
+    if edge_weight_type == 'ATT':
+        r = np.sqrt(squared / 10)
+        t = np.floor(r + 0.5)
+        return (t + (t < r)).astype(np.int64)
+    raise ValueError(f'No lazy distances for {edge_weight_type}')
+
+"""
+The weight of an edge of euclidean length 'distance', for the types where
+that's all it depends on (everything but GEO). It never decreases as the
+distance grows, so the spatial index can use it as a lower bound.
+"""
+def weight_of_distance(edge_weight_type, distance):
+    if edge_weight_type == 'EUC_2D':
+        return int(distance + 0.5)
+    if edge_weight_type == 'CEIL_2D':
+        return ceil(distance)
+    if edge_weight_type == 'ATT':
+        r = distance / sqrt(10)
+        t = int(r + 0.5)
+        return t + 1 if t < r else t
+    return None
+
+"""
+Rows
+
+One small object per node, sharing the coordinate lists, so they take O(n)
+memory in total. They're separate classes (instead of one class with an if
+on the type) because row[w] is in the innermost loops.
+"""
+
+class EucRow:
+    __slots__ = ('v', 'x', 'y', 'xs', 'ys')
+
+    def __init__(self, v, xs, ys):
+        (self.v, self.x, self.y, self.xs, self.ys) = (v, xs[v], ys[v], xs, ys)
+
+    def __getitem__(self, w):
+        dx = self.xs[w] - self.x
+        dy = self.ys[w] - self.y
+        return int(sqrt(dx * dx + dy * dy) + 0.5)
+
+class CeilRow(EucRow):
+    __slots__ = ()
+
+    def __getitem__(self, w):
+        dx = self.xs[w] - self.x
+        dy = self.ys[w] - self.y
+        return ceil(sqrt(dx * dx + dy * dy))
+
+class AttRow(EucRow):
+    __slots__ = ()
+
+    def __getitem__(self, w):
+        dx = self.xs[w] - self.x
+        dy = self.ys[w] - self.y
+        r = sqrt((dx * dx + dy * dy) / 10)
+        t = int(r + 0.5)
+        return t + 1 if t < r else t
+
+# x and y are the latitude and longitude, in radians
+class GeoRow(EucRow):
+    __slots__ = ()
+
+    def __getitem__(self, w):
+        if w == self.v:
+            return 0
+        lat = self.xs[w]
+        q1 = cos(self.y - self.ys[w])
+        q2 = cos(self.x - lat)
+        q3 = cos(self.x + lat)
+        x = 0.5 * ((1 + q1) * q2 - (1 - q1) * q3)
+        return int(RADIUS * acos(min(1.0, max(-1.0, x))) + 1)
+
+ROW_TYPES = {
+    'EUC_2D': EucRow,
+    'CEIL_2D': CeilRow,
+    'ATT': AttRow,
+    'GEO': GeoRow,
+}
+
+# 'points' are the coordinates as the weights use them (radians for GEO)
+def lazy_rows(edge_weight_type, points):
+    row_type = ROW_TYPES[edge_weight_type]
+    xs = points[:, 0].tolist()
+    ys = points[:, 1].tolist()
+    return [row_type(v, xs, ys) for v in range(len(xs))]
+
+"""
+Stands in for the distance matrix in the vectorized code: m[i] is the row of
+node i and m[a, b] the weights between the nodes in the arrays a and b,
+computed on the spot. Like the matrix, the weight from a node to itself is 0.
+"""
+
+class LazyMatrix:
+    def __init__(self, edge_weight_type, points):
+        self.edge_weight_type = edge_weight_type
+        self.points = points
+        n = len(points)
+        self.shape = (n, n)
+        self.dtype = np.dtype(np.int64)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            (a, b) = key
+            w = weights(self.edge_weight_type, self.points[a], self.points[b])
+            return np.where(np.asarray(a) == np.asarray(b), 0, w)
+        row = weights(self.edge_weight_type, self.points[key], self.points)
+        row[key] = 0
+        return row
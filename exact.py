@@ -0,0 +1,199 @@
+import sys
+import numpy as np
+from common import evaluate, parse_instance, brute_force
+from bounds import lagrangian_bound, spanning_tree_weight
+
+"""
+Exact solvers
+
+brute_force (in common.py) tries all the n! orders, so it's no use past 10
+nodes or so. These give the optimal tour of somewhat bigger instances, to
+check the heuristics against on small cases. Same (weight, tour) as the
+heuristics, the tour starting at node 0.
+"""
+
+"""
+Held-Karp dynamic programming
+
+best[S, j] is the weight of the shortest path that starts at node 0, visits
+exactly the nodes in S (a bitmask over the nodes 1..n-1, node v is bit v-1)
+and ends at j (in S). Then
+
+    best[S, j] = min over i in S - {j} of best[S - {j}, i] + d[i][j]
+
+and the optimal tour closes the best of the paths through all the nodes.
+The subsets are done by size, and for each size and j all of them at once
+with NumPy, so there are only O(n^2) NumPy calls, on arrays of up to
+2^(n-1) x (n-1) entries (80MB at 20 nodes, the table is O(2^n * n) memory,
+that's what limits it).
+"""
+
+HELD_KARP_MAX_NODES = 20
+
+def held_karp(graph):
+    n = graph.n
+    if n <= 3:
+        return brute_force(graph)
+    if n > HELD_KARP_MAX_NODES:
+        raise ValueError(f'Held-Karp needs O(2^n * n) memory, n = {n} is too big (max {HELD_KARP_MAX_NODES})')
+
+    m = np.asarray(graph.matrix)
+    k = n - 1  # the nodes 1..n-1 are the bits 0..k-1
+    d = m[1:, 1:]
+    dtype = np.int64 if np.issubdtype(m.dtype, np.integer) else np.float64
+    inf = np.iinfo(np.int64).max // 4 if dtype == np.int64 else np.inf
+
+    masks = np.arange(1 << k)
+    size = np.zeros(1 << k, dtype=np.int64)
+    for b in range(k):
+        size += (masks >> b) & 1
+
+    best = np.full((1 << k, k), inf, dtype=dtype)
+    parent = np.full((1 << k, k), -1, dtype=np.int8)
+    for b in range(k):
+        best[1 << b, b] = m[0, b + 1]
+
+    for s in range(2, k + 1):
+        layer = masks[size == s]
+        for j in range(k):
+            S = layer[(layer >> j) & 1 == 1]
+            prev = best[S ^ (1 << j)] + d[:, j]  # through each i (inf if i isn't in the subset)
+            i = np.argmin(prev, axis=1)
+            best[S, j] = prev[np.arange(len(S)), i]
+            parent[S, j] = i
+
+    full = (1 << k) - 1
+    closed = best[full] + m[1:, 0]
+    j = int(np.argmin(closed))
+    weight = closed[j].item()
+
+    # Walk the parents back from the end
+    tour = []
+    S = full
+    while j != -1:
+        tour.append(j + 1)
+        (S, j) = (S ^ (1 << j), int(parent[S, j]))
+    tour.append(0)
+    tour.reverse()
+    return (weight, tour)
+
+"""
+Branch and bound
+
+Depth-first over the paths from node 0, nearest next node first, cutting
+every path whose lower bound can't beat the best tour found so far. It
+starts from 'upper', a (weight, tour) from any heuristic (the better it is,
+the more gets cut), or else from the nearest neighbour tour.
+
+The rest of a path (from its last node v through the nodes not visited yet
+and back to 0) still has two edges at each of the nodes it passes through,
+and one at v and at 0, each at least as heavy as their cheapest ones. The
+sum of those (halved, each edge being counted at both ends) is kept up to
+date in O(1) per step. On its own that bound is weak, so on symmetric
+instances it's computed with the penalized weights d' of the Held-Karp bound
+(see bounds.py), taking the penalties back out: the penalties move weight
+to where the 1-tree needed more edges, so the cheapest edges of every node
+say much more about what's left. If that bound already reaches 'upper', it's
+optimal and there's nothing to search. On asymmetric instances, one edge
+out of each node still to leave, without penalties.
+
+With integer weights a path is also cut when its bound is more than the
+best tour minus 1, since no tour between the two can exist.
+
+make_criterion (optional) can limit the search, each node of the search
+tree being an iteration; if it stops it, the result is the best tour found,
+not necessarily the optimal one.
+"""
+
+def branch_and_bound(graph, upper=None, make_criterion=None):
+    n = graph.n
+    if n <= 3:
+        return brute_force(graph)
+
+    if upper is None:
+        from construction import nearest_neighbour
+        upper = nearest_neighbour(graph)
+    (best_weight, best_tour) = (upper[0], list(upper[1]))
+
+    d = graph.rows
+    m = np.asarray(graph.matrix, dtype=np.float64).copy()
+    np.fill_diagonal(m, np.inf)
+    integral = np.issubdtype(np.asarray(graph.matrix).dtype, np.integer)
+    slack = 1 - 1e-6 if integral else 0
+
+    # cost[v]: what v adds to the bound while it's unvisited, out_cost[v]
+    # when it's the last node of the path and in_cost[0] for the way back
+    if np.array_equal(m, m.T):
+        (bound, pi) = lagrangian_bound(graph, best_weight)
+        if bound > best_weight - slack:
+            return (best_weight, best_tour)
+        penalized = m + pi[:, None] + pi[None, :]
+        two = np.sort(penalized, axis=1)[:, :2]
+        cost = ((two[:, 0] + two[:, 1]) / 2 - 2 * pi).tolist()
+        out_cost = in_cost = (two[:, 0] / 2 - pi).tolist()
+    else:
+        (pi, penalized) = (np.zeros(n), np.minimum(m, m.T))
+        cost = out_cost = np.sort(m, axis=1)[:, 0].tolist()
+        in_cost = [0] * n
+
+    order = np.argsort(penalized, axis=1, kind='stable').tolist()  # the others, nearest (with the penalties) first
+
+    criterion = make_criterion() if make_criterion is not None else None
+    visited = [False] * n
+    visited[0] = True
+    path = [0]
+
+    # rest: the bound of what's left from the unvisited nodes
+    def search(v, weight, rest):
+        nonlocal best_weight, best_tour
+        if criterion is not None:
+            if criterion.stop():
+                return
+            criterion.update(best_weight)
+
+        if len(path) == n:
+            total = weight + d[v][0]
+            if total < best_weight:
+                (best_weight, best_tour) = (total, list(path))
+            return
+
+        # The tighter bound: the rest of the path is a spanning tree of the
+        # nodes it goes through
+        rest_nodes = [w for w in range(n) if not visited[w]] + [v, 0]
+        tree = spanning_tree_weight(penalized[np.ix_(rest_nodes, rest_nodes)])
+        if weight + tree - 2 * pi[rest_nodes].sum() + pi[v] + pi[0] > best_weight - slack:
+            return
+
+        for w in order[v]:
+            if visited[w]:
+                continue
+            next_weight = weight + d[v][w]
+            next_rest = rest - cost[w]
+            # w's edge out and 0's edge in are still to come
+            if next_weight + next_rest + out_cost[w] + in_cost[0] > best_weight - slack:
+                continue
+            visited[w] = True
+            path.append(w)
+            search(w, next_weight, next_rest)
+            path.pop()
+            visited[w] = False
+
+    search(0, 0, sum(cost) - cost[0])
+    return (best_weight, best_tour)
+
+if __name__ == '__main__':
+
+    graph = parse_instance(sys.argv[1])
+    print(graph)
+
+    if graph.n <= HELD_KARP_MAX_NODES:
+        (weight, tour) = held_karp(graph)
+    elif graph.symmetric:
+        from local_search import two_opt_local_search
+        from criterion import IterationCriterion
+        upper = two_opt_local_search(graph, lambda: IterationCriterion(100 * graph.n))
+        (weight, tour) = branch_and_bound(graph, upper)
+    else:  # 2-opt needs a symmetric instance, start from the nearest neighbour tour
+        (weight, tour) = branch_and_bound(graph)
+    assert evaluate(graph, tour) == weight
+    print((weight, graph.labelled(tour)))
@@ -0,0 +1,190 @@
+import random
+import numpy as np
+from common import random_cycle
+from memo import node_keys
+
+"""
+Genetic algorithm
+
+The population is a 2-D int32 array, one tour per row, and everything that
+goes over the whole population is done on the array at once: the weights of
+all the tours are one fancy indexing of the matrix and a sum, the parents
+are drawn by vectorized binary tournaments and the crossovers build all the
+children together. The only per-individual Python work is the local search
+mutation.
+
+Each generation (one iteration for the criterion):
+    - 'size' pairs of parents, each parent the better of two random tours
+    - a child from each pair, by order crossover (OX) or edge recombination
+      (ERX)
+    - each child goes through the local search with probability
+      'mutation_rate' (a memetic algorithm, in the literature), which is what
+      makes the children good enough to compete with their parents
+    - the next population is the best 'size' of parents and children, each
+      tour only once (by the hash of its edges, see memo.py) while there are
+      enough different ones, so it doesn't fill up with copies of the best
+
+The initial population is a fraction 'greedy_fraction' of construct_solution
+(greedy-alpha in stats.py) and random tours for the rest.
+
+The random choices of the array operations are made by a NumPy Generator
+seeded from rng, so a run is still replayable from rng alone.
+"""
+
+POPULATION_SIZE = 50
+MUTATION_RATE   = 0.2
+GREEDY_FRACTION = 0.5
+
+# Weights of all the tours of the population
+def population_weights(matrix, population):
+    dtype = np.int64 if np.issubdtype(matrix.dtype, np.integer) else np.float64
+    return matrix[population, np.roll(population, -1, axis=1)].sum(axis=1, dtype=dtype)
+
+# Hash of the edges of each tour (the same as memo.tour_hash), equal for the same cycle
+def population_hashes(population):
+    z = node_keys(population.shape[1])[population]
+    return (z * np.roll(z, -1, axis=1)).sum(axis=1, dtype=np.uint64)
+
+# Index of the winner of each of k binary tournaments
+def tournament(weights, k, gen):
+    pairs = gen.integers(0, len(weights), size=(k, 2))
+    (a, b) = (pairs[:, 0], pairs[:, 1])
+    return np.where(weights[a] <= weights[b], a, b)
+
+"""
+Order crossover (OX)
+
+Each child keeps the segment [i, j) of its first parent where it was, and
+the other positions get the rest of the nodes in the order they come in the
+second parent, starting right after the segment (from j, wrapping around).
+
+All the children at once: the second parent is rotated to start at j, its
+nodes that are in the segment are moved to the end by a stable argsort (the
+others keeping their order), and those others go to positions j, j+1, ... of
+the child, the segment being written over the positions left.
+"""
+def order_crossover(first, second, gen):
+    (m, n) = first.shape
+    rows = np.arange(m)[:, None]
+    cols = np.arange(n)[None, :]
+    cuts = np.sort(gen.integers(0, n + 1, size=(m, 2)), axis=1)
+    (i, j) = (cuts[:, :1], cuts[:, 1:])
+
+    position = np.empty_like(first)
+    position[rows, first] = cols  # position of each node in the first parent
+    rotated = second[rows, (cols + j) % n]
+    pos = position[rows, rotated]
+    in_segment = (pos >= i) & (pos < j)
+    rest = rotated[rows, np.argsort(in_segment, axis=1, kind='stable')]
+
+    child = np.empty_like(first)
+    child[rows, (cols + j) % n] = rest
+    segment = (cols >= i) & (cols < j)
+    return np.where(segment, first, child)
+
+"""
+Edge recombination (ERX)
+
+The child is built node by node from the edges of both parents: from the
+current node it goes to one of its unvisited neighbours in either parent,
+the one with the fewest unvisited neighbours left (ties at random), so the
+nodes that would get stranded go first; when there's none it jumps to a
+random unvisited node. Most of the child's edges come from its parents,
+which OX keeps less of.
+
+It's sequential along the tour, so the children are built together, one
+position of all of them per step: n steps of NumPy operations over all the
+children.
+"""
+def edge_recombination(first, second, gen):
+    (m, n) = first.shape
+    rows = np.arange(m)
+    # the (up to) 4 neighbours of each node, in both parents
+    neighbours = np.empty((m, n, 4), dtype=first.dtype)
+    for (k, parent) in enumerate((first, second)):
+        neighbours[rows[:, None], parent, 2 * k] = np.roll(parent, 1, axis=1)
+        neighbours[rows[:, None], parent, 2 * k + 1] = np.roll(parent, -1, axis=1)
+
+    visited = np.zeros((m, n), dtype=bool)
+    child = np.empty_like(first)
+    current = first[:, 0].copy()
+    for step in range(n):
+        child[:, step] = current
+        visited[rows, current] = True
+        if step == n - 1:
+            break
+
+        options = neighbours[rows, current]  # (m, 4)
+        left = (~visited[rows[:, None, None], neighbours[rows[:, None], options]]).sum(axis=2)
+        score = left + gen.random((m, 4))
+        score[visited[rows[:, None], options]] = np.inf
+        choice = np.argmin(score, axis=1)
+        following = options[rows, choice]
+
+        stuck = np.isinf(score[rows, choice])
+        if stuck.any():
+            # a random unvisited node: the one with the biggest random key
+            keys = gen.random((int(stuck.sum()), n))
+            keys[visited[stuck]] = -1
+            following[stuck] = np.argmax(keys, axis=1)
+        current = following
+    return child
+
+CROSSOVERS = {
+    'ox': order_crossover,
+    'erx': edge_recombination,
+}
+
+"""
+local_search(graph, initial) -> (weight, sol) is the mutation, like the
+local searches ILS and GRASP take (None for no mutation at all)
+"""
+def genetic_algorithm(graph, make_criterion, construct_solution, local_search=None, size=POPULATION_SIZE, crossover=order_crossover,\
+        mutation_rate=MUTATION_RATE, greedy_fraction=GREEDY_FRACTION, rng=random, trace=None):
+    # Created first so a time limit also covers the initial population
+    criterion = make_criterion()
+    gen = np.random.default_rng(rng.getrandbits(64))
+    matrix = graph.matrix
+
+    greedy = int(size * greedy_fraction)
+    tours = [construct_solution(graph)[1] for _ in range(greedy)]
+    tours += [random_cycle(graph.nodes, rng) for _ in range(size - greedy)]
+    population = np.array(tours, dtype=np.int32)
+    weights = population_weights(matrix, population)
+    if trace is not None:
+        trace.evaluated += size
+
+    best = int(np.argmin(weights))
+    (inc_weight, inc_sol) = (weights[best].item(), population[best].tolist())
+
+    while not criterion.stop():
+        first = population[tournament(weights, size, gen)]
+        second = population[tournament(weights, size, gen)]
+        children = crossover(first, second, gen)
+
+        if local_search is not None:
+            for c in np.flatnonzero(gen.random(size) < mutation_rate):
+                children[c] = local_search(graph, children[c].tolist())[1]
+        child_weights = population_weights(matrix, children)
+        if trace is not None:
+            trace.evaluated += size
+
+        # Survivors: the best, first each different tour once, then the copies
+        population = np.concatenate((population, children))
+        weights = np.concatenate((weights, child_weights))
+        hashes = population_hashes(population)
+        order = np.argsort(weights, kind='stable')
+        (_, first_seen) = np.unique(hashes[order], return_index=True)
+        copy = np.ones(len(order), dtype=bool)
+        copy[first_seen] = False
+        survivors = order[np.argsort(copy, kind='stable')[:size]]
+        (population, weights) = (population[survivors], weights[survivors])
+
+        if weights[0] < inc_weight:
+            (inc_weight, inc_sol) = (weights[0].item(), population[0].tolist())
+
+        criterion.update(inc_weight)
+        if trace is not None:
+            trace.step(inc_weight)
+
+    return (inc_weight, inc_sol)
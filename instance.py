@@ -0,0 +1,332 @@
+import os
+import json
+import hashlib
+import numpy as np
+import networkx as nx
+import tsplib95 as tsplib
+from distances import LAZY_TYPES, LazyMatrix, lazy_rows, geo_radians, weights, weight_of_distance
+from spatial import Grid
+
+"""
+Compact representation of a TSP instance
+
+The algorithms used to work directly on the networkx graph returned by
+tsplib95's get_graph(), so every edge weight lookup was a dict-of-dicts access
+plus another dict for the edge attributes. Here the nodes are renumbered
+0..n-1 and the weights live in a single contiguous n x n NumPy matrix.
+
+The algorithms only ever see the 0-based indices. The original node labels are
+kept in 'labels' so a tour can be translated back when it's reported.
+
+For scalar lookups in the interpreted loops we keep 'rows', one memoryview per
+row of the matrix: rows[v][w] is about as fast as indexing nested lists and
+gives back plain python ints, but without copying the matrix.
+"""
+
+class Instance:
+    def __init__(self, matrix, labels=None, name=None, coords=None, edge_weight_type=None, bks=None):
+        self.matrix = np.ascontiguousarray(matrix)
+        self.n = self.matrix.shape[0]
+        self.labels = list(labels) if labels is not None else list(range(self.n))
+        self.name = name
+        self.bks = bks
+        self.coords = coords
+        self.edge_weight_type = edge_weight_type
+        self.rows = [memoryview(row) for row in self.matrix]
+        self._candidates = {}
+        self._grid = None
+        self._symmetric = None
+
+    # Same interface the algorithms used from the networkx graph
+
+    @property
+    def nodes(self):
+        return range(self.n)
+
+    def number_of_nodes(self):
+        return self.n
+
+    def weight(self, v, w):
+        return self.rows[v][w]
+
+    """
+    Candidate lists: the k nearest nodes of each node, nearest first
+    Computed once per k and kept, since every local search run asks for them
+    """
+    def candidates(self, k):
+        k = min(k, self.n - 1)
+        if k not in self._candidates:
+            m = self.matrix.astype(np.float64)
+            np.fill_diagonal(m, np.inf)
+            nearest = np.argsort(m, axis=1, kind='stable')[:, :k]
+            self._candidates[k] = nearest.tolist()
+        return self._candidates[k]
+
+    """
+    Spatial index of the coordinates (see spatial.py), None without them
+    """
+    def grid(self):
+        if self._grid is None and self.coords is not None:
+            self._grid = Grid(self.coords)
+        return self._grid
+
+    """
+    Whether the weight of (v, w) is always the weight of (w, v)
+    Checked once (it's O(n^2)) and kept
+    """
+    @property
+    def symmetric(self):
+        if self._symmetric is None:
+            self._symmetric = bool(np.array_equal(self.matrix, self.matrix.T))
+        return self._symmetric
+
+    def labelled(self, tour):
+        return [self.labels[v] for v in tour]
+
+    def __repr__(self):
+        return f'Instance({self.name!r}, n={self.n})'
+
+"""
+Instances without a distance matrix
+
+Past a few thousand nodes the n x n matrix doesn't fit in memory anymore
+(85900 nodes would be about 30 GB even as int32). For the instances whose
+weights come from the coordinates, LazyInstance keeps just the coordinates
+and computes the weights when they're asked for (see distances.py): 'rows'
+and 'matrix' work as in Instance, and everything else is O(n) memory.
+
+The candidate lists come from a spatial index (spatial.py) instead of
+sorting the rows: the k nearest of a node are looked for in the square of
+cells around it, grown until the weight of anything outside the square can't
+be smaller than the k-th found. They're the same lists Instance would give,
+ties included. GEO weights aren't euclidean in the coordinates, so for those
+each row is computed and partitioned, which is O(n^2) time but still only
+O(n) memory.
+"""
+
+class LazyInstance(Instance):
+    def __init__(self, coords, edge_weight_type, labels=None, name=None, bks=None):
+        if edge_weight_type not in LAZY_TYPES:
+            raise ValueError(f'No lazy distances for {edge_weight_type}')
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.n = len(self.coords)
+        self.labels = list(labels) if labels is not None else list(range(self.n))
+        self.name = name
+        self.bks = bks
+        self.edge_weight_type = edge_weight_type
+        self.points = geo_radians(self.coords) if edge_weight_type == 'GEO' else self.coords
+        self.matrix = LazyMatrix(edge_weight_type, self.points)
+        self.rows = lazy_rows(edge_weight_type, self.points)
+        self._candidates = {}
+        self._grid = None
+        self._symmetric = True  # weights from the coordinates
+
+    def candidates(self, k):
+        k = min(k, self.n - 1)
+        if k not in self._candidates:
+            if self.edge_weight_type == 'GEO':
+                self._candidates[k] = [self.nearest_in_row(v, k) for v in self.nodes]
+            else:
+                self._candidates[k] = [self.nearest_in_grid(v, k) for v in self.nodes]
+        return self._candidates[k]
+
+    # The k smallest of the weights w of the nodes 'others', ordered by weight
+    # and then by node (like a stable argsort of the row)
+    @staticmethod
+    def k_smallest(others, w, k):
+        kth = np.partition(w, k - 1)[k - 1]
+        keep = w <= kth
+        (others, w) = (others[keep], w[keep])
+        return others[np.lexsort((others, w))[:k]].tolist()
+
+    def nearest_in_row(self, v, k):
+        row = self.matrix[v]
+        others = np.flatnonzero(np.arange(self.n) != v)
+        return self.k_smallest(others, row[others], k)
+
+    def nearest_in_grid(self, v, k):
+        grid = self.grid()
+        (cx, cy) = (int(grid.cx[v]), int(grid.cy[v]))
+        r = 1
+        while True:
+            others = grid.square(cx, cy, r)
+            others = others[others != v]
+            if len(others) >= k:
+                w = weights(self.edge_weight_type, self.points[v], self.points[others])
+                kth = np.partition(w, k - 1)[k - 1]
+                if grid.covers_all(cx, cy, r) or weight_of_distance(self.edge_weight_type, r * grid.size) > kth:
+                    return self.k_smallest(others, w, k)
+            r += 1
+
+    def __repr__(self):
+        return f'LazyInstance({self.name!r}, n={self.n}, {self.edge_weight_type})'
+
+"""
+int32 is enough for any TSPLIB instance, but the vectorized deltas add up to
+four weights without upcasting, so only use it if that can't overflow
+"""
+def weight_dtype(weights):
+    if all(float(x).is_integer() for x in weights):
+        lo, hi = min(weights), max(weights)
+        if -2**28 <= lo and hi < 2**28:
+            return np.int32
+        return np.int64
+    return np.float64
+
+"""
+Builds the instance from a problem returned by tsplib95.load()
+Only the upper triangle is queried when the problem is symmetric
+
+With lazy=None it's a LazyInstance from LAZY_MIN_NODES nodes up, if the
+weights can be computed from the coordinates (below that the matrix is small
+enough, and its lookups are faster)
+"""
+
+LAZY_MIN_NODES = 5000
+
+def from_problem(problem, name=None, lazy=None):
+    labels = list(problem.get_nodes())
+    n = len(labels)
+
+    lazy_possible = problem.edge_weight_type in LAZY_TYPES and bool(problem.node_coords)
+    if lazy is None:
+        lazy = lazy_possible and n >= LAZY_MIN_NODES
+    if lazy:
+        coords = np.array([problem.node_coords[v] for v in labels], dtype=np.float64)
+        return LazyInstance(coords, problem.edge_weight_type, labels, name or problem.name)
+
+    symmetric = problem.is_symmetric()
+
+    weights = []
+    for i in range(n):
+        start = i + 1 if symmetric else 0
+        for j in range(start, n):
+            weights.append(0 if i == j else problem.get_weight(labels[i], labels[j]))
+
+    matrix = np.zeros((n, n), dtype=weight_dtype(weights) if weights else np.int32)
+    if symmetric:
+        matrix[np.triu_indices(n, 1)] = weights
+        matrix += matrix.T
+    else:
+        matrix[:] = np.array(weights).reshape(n, n)
+
+    coords = None
+    if problem.node_coords:
+        coords = np.array([problem.node_coords[v] for v in labels], dtype=np.float64)
+
+    return Instance(matrix, labels, name or problem.name, coords, problem.edge_weight_type)
+
+def from_graph(graph: nx.Graph, name=None):
+    labels = list(graph.nodes)
+    matrix = nx.to_numpy_array(graph, nodelist=labels, weight='weight')
+    np.fill_diagonal(matrix, 0)
+    if np.all(np.mod(matrix, 1) == 0):
+        matrix = matrix.astype(weight_dtype(matrix.ravel().tolist()))
+    return Instance(matrix, labels, name)
+
+def load_instance(filename, name=None, lazy=None):
+    return from_problem(tsplib.load(filename), name, lazy)
+
+"""
+On-disk cache of preprocessed instances
+
+Parsing a .tsp file and building its matrix is slow compared to loading the
+matrix back, so the first load of a file saves its matrix and coordinates as
+.npy files and the rest of the instance as JSON, in a directory named after
+the hash of the file contents (so an edited file is never served stale).
+Later loads memory-map the .npy files: nothing is parsed or copied, the
+pages are read from the OS cache as the algorithms touch them.
+A LazyInstance has no matrix, so only its coordinates are saved.
+"""
+
+CACHE_DIR = '.instance_cache'
+
+def file_hash(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def save_cached(instance, path):
+    # Written to a temporary directory first and then renamed, so that
+    # processes loading the same file at the same time never see half of it
+    tmp = f'{path}.tmp{os.getpid()}'
+    os.makedirs(tmp, exist_ok=True)
+    lazy = isinstance(instance, LazyInstance)
+    if not lazy:
+        np.save(os.path.join(tmp, 'matrix.npy'), instance.matrix)
+    if instance.coords is not None:
+        np.save(os.path.join(tmp, 'coords.npy'), instance.coords)
+    meta = {
+        'name': instance.name,
+        'labels': instance.labels,
+        'edge_weight_type': instance.edge_weight_type,
+        'bks': instance.bks,
+        'lazy': lazy,
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    try:
+        os.rename(tmp, path)
+    except OSError:  # someone else got there first
+        for entry in os.listdir(tmp):
+            os.remove(os.path.join(tmp, entry))
+        os.rmdir(tmp)
+
+def load_cached(filename, name=None, bks=None, cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, file_hash(filename))
+
+    if not os.path.isdir(path):
+        instance = load_instance(filename, name)
+        instance.bks = bks
+        os.makedirs(cache_dir, exist_ok=True)
+        save_cached(instance, path)
+        return instance
+
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    coords_path = os.path.join(path, 'coords.npy')
+    coords = np.load(coords_path, mmap_mode='r') if os.path.exists(coords_path) else None
+
+    if meta.get('lazy'):
+        return LazyInstance(\
+            coords,\
+            meta['edge_weight_type'],\
+            meta['labels'],\
+            name or meta['name'],\
+            bks if bks is not None else meta['bks']\
+        )
+
+    matrix = np.load(os.path.join(path, 'matrix.npy'), mmap_mode='r')
+
+    return Instance(\
+        matrix,\
+        meta['labels'],\
+        name or meta['name'],\
+        coords,\
+        meta['edge_weight_type'],\
+        bks if bks is not None else meta['bks']\
+    )
+
+"""
+What takes long to compute from an instance and never changes (like its
+lower bound, see bounds.py) is kept next to it in the cache, in values.json,
+by key. compute() only runs the first time a key is asked for; if the
+instance isn't in the cache yet (load_cached wasn't called), it isn't saved.
+"""
+def cached_value(filename, key, compute, cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, file_hash(filename))
+    values_path = os.path.join(path, 'values.json')
+    values = {}
+    if os.path.exists(values_path):
+        with open(values_path) as f:
+            values = json.load(f)
+    if key in values:
+        return values[key]
+
+    value = compute()
+    if os.path.isdir(path):
+        values[key] = value
+        tmp = f'{values_path}.tmp{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(values, f)
+        os.replace(tmp, values_path)  # atomic, readers see the old file or the new one
+    return value
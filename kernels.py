@@ -0,0 +1,289 @@
+import random
+import numpy as np
+from array import array
+from time import perf_counter_ns
+from types import FunctionType, SimpleNamespace
+from common import random_cycle
+from criterion import CHECK_INTERVAL_NS
+from moves import require_symmetric
+from tour import Tour
+
+"""
+Compiled kernels
+
+The inner loops of evaluate, the neighbourhood scans, the perturbation and
+the whole RLS iteration, written once in the subset of Python that Numba
+compiles (plain loops over arrays, no objects), so with Numba installed they
+run as machine code over the distance matrix and an int32 view of the tour,
+and without it the very same functions run as plain Python over graph.rows
+and the tour's array('i'). Numba is optional: if it's missing (or the
+instance has no matrix, see LazyInstance) everything still works, just at
+interpreted speed.
+
+Both get identical results for the same seed because the kernels don't use
+the rng directly (Numba can't call a random.Random): each call draws a 32-bit
+seed from it and the kernel makes its own numbers with xorshift32, computed
+the same way in both (everything masked to 32 bits, no floats but the final
+division). That also means that the kernel RLS doesn't make the same choices
+as randomized_local_search with the same rng, it's a different (equally
+random) run of the same algorithm.
+
+'d' is indexed d[v][w] everywhere, which works both on a 2-D array and on
+a list of rows.
+"""
+
+try:
+    from numba import njit, config
+    NUMBA = not config.DISABLE_JIT
+except ImportError:
+    NUMBA = False
+
+"""
+@kernel compiles the function (if there's Numba) and also keeps a plain copy
+of it whose globals are the plain copies of the other kernels, so the Python
+kernels never call compiled ones (which don't take graph.rows)
+"""
+
+python_globals = {'__builtins__': __builtins__}
+compiled = {}
+
+def kernel(f):
+    plain = FunctionType(f.__code__, python_globals, f.__name__, f.__defaults__)
+    python_globals[f.__name__] = plain
+    compiled[f.__name__] = njit(cache=True)(f) if NUMBA else None
+    return compiled[f.__name__] or plain
+
+@kernel
+def xorshift(x):
+    x ^= (x << 13) & 0xFFFFFFFF
+    x ^= x >> 17
+    x ^= (x << 5) & 0xFFFFFFFF
+    return x
+
+# Uniform in [0, n), from a state in [1, 2^32)
+@kernel
+def below(x, n):
+    return (x * n) >> 32
+
+@kernel
+def tour_weight(d, order):
+    s = d[order[len(order) - 1]][order[0]]
+    for i in range(len(order) - 1):
+        s += d[order[i]][order[i + 1]]
+    return s
+
+@kernel
+def swap_delta(d, order, i):
+    n = len(order)
+    if n < 3:  # the same cycle
+        return d[order[0]][order[0]] * 0
+    a = order[i - 1]
+    b = order[i]
+    c = order[(i + 1) % n]
+    e = order[(i + 2) % n]
+    return d[a][c] + d[c][b] + d[b][e] - d[a][b] - d[b][c] - d[c][e]
+
+@kernel
+def apply_swap(order, pos, i):
+    j = (i + 1) % len(order)
+    v = order[i]
+    w = order[j]
+    order[i] = w
+    order[j] = v
+    pos[w] = i
+    pos[v] = j
+
+# (i, delta) of the best adjacent swap, the first one on ties, like
+# best_neighbour (i == -1 if none improves)
+@kernel
+def best_swap(d, order):
+    best_i = -1
+    best_delta = swap_delta(d, order, 0) * 0
+    for i in range(len(order)):
+        delta = swap_delta(d, order, i)
+        if delta < best_delta:
+            best_i = i
+            best_delta = delta
+    return (best_i, best_delta)
+
+# (i, j, delta) of the best 2-opt move, in the same order and with the
+# same ties as best_two_opt_neighbour (i == -1 if none improves)
+@kernel
+def best_two_opt(d, order):
+    n = len(order)
+    (best_i, best_j) = (-1, -1)
+    best_delta = d[order[0]][order[0]] * 0
+    for i in range(n - 2):
+        a = order[i]
+        b = order[i + 1]
+        d_ab = d[a][b]
+        for j in range(i + 2, n if i > 0 else n - 1):
+            c = order[j]
+            e = order[(j + 1) % n]
+            delta = d[a][c] + d[b][e] - d_ab - d[c][e]
+            if delta < best_delta:
+                (best_i, best_j) = (i, j)
+                best_delta = delta
+    return (best_i, best_j, best_delta)
+
+# k random adjacent swaps, returns the new rng state
+@kernel
+def perturb(order, pos, k, state):
+    n = len(order)
+    for _ in range(k):
+        state = xorshift(state)
+        apply_swap(order, pos, below(state, n))
+    return state
+
+"""
+'iterations' iterations of randomized_local_search, on the current tour
+(order, pos) of the given weight. inc_order holds the incumbent, of weight
+inc_weight, and is overwritten when it's improved. Returns the new
+weights and rng state, the index of the last iteration that improved the
+incumbent (-1 if none did) and the counts for the trace.
+"""
+@kernel
+def rls(d, order, pos, weight, inc_order, inc_weight, probability, iterations, state):
+    n = len(order)
+    improved = -1
+    evaluated = 0
+    optima = 0
+    for it in range(iterations):
+        state = xorshift(state)
+        random_move = state / 4294967296.0 <= probability
+        if not random_move:
+            (i, delta) = best_swap(d, order)
+            evaluated += n
+            if i == -1:  # local optimum
+                optima += 1
+                random_move = True
+            else:
+                apply_swap(order, pos, i)
+                weight += delta
+        if random_move:
+            state = xorshift(state)
+            i = below(state, n)
+            weight += swap_delta(d, order, i)
+            apply_swap(order, pos, i)
+            evaluated += 1
+        if weight < inc_weight:
+            inc_weight = weight
+            inc_order[:] = order
+            improved = it
+    return (weight, inc_weight, state, improved, evaluated, optima)
+
+KERNELS = ['tour_weight', 'swap_delta', 'apply_swap', 'best_swap', 'best_two_opt', 'perturb', 'rls']
+
+python_kernels = SimpleNamespace(**{name: python_globals[name] for name in KERNELS})
+jit_kernels = SimpleNamespace(**{name: compiled[name] for name in KERNELS}) if NUMBA else None
+
+"""
+The kernels and the arguments to give them for this instance: the compiled
+ones with the matrix and int32 views of the arrays (no copies, changing the
+view changes the tour), or the Python ones with the rows and the arrays
+"""
+def kernels_for(graph):
+    if jit_kernels is not None and isinstance(graph.matrix, np.ndarray):
+        view = lambda a: np.frombuffer(a, dtype=np.int32)
+        return (jit_kernels, np.asarray(graph.matrix), view)
+    return (python_kernels, graph.rows, lambda a: a)
+
+def new_state(rng):
+    return rng.getrandbits(32) or 1
+
+def kernel_evaluate(graph, solution):
+    if len(solution) == 0:
+        return 0
+    (k, d, view) = kernels_for(graph)
+    if not isinstance(solution, array):
+        solution = array('i', solution)
+    return k.tour_weight(d, view(solution))
+
+"""
+Neighbour selection strategies with the same results as best_neighbour and
+best_two_opt_neighbour (the scans are deterministic), to be used in their place
+"""
+
+def kernel_best_neighbour(graph, curr_solution, curr_weight, trace=None):
+    (k, d, view) = kernels_for(graph)
+    (i, delta) = k.best_swap(d, view(curr_solution.order))
+    if trace is not None:
+        trace.evaluated += len(curr_solution)
+    if i == -1:
+        return (curr_weight, curr_solution)
+    curr_solution.swap(i)
+    if trace is not None:
+        trace.moves += 1
+    return (curr_weight + delta, curr_solution)
+
+def kernel_best_two_opt_neighbour(graph, curr_solution, curr_weight, trace=None):
+    require_symmetric(graph, 'The 2-opt neighbourhood')
+    (k, d, view) = kernels_for(graph)
+    (i, j, delta) = k.best_two_opt(d, view(curr_solution.order))
+    n = len(curr_solution)
+    if trace is not None:
+        trace.evaluated += n * (n - 3) // 2
+    if i == -1:
+        return (curr_weight, curr_solution)
+    curr_solution.reverse(i + 1, j)
+    if trace is not None:
+        trace.moves += 1
+    return (curr_weight + delta, curr_solution)
+
+# Same as perturb (in local_search.py), with the kernel's own random numbers
+def kernel_perturb(tour, perc, rng=random):
+    (order, pos) = (tour.order, tour.position)
+    k = python_kernels
+    if jit_kernels is not None:
+        k = jit_kernels
+        (order, pos) = (np.frombuffer(order, dtype=np.int32), np.frombuffer(pos, dtype=np.int32))
+    k.perturb(order, pos, int(len(tour) * perc), new_state(rng))
+    return tour
+
+"""
+Randomized local search with the iterations in the kernel
+
+The kernel runs a batch of iterations and comes back to check the criterion.
+A batch is never longer than criterion.remaining(), so iteration and
+stagnation limits stop at exactly the same iteration as the plain loop, and
+its length adapts to the speed of the kernel (doubling while a batch takes
+less than CHECK_INTERVAL_NS, halving otherwise), and as the iterations of a
+kernel all cost about the same, a deadline is overrun by about that much. With a trace, the improvements are recorded at the end of
+each batch instead of at the iteration they happened.
+"""
+
+def kernel_randomized_local_search(graph, probability, make_criterion, initial=None, rng=random, trace=None):
+    (k, d, view) = kernels_for(graph)
+
+    tour = Tour(initial if initial is not None else random_cycle(graph.nodes, rng))
+    inc = array('i', tour.order)
+    (order, pos, inc_order) = (view(tour.order), view(tour.position), view(inc))
+    weight = k.tour_weight(d, order)
+    inc_weight = weight
+    state = new_state(rng)
+
+    criterion = make_criterion()
+
+    batch = 1
+    while not criterion.stop():
+        remaining = criterion.remaining()
+        iterations = batch if remaining is None else min(batch, remaining)
+
+        start = perf_counter_ns()
+        (weight, inc_weight, state, improved, evaluated, optima) =\
+            k.rls(d, order, pos, weight, inc_order, inc_weight, probability, iterations, state)
+        if perf_counter_ns() - start < CHECK_INTERVAL_NS:
+            batch *= 2
+        elif batch > 1:
+            batch //= 2
+
+        stalled = iterations - improved if improved >= 0 else iterations  # at inc_weight since the last improvement
+        criterion.update_many(inc_weight, iterations, stalled)
+        if trace is not None:
+            trace.evaluated += evaluated
+            trace.moves += iterations
+            trace.local_optima += optima
+            trace.iterations += iterations - 1
+            trace.step(inc_weight)
+
+    return (inc_weight, inc.tolist())
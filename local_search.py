@@ -2,89 +2,519 @@ import sys
 import random
 from common import * 
 from criterion import *
+from moves import *
+from tour import Tour
+from memo import memoized
+from acceptance import AlwaysAcceptance, FixedStrength
+from collections import deque
+import numpy as np
 
 """
 Simple local search (w/ select_neighbour as arg)
+2-opt / Or-opt local search (w/ neighbour lists and don't-look bits)
+Lin-Kernighan style search + Or-opt (w/ neighbour lists and don't-look bits)
 Multiple start local search (w/ local_search as arg)
 Randomized local search
 Iterated local search (w/ local_search as arg)
 """
 
+"""
+The neighbourhood is given by the adjacent swaps, the i-th neighbour being
+the solution with the nodes at positions i and i+1 swapped (see moves.py)
+Neighbours are evaluated with swap_delta, and only the chosen one is applied
+(in place) to the current solution
+
+The local searches keep their current solution in a Tour (see tour.py), and
+that's what the neighbour selection strategies receive and change
+"""
+
 def neighborhood(solution):
-    n = len(solution)
-    for i in range(n):
-        j = (i + 1) % n
-        nb = list(solution)
-        nb[i], nb[j] = nb[j], nb[i]
-        yield nb
+    return range(len(solution))
 
 """
 Neighbour selection strategies
+(they all take an optional trace, see tracing.py)
 """
 
-def first_better_neighbour(graph, curr_solution, curr_weight):
-    for neighbour in neighborhood(curr_solution):
-        weight = evaluate(graph, neighbour)
-        if weight < curr_weight:
-            return (weight, neighbour)
+def first_better_neighbour(graph, curr_solution, curr_weight, trace=None):
+    d = graph.rows
+    order = curr_solution.order
+    for i in neighborhood(order):
+        delta = swap_delta(d, order, i)
+        if delta < 0:
+            curr_solution.swap(i)
+            if trace is not None:
+                trace.evaluated += i + 1
+                trace.moves += 1
+            return (curr_weight + delta, curr_solution)
+    if trace is not None:
+        trace.evaluated += len(order)
     return (curr_weight, curr_solution)
 
-def best_neighbour(graph, curr_solution, curr_weight):
-    best_solution = curr_solution
-    best_weight = curr_weight
-    for neighbour in neighborhood(curr_solution):
-        weight = evaluate(graph, neighbour)
-        if weight < best_weight:
-            best_solution = neighbour
-            best_weight   = weight
-    return (best_weight, best_solution)
-
-def random_neighbour(graph, solution):
+def best_neighbour(graph, curr_solution, curr_weight, trace=None):
+    if len(curr_solution) >= BATCH_MIN_NODES:
+        return best_neighbour_batched(graph, curr_solution, curr_weight, trace)
+    d = graph.rows
+    order = curr_solution.order
+    best_i = -1
+    best_delta = 0
+    for i in neighborhood(order):
+        delta = swap_delta(d, order, i)
+        if delta < best_delta:
+            best_i = i
+            best_delta = delta
+    if trace is not None:
+        trace.evaluated += len(order)
+    if best_i != -1:
+        curr_solution.swap(best_i)
+        if trace is not None:
+            trace.moves += 1
+    return (curr_weight + best_delta, curr_solution)
+
+"""
+Batched neighbour evaluation
+
+Computes the deltas of the whole neighbourhood at once with NumPy: the tour
+(viewed without copying as an int32 array) is shifted to get each position's
+predecessor and successors, and the six edge weights of every move are
+gathered from the distance matrix with fancy indexing. argmin then gives the
+best move, the first one on ties, like the loop in best_neighbour, so the
+result is exactly the same.
+
+The calls have a fixed overhead of some microseconds, so best_neighbour only
+switches to the batched version from BATCH_MIN_NODES nodes up.
+"""
+
+BATCH_MIN_NODES = 64
+
+def best_neighbour_batched(graph, curr_solution, curr_weight, trace=None):
+    m = graph.matrix
+    t = np.frombuffer(curr_solution.order, dtype=np.int32)
+    x = np.concatenate((t[-1:], t, t[:2]))
+    (a, b, c, e) = (x[:-3], x[1:-2], x[2:-1], x[3:])
+
+    deltas = m[a, c] + m[b, e]
+    deltas += m[c, b]
+    deltas -= m[a, b]
+    deltas -= m[b, c]
+    deltas -= m[c, e]
+
+    i = int(np.argmin(deltas))
+    delta = deltas[i].item()
+    if trace is not None:
+        trace.evaluated += len(deltas)
+    if delta >= 0:
+        return (curr_weight, curr_solution)
+    curr_solution.swap(i)
+    if trace is not None:
+        trace.moves += 1
+    return (curr_weight + delta, curr_solution)
+
+"""
+Best 2-opt neighbour out of all of them (no candidate lists): the move (i, j)
+removes the edges leaving positions i and j and reverses positions i+1 .. j.
+The O(n^2/2) pairs are gathered and evaluated at once, so this is meant for
+instances of up to a few thousand nodes.
+"""
+
+two_opt_pairs = {}  # n -> (i, j) for all the valid 2-opt moves
+
+def best_two_opt_neighbour(graph, curr_solution, curr_weight, trace=None):
+    require_symmetric(graph, 'The 2-opt neighbourhood')
+    n = len(curr_solution)
+    if n not in two_opt_pairs:
+        (i, j) = np.triu_indices(n, 2)
+        keep = ~((i == 0) & (j == n - 1))  # those two edges are adjacent
+        two_opt_pairs[n] = (i[keep], j[keep])
+    (i, j) = two_opt_pairs[n]
+
+    m = graph.matrix
+    t = np.frombuffer(curr_solution.order, dtype=np.int32)
+    succ = np.roll(t, -1)
+    edge = m[t, succ]
+
+    (ti, tj, si, sj) = (t[i], t[j], succ[i], succ[j])
+    deltas = m[ti, tj] + m[si, sj]
+    deltas -= edge[i]
+    deltas -= edge[j]
+
+    k = int(np.argmin(deltas))
+    delta = deltas[k].item()
+    if trace is not None:
+        trace.evaluated += len(deltas)
+    if delta >= 0:
+        return (curr_weight, curr_solution)
+    curr_solution.reverse(int(i[k]) + 1, int(j[k]))
+    if trace is not None:
+        trace.moves += 1
+    return (curr_weight + delta, curr_solution)
+
+def random_neighbour(graph, solution, weight, rng=random, trace=None):
+    n = len(solution)
+    i = rng.randrange(0, n)
+    delta = swap_delta(graph.rows, solution.order, i)
+    solution.swap(i)
+    if trace is not None:
+        trace.evaluated += 1
+        trace.moves += 1
+    return (weight + delta, solution)
+
+"""
+2-opt and Or-opt neighbourhoods
+
+These are too big to scan whole (O(n^2) neighbours), so they are restricted
+by candidate lists: a move is only tried if it adds an edge from a node to
+one of its CANDIDATES nearest nodes, and only while that edge is shorter than
+the one it replaces (otherwise the move can't improve the tour).
+The find_* functions return the first improving move involving node a, as
+(delta, ...arguments for the apply_* function), or None
+"""
+
+CANDIDATES = 8
+OR_OPT_MAX_LENGTH = 3
+
+def find_two_opt_move(d, cand, solution, pos, a):
+    n = len(solution)
+    i = pos[a]
+    for succ in (True, False):
+        b = solution[(i + 1) % n] if succ else solution[i - 1]
+        d_ab = d[a][b]
+        for c in cand[a]:
+            d_ac = d[a][c]
+            if d_ac >= d_ab:
+                break
+            j = pos[c]
+            e = solution[(j + 1) % n] if succ else solution[j - 1]
+            if c == b or e == a:
+                continue
+            delta = d_ac + d[b][e] - d_ab - d[c][e]
+            if delta < 0:
+                return (delta, a, b, c, e)
+    return None
+
+def find_or_opt_move(d, cand, solution, pos, a):
     n = len(solution)
-    i = random.randrange(0, n)
-    j = (i + 1) % n
-    nb = list(solution)
-    nb[i], nb[j] = nb[j], nb[i]
-    return (evaluate(graph, nb), nb)
+    i = pos[a]
+    p = solution[i - 1]
+    for length in range(1, OR_OPT_MAX_LENGTH + 1):
+        if length + 3 > n:
+            break
+        sL = solution[(i + length - 1) % n]
+        nx = solution[(i + length) % n]
+        removed = d[p][a] + d[sL][nx] - d[p][nx]
+        if removed <= 0:
+            continue
+        for (end, other) in ((a, sL), (sL, a)):
+            for c in cand[end]:
+                d_ce = d[c][end]
+                if d_ce >= removed:
+                    break
+                j = pos[c]
+                if (j - i) % n < length:  # c is in the segment
+                    continue
+                for e in (solution[(j + 1) % n], solution[j - 1]):
+                    if (pos[e] - i) % n < length:
+                        continue
+                    delta = d_ce + d[other][e] - d[c][e] - removed
+                    if delta < 0:
+                        return (delta, i, length, c, e, end, (p, a, sL, nx, c, e))
+    return None
+
+def two_opt_neighbour(graph, curr_solution, curr_weight, trace=None):
+    require_symmetric(graph, 'The 2-opt neighbourhood')
+    d = graph.rows
+    cand = graph.candidates(CANDIDATES)
+    (order, pos) = (curr_solution.order, curr_solution.position)
+    for (k, a) in enumerate(order):
+        move = find_two_opt_move(d, cand, order, pos, a)
+        if move is not None:
+            (delta, a, b, c, e) = move
+            apply_two_opt(order, pos, a, b, c, e)
+            if trace is not None:
+                trace.scanned += k + 1
+                trace.moves += 1
+            return (curr_weight + delta, curr_solution)
+    if trace is not None:
+        trace.scanned += len(order)
+    return (curr_weight, curr_solution)
+
+def or_opt_neighbour(graph, curr_solution, curr_weight, trace=None):
+    require_symmetric(graph, 'The Or-opt neighbourhood')
+    d = graph.rows
+    cand = graph.candidates(CANDIDATES)
+    (order, pos) = (curr_solution.order, curr_solution.position)
+    for (k, a) in enumerate(order):
+        move = find_or_opt_move(d, cand, order, pos, a)
+        if move is not None:
+            (delta, i, length, c, e, end, _) = move
+            apply_or_opt(order, pos, i, length, c, e, end)
+            if trace is not None:
+                trace.scanned += k + 1
+                trace.moves += 1
+            return (curr_weight + delta, curr_solution)
+    if trace is not None:
+        trace.scanned += len(order)
+    return (curr_weight, curr_solution)
+
+"""
+2-opt + Or-opt descent with don't-look bits
+
+Instead of rescanning every node after each move, only the nodes in the queue
+are looked at. A node leaves the queue when no improving move starts from it
+(its don't-look bit is set), and goes back in only when one of its tour edges
+changes. Each move counts as an iteration for the criterion.
+Has the same (graph, initial) -> (weight, sol) shape as the other local
+searches once make_criterion is fixed, so it can be given to ILS and GRASP.
+"""
+
+def two_opt_local_search(graph, make_criterion, initial=None, or_opt=True, rng=random, trace=None):
+    require_symmetric(graph, 'The 2-opt local search')
+    tour = Tour(initial if initial is not None else random_cycle(graph.nodes, rng))
+    (sol, pos) = (tour.order, tour.position)
+    weight = evaluate(graph, sol)
+
+    d = graph.rows
+    cand = graph.candidates(CANDIDATES)
+
+    queue = deque(sol)
+    queued = [True] * len(sol)
+
+    criterion = make_criterion()
+
+    while queue and not criterion.stop():
+        a = queue.popleft()
+        queued[a] = False
+        if trace is not None:
+            trace.scanned += 1
+
+        move = find_two_opt_move(d, cand, sol, pos, a)
+        if move is not None:
+            (delta, a, b, c, e) = move
+            apply_two_opt(sol, pos, a, b, c, e)
+            touched = (a, b, c, e)
+        elif or_opt:
+            move = find_or_opt_move(d, cand, sol, pos, a)
+            if move is None:
+                continue
+            (delta, i, length, c, e, end, touched) = move
+            apply_or_opt(sol, pos, i, length, c, e, end)
+        else:
+            continue
+
+        weight += delta
+        for v in touched:
+            if not queued[v]:
+                queued[v] = True
+                queue.append(v)
+
+        criterion.update(weight)
+        if trace is not None:
+            trace.moves += 1
+            trace.step(weight)
+
+    if trace is not None and not queue:
+        trace.local_optima += 1
+
+    return (weight, tour.tolist())
+
+"""
+Lin-Kernighan style variable-depth search (LK with 2-opt moves)
+
+A move starts by removing an edge (t1, t2) and adding (t2, t3), for t3 one of
+the candidates of t2, which leaves t3 with one edge too many. Removing (t3, t4),
+for the only t4 that keeps a cycle possible, and adding (t4, t1) closes it:
+that's a 2-opt move, and it's applied right away. Then, instead of stopping
+there, (t4, t1) is taken as the next edge to remove, so t4 plays the part of
+t2 and the chain goes on, deeper and deeper.
+
+Along the chain 'gain' is the weight removed minus the weight added, not
+counting the closing edge, and it has to stay positive (that's what makes
+the search stop). The chain is cut at LK_MAX_DEPTH, or when no candidate
+keeps the gain positive, and then the moves after the depth where closing
+gave the biggest gain are undone. If no depth improves the tour, all of them
+are undone.
+
+At the first level every candidate t3 is tried (and both tour neighbours of
+t1 as t2), deeper only the one that looks best (biggest gain after removing
+(t3, t4)). An edge added in the chain is never removed later in it, and an
+edge removed is never added back, so it can't go in circles.
+"""
+
+LK_MAX_DEPTH = 10
+
+# The t4 that pairs with t3: if t2 comes after t1 in the tour, t4 is the one
+# right before t3, and vice versa
+def lk_partner(solution, pos, t1, t2, t3):
+    n = len(solution)
+    if solution[(pos[t1] + 1) % n] == t2:
+        return solution[pos[t3] - 1]
+    return solution[(pos[t3] + 1) % n]
+
+def find_lk_move(d, cand, solution, pos, t1):
+    n = len(solution)
+    for t2 in (solution[(pos[t1] + 1) % n], solution[pos[t1] - 1]):
+        d12 = d[t1][t2]
+        for t3 in cand[t2]:
+            gain = d12 - d[t2][t3]
+            if gain <= 0:
+                break
+            t4 = lk_partner(solution, pos, t1, t2, t3)
+            if t3 == t1 or t4 == t2:
+                continue
+
+            moves = []
+            added = set()
+            removed = {(min(t1, t2), max(t1, t2))}
+            best_gain = 0
+            best_depth = 0
+            (u2, u3, u4) = (t2, t3, t4)
+
+            while True:
+                apply_two_opt(solution, pos, u2, t1, u3, u4)
+                moves.append((u2, u3, u4))
+                added.add((min(u2, u3), max(u2, u3)))
+                removed.add((min(u3, u4), max(u3, u4)))
+                gain += d[u3][u4]
+
+                closed = gain - d[u4][t1]
+                if closed > best_gain:
+                    best_gain = closed
+                    best_depth = len(moves)
+
+                if len(moves) >= LK_MAX_DEPTH:
+                    break
+
+                # Next level: break (u4, t1) and look for the best way on
+                u2 = u4
+                best = None
+                for v3 in cand[u2]:
+                    g = gain - d[u2][v3]
+                    if g <= 0:
+                        break
+                    v4 = lk_partner(solution, pos, t1, u2, v3)
+                    if v3 == t1 or v4 == u2:
+                        continue
+                    if (min(u2, v3), max(u2, v3)) in removed or (min(v3, v4), max(v3, v4)) in added:
+                        continue
+                    if best is None or g + d[v3][v4] > best[0]:
+                        best = (g + d[v3][v4], g, v3, v4)
+                if best is None:
+                    break
+                (_, gain, u3, u4) = best
+
+            # Undo the moves past the best depth, last first
+            touched = {t1}
+            for (k, (u2, u3, u4)) in reversed(list(enumerate(moves))):
+                if k < best_depth:
+                    touched.update((u2, u3, u4))
+                else:
+                    apply_two_opt(solution, pos, u2, u3, t1, u4)
+            if best_gain > 0:
+                return (-best_gain, touched)
+    return None
+
+"""
+LK + Or-opt descent with don't-look bits
+
+The same queue of nodes as in two_opt_local_search, but the move from each
+node is an LK chain, and only if there's none an Or-opt move (the segment
+insertions, 3-opt moves that a chain of 2-opt moves can't make without going
+through a worse tour). Each improving chain counts as an iteration for the
+criterion. Same (graph, initial) -> (weight, sol) shape as the other local
+searches once make_criterion is fixed, to be used in ILS and GRASP.
+"""
+
+def lin_kernighan(graph, make_criterion, initial=None, rng=random, trace=None):
+    require_symmetric(graph, 'The Lin-Kernighan search')
+    tour = Tour(initial if initial is not None else random_cycle(graph.nodes, rng))
+    (sol, pos) = (tour.order, tour.position)
+    weight = evaluate(graph, sol)
+
+    d = graph.rows
+    cand = graph.candidates(CANDIDATES)
+
+    queue = deque(sol)
+    queued = [True] * len(sol)
+
+    criterion = make_criterion()
+
+    while queue and not criterion.stop():
+        a = queue.popleft()
+        queued[a] = False
+        if trace is not None:
+            trace.scanned += 1
+
+        move = find_lk_move(d, cand, sol, pos, a) if len(sol) >= 5 else None
+        if move is not None:
+            (delta, touched) = move
+        else:
+            move = find_or_opt_move(d, cand, sol, pos, a)
+            if move is None:
+                continue
+            (delta, i, length, c, e, end, touched) = move
+            apply_or_opt(sol, pos, i, length, c, e, end)
+
+        weight += delta
+        for v in touched:
+            if not queued[v]:
+                queued[v] = True
+                queue.append(v)
+
+        criterion.update(weight)
+        if trace is not None:
+            trace.moves += 1
+            trace.step(weight)
+
+    if trace is not None and not queue:
+        trace.local_optima += 1
+
+    return (weight, tour.tolist())
 
 """
 Simple local search
 """
 
-def simple_local_search(graph, make_criterion, select_neighbour, initial = None):
-    curr_sol = initial if initial is not None else random_cycle(graph.nodes)
-    curr_weight = evaluate(graph, curr_sol)
+def simple_local_search(graph, make_criterion, select_neighbour, initial = None, rng=random, trace=None):
+    # The neighbour selection changes the solution in place, so work on a copy of the initial one
+    curr_sol = Tour(initial if initial is not None else random_cycle(graph.nodes, rng))
+    curr_weight = evaluate(graph, curr_sol.order)
 
     criterion = make_criterion()
 
     while not criterion.stop():
-        (weight, sol) = select_neighbour(graph, curr_sol, curr_weight)
+        (weight, sol) = select_neighbour(graph, curr_sol, curr_weight, trace)
         if weight == curr_weight: # Local optimum
+            if trace is not None:
+                trace.local_optima += 1
             break
         elif weight < curr_weight:
             curr_weight, curr_sol = weight, sol
 
         criterion.update(curr_weight)
+        if trace is not None:
+            trace.step(curr_weight)
 
-    return (curr_weight, curr_sol)
+    return (curr_weight, curr_sol.tolist())
 
 """
 Multiple start local search
 """
 
-def multiple_start_local_search(graph, make_criterion, local_search):
-    inc_sol    = random_cycle(graph.nodes)
+def multiple_start_local_search(graph, make_criterion, local_search, rng=random, trace=None):
+    inc_sol    = random_cycle(graph.nodes, rng)
     inc_weight = evaluate(graph, inc_sol)
 
     criterion = make_criterion()
 
     while not criterion.stop():
-        sol = random_cycle(graph.nodes)
+        sol = random_cycle(graph.nodes, rng)
         (weight, sol) = local_search(graph, sol)
         if weight < inc_weight:
             inc_sol, inc_weight = sol, weight
 
         criterion.update(inc_weight)
+        if trace is not None:
+            trace.step(inc_weight)
 
     return (inc_weight, inc_sol)
 
@@ -92,76 +522,103 @@ def multiple_start_local_search(graph, make_criterion, local_search):
 Randomized local search
 """
 
-def randomized_local_search(graph, probability, make_criterion, initial=None):
+def randomized_local_search(graph, probability, make_criterion, initial=None, rng=random, trace=None):
     # current solution and its weight
-    sol = initial if initial is not None else random_cycle(graph.nodes)
-    weight = evaluate(graph, sol)
+    # (a copy, because the moves are applied to it in place)
+    sol = Tour(initial if initial is not None else random_cycle(graph.nodes, rng))
+    weight = evaluate(graph, sol.order)
 
-    # incumbent solution and its weight
-    inc_sol = sol
+    # incumbent solution (a snapshot of the current one) and its weight
+    inc_snap = sol.snapshot()
     inc_weight = weight
 
     criterion = make_criterion()
 
     while not criterion.stop():
 
-        r = random.random()
+        r = rng.random()
         if r <= probability:
-            (weight, sol) = random_neighbour(graph, sol)
+            (weight, sol) = random_neighbour(graph, sol, weight, rng, trace)
         else:
-            (next_weight, next_sol) = best_neighbour(graph, sol, weight)
+            (next_weight, next_sol) = best_neighbour(graph, sol, weight, trace)
             if next_weight == weight:  # local optimum
-                (weight, sol) = random_neighbour(graph, sol)
+                if trace is not None:
+                    trace.local_optima += 1
+                (weight, sol) = random_neighbour(graph, sol, weight, rng, trace)
             else:
                 weight, sol = next_weight, next_sol
 
         if weight < inc_weight:
-            inc_weight, inc_sol = weight, sol
+            inc_weight = weight
+            sol.snapshot(inc_snap)
 
         criterion.update(inc_weight)
+        if trace is not None:
+            trace.step(inc_weight)
 
-    return (inc_weight, inc_sol)
+    sol.restore(inc_snap)
+    return (inc_weight, sol.tolist())
 
 """
 Iterated Local Search
 """
 
-def perturb(solution, perc):
-    pd = list(solution) #perturbed
-    n = len(solution)
+# Perturbs the tour in place
+def perturb(tour, perc, rng=random):
+    n = len(tour)
     k = int(n * perc)
     for _ in range(k):
-        i = random.randrange(0, n)
-        j = (i + 1) % n
-        pd[i], pd[j] = pd[j], pd[i]
-    return pd
+        tour.swap(rng.randrange(0, n))
+    return tour
 
 
-def iterated_local_search(graph, local_search, make_criterion, perturbance_percentage, initial=None):
+# local_search(graph, initial) -> (weight, sol) gets each perturbed tour as a list
+# With a TourCache (see memo.py), perturbed tours seen before skip the local search
+# perturbation(tour, perc, rng) perturbs the tour in place (perturb, or kernel_perturb from kernels.py)
+# make_acceptance and make_strength make the acceptance criterion and the
+# perturbation strength (see acceptance.py), by default accepting every new
+# solution and perturbing perturbance_percentage of the tour
+def iterated_local_search(graph, local_search, make_criterion, perturbance_percentage, initial=None, rng=random, trace=None, cache=None,\
+        perturbation=perturb, make_acceptance=AlwaysAcceptance, make_strength=None):
+
+    # Created first so a time limit also covers the initial local search
+    criterion = make_criterion()
+    local_search = memoized(local_search, cache)
+    acceptance = make_acceptance()
+    strength = make_strength() if make_strength is not None else FixedStrength(perturbance_percentage)
 
-    initial = initial if initial is not None else random_cycle(graph.nodes)
+    initial = initial if initial is not None else random_cycle(graph.nodes, rng)
     (weight, sol) = local_search(graph, initial)
     inc_weight, inc_sol = weight, sol
 
-    # TODO what could this be?
-    def accept(weight, sol):
-        return True
-
-    criterion = make_criterion()
+    # The perturbed solutions are all built in this same tour, and the local
+    # search gets a list of it, which it can keep or change as it likes
+    tour = Tour(sol)
 
     while not criterion.stop():
-        new_sol = perturb(sol, perturbance_percentage)
-        (new_weight, new_sol) = local_search(graph, new_sol)
+        tour.load(sol)
+        perturbation(tour, strength.perc, rng)
+        (new_weight, new_sol) = local_search(graph, tour.tolist())
+        strength.update(new_weight < weight)
 
-        if accept(new_weight, new_sol):
+        if acceptance.accept(weight, new_weight, inc_weight, rng):
             weight, sol = new_weight, new_sol
         if weight < inc_weight:
             inc_weight, inc_sol = weight, sol
 
+        if acceptance.restart(inc_weight):
+            (weight, sol) = local_search(graph, random_cycle(graph.nodes, rng))
+            strength.reset()
+            if weight < inc_weight:
+                inc_weight, inc_sol = weight, sol
+
         criterion.update(inc_weight)
+        if trace is not None:
+            trace.step(inc_weight)
 
     return (inc_weight, inc_sol)
 
+
 if __name__ == '__main__':
 
     filename = sys.argv[1]
@@ -186,13 +643,15 @@ if __name__ == '__main__':
     #print(randomized_local_search(graph, 0.4, lambda: IterationCriterion(10000), initial), end='\n\n')
 
     print('Randomized local search, for 1 minute:')
-    print(randomized_local_search(graph, 0.4, lambda: TimeCriterion(60), initial), end='\n\n')
+    (weight, sol) = randomized_local_search(graph, 0.4, lambda: TimeCriterion(60), initial)
+    print((weight, graph.labelled(sol)), end='\n\n')
 
     print('Iterated local search (for 1 min, with randomized local search for 2k iters):')
-    print(iterated_local_search(\
+    (weight, sol) = iterated_local_search(\
         graph,\
         lambda graph, initial: randomized_local_search(graph, 0.3, lambda: IterationCriterion(2000), initial),\
         lambda: TimeCriterion(60),\
         0.2,\
         initial\
-    ))
+    )
+    print((weight, graph.labelled(sol)))
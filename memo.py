@@ -0,0 +1,104 @@
+import numpy as np
+from collections import OrderedDict
+from array import array
+from tour import Tour
+
+"""
+Memoized local searches
+
+ILS and GRASP often give their local search a tour it has already seen (a
+small perturbation undone by the previous local search, greedy-alpha with a
+small alpha building the same tour again), and pay for the whole search
+again. TourCache maps a start tour to the result of the local search from
+it, so a repeated start costs a hash and a lookup.
+
+The key is a hash of the tour's edges: each node has a random 64-bit key,
+each edge the product of the keys of its ends, and the tour the sum of its
+edges (all mod 2^64). That's the same for any rotation or direction of the
+tour (they're the same cycle), and computed with NumPy it's a few
+microseconds even for thousands of nodes. Different tours get the same hash
+with probability around 2^-64, which we ignore.
+
+For a randomized local search the cached result is the one from the first
+time, which is a valid result from that start, but not what a new run with
+the same rng would have given: with a cache the runs are still replayable,
+but different from the runs without one.
+"""
+
+ZOBRIST_SEED = 0x5eed
+
+zobrist_keys = {}  # n -> the keys of the nodes 0..n-1
+
+def node_keys(n):
+    if n not in zobrist_keys:
+        rng = np.random.default_rng(ZOBRIST_SEED)
+        zobrist_keys[n] = rng.integers(0, 2**64, n, dtype=np.uint64, endpoint=False)
+    return zobrist_keys[n]
+
+def tour_hash(tour):
+    if isinstance(tour, Tour):
+        tour = tour.order
+    if isinstance(tour, array):
+        t = np.frombuffer(tour, dtype=np.int32)
+    else:
+        t = np.asarray(tour)
+    z = node_keys(len(t))[t]
+    return int((z * np.roll(z, -1)).sum(dtype=np.uint64))
+
+"""
+Bounded LRU cache: when it's full, adding a tour drops the least recently
+used one
+"""
+
+class TourCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'capacity': self.capacity,
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0,
+        }
+
+"""
+The local search with its results cached (the local search itself if cache
+is None). The cached results are shared, so they must not be changed.
+"""
+def memoized(local_search, cache):
+    if cache is None:
+        return local_search
+
+    def search(graph, initial):
+        key = tour_hash(initial)
+        result = cache.get(key)
+        if result is None:
+            result = local_search(graph, initial)
+            cache.put(key, result)
+        return result
+
+    return search
@@ -0,0 +1,152 @@
+from array import array
+import numpy as np
+
+"""
+Neighbourhood moves
+
+Each move has a *_delta function, which returns by how much the weight of the
+tour would change if the move were applied, looking only at the edges the move
+touches, and an apply_* function, which applies the move to the tour in place.
+
+So instead of copying the tour and evaluating all n edges for each neighbour,
+the weight of a neighbour is just curr_weight + delta.
+
+'d' is always the instance's rows (graph.rows), so d[v][w] is the weight of (v, w).
+
+The matrix can be asymmetric (ATSP instances). The swap deltas account for
+the direction of every edge they touch. The moves that reverse a segment
+(2-opt, Or-opt, the LK chains) change the direction of all the edges inside
+it, which an O(1) delta can't see, so the searches built on them refuse
+asymmetric instances (require_symmetric).
+"""
+
+def require_symmetric(graph, what):
+    if not graph.symmetric:
+        raise ValueError(f'{what} reverses segments of the tour, which only works on symmetric instances ({graph.name or "this instance"} is asymmetric)')
+
+"""
+Adjacent swap: swaps the nodes at positions i and i+1 (mod n)
+
+    ... a b c e ...  ->  ... a c b e ...
+
+The two outer edges change, and the edge between b and c is turned around
+((b, c) becomes (c, b), which is only the same weight on symmetric instances).
+With fewer than 3 nodes the swap gives the same cycle, so the delta is 0.
+"""
+
+def swap_delta(d, solution, i):
+    n = len(solution)
+    if n < 3:
+        return 0
+    a = solution[i - 1]
+    b = solution[i]
+    c = solution[(i + 1) % n]
+    e = solution[(i + 2) % n]
+    return d[a][c] + d[c][b] + d[b][e] - d[a][b] - d[b][c] - d[c][e]
+
+def apply_swap(solution, i, pos=None):
+    j = (i + 1) % len(solution)
+    v, w = solution[i], solution[j]
+    solution[i], solution[j] = w, v
+    if pos is not None:
+        pos[w], pos[v] = i, j
+
+"""
+The moves below also take the position index of the solution (pos[v] is the
+position of node v, see tour.py) and keep it up to date as they change it
+"""
+
+"""
+Reverses the nodes from position i to position j (inclusive, wrapping around)
+Reversing a segment or the rest of the tour gives the same cycle, so we
+reverse whichever is shorter
+
+On big instances the segments can have tens of thousands of nodes, so from
+REVERSE_BATCH_MIN nodes up (when the tour is an array('i'), see tour.py) the
+segment is reversed with NumPy on views of the arrays
+"""
+
+REVERSE_BATCH_MIN = 128
+
+def reverse_segment(solution, pos, i, j):
+    n = len(solution)
+    length = (j - i) % n + 1
+    if 2 * length > n:
+        i, j = (j + 1) % n, (i - 1) % n
+        length = n - length
+    if length >= REVERSE_BATCH_MIN and isinstance(solution, array) and isinstance(pos, array):
+        order = np.frombuffer(solution, dtype=np.int32)
+        position = np.frombuffer(pos, dtype=np.int32)
+        if i + length <= n:
+            idx = np.arange(i, i + length, dtype=np.int32)
+            segment = order[i:i + length][::-1].copy()
+            order[i:i + length] = segment
+        else:
+            idx = (np.arange(i, i + length) % n).astype(np.int32)
+            segment = order[idx][::-1]
+            order[idx] = segment
+        position[segment] = idx
+        return
+    for _ in range(length // 2):
+        v, w = solution[i], solution[j]
+        solution[i], pos[w] = w, i
+        solution[j], pos[v] = v, j
+        i = (i + 1) % n
+        j = (j - 1) % n
+
+"""
+2-opt: removes the edges (a, b) and (c, e) and reconnects the tour with (a, c) and (b, e)
+
+Either b is the successor of a and e the successor of c, or b is the
+predecessor of a and e the predecessor of c (otherwise the result isn't a cycle)
+"""
+
+def two_opt_delta(d, a, b, c, e):
+    return d[a][c] + d[b][e] - d[a][b] - d[c][e]
+
+def apply_two_opt(solution, pos, a, b, c, e):
+    n = len(solution)
+    if solution[(pos[a] + 1) % n] == b:
+        reverse_segment(solution, pos, pos[b], pos[c])
+    else:
+        reverse_segment(solution, pos, pos[a], pos[e])
+
+"""
+Or-opt: moves the segment of 'length' nodes starting at position i (s1 .. sL)
+to between the adjacent nodes c and e, with 'end' (either s1 or sL) next to c
+
+    p s1 .. sL nx ... c e  ->  p nx ... c end .. other e
+"""
+
+def or_opt_delta(d, p, s1, sL, nx, c, e, end):
+    other = sL if end == s1 else s1
+    return d[p][nx] + d[c][end] + d[other][e] - d[p][s1] - d[sL][nx] - d[c][e]
+
+def apply_or_opt(solution, pos, i, length, c, e, end):
+    n = len(solution)
+    segment = [solution[(i + k) % n] for k in range(length)]
+
+    # The segment goes after position q1 and before q2
+    if (pos[c] + 1) % n == pos[e]:
+        q1, q2 = pos[c], pos[e]
+    else:
+        q1, q2 = pos[e], pos[c]
+    first = end if solution[q1] == c else (segment[0] if end == segment[-1] else segment[-1])
+    if segment[0] != first:
+        segment.reverse()
+
+    # Only the nodes between the segment and its new place move, so shift
+    # them through whichever side of the tour is shorter
+    forward = (q1 - (i + length - 1)) % n
+    backward = (i - q2) % n
+    if forward <= backward:
+        window = [solution[(i + length + k) % n] for k in range(forward)] + segment
+        start = i
+    else:
+        window = segment + [solution[(q2 + k) % n] for k in range(backward)]
+        start = q2
+
+    for k, v in enumerate(window):
+        p = (start + k) % n
+        solution[p] = v
+        pos[v] = p
@@ -0,0 +1,357 @@
+import random
+import queue
+import pickle
+import traceback
+import multiprocessing as mp
+from common import random_cycle
+from criterion import active_deadline, use_deadline
+from local_search import perturb
+from tracing import Trace
+from tour import Tour
+
+"""
+Island model ILS
+
+'workers' islands each run their own ILS, from their own seed and starting
+tour, in a process of their own. Every 'interval' ILS iterations they stop
+at a migration: each island sends its incumbent to the hub (the calling
+process), the hub sends each island the incumbents of the islands it's
+linked to, and the island decides whether to take one of them as its
+current solution. Then they all go on until the next migration.
+
+Topologies (who an island gets the incumbents of):
+    ring:   the previous island (0 <- 1 <- ... <- K-1 <- 0)
+    full:   every other island
+    random: the incumbent of every island goes to one other island, drawn
+            at each migration
+
+Acceptance of the migrants (the best one, if several):
+    better: only if it's better than the island's current solution
+    always: always, even if worse (more diversity lost, faster spread)
+
+The migrations are synchronous (an island waits at each one until all the
+islands still running get there), so with iteration criteria the result
+depends only on the seeds, not on how the processes were scheduled. Each
+island has its own criterion, made by make_criterion, counting its ILS
+iterations; an island whose criterion stops sends its last incumbent and
+leaves, the others go on migrating among themselves.
+
+make_local_search(rng, trace) gives the local search of an island, for the
+island's own rng and trace (like the sub_*_fn in stats.py). As in
+iterated_local_search, it's given each perturbed tour as a list of its own.
+
+The islands are started with fork, so the graph and the functions don't
+have to be pickled. Where there's no fork (Windows), or in a daemonic
+process (a worker of stats.py --jobs), which can't have children, the
+islands run in turns in this process instead: same results, no speedup.
+"""
+
+MIGRATION_INTERVAL = 10
+
+# The counts of a trace that a worker process sends back, to be added to the
+# trace of the hub
+def trace_counts(trace):
+    if trace is None:
+        return None
+    return (trace.evaluated, trace.scanned, trace.moves, trace.local_optima)
+
+def add_counts(trace, counts):
+    (evaluated, scanned, moves, local_optima) = counts
+    trace.evaluated += evaluated
+    trace.scanned += scanned
+    trace.moves += moves
+    trace.local_optima += local_optima
+
+TOPOLOGIES = ('ring', 'full', 'random')
+ACCEPTANCES = ('better', 'always')
+
+class Island:
+    def __init__(self, graph, make_local_search, make_criterion, perturbance_percentage, perturbation, initial, seed, tracing):
+        self.graph = graph
+        self.perturbance_percentage = perturbance_percentage
+        self.perturbation = perturbation
+        self.rng = random.Random(seed)
+        self.trace = Trace() if tracing else None
+        self.local_search = make_local_search(self.rng, self.trace)
+
+        # Created first so a time limit also covers the initial local search
+        self.criterion = make_criterion()
+        initial = initial if initial is not None else random_cycle(graph.nodes, self.rng)
+        (self.weight, self.sol) = self.local_search(graph, initial)
+        (self.inc_weight, self.inc_sol) = (self.weight, self.sol)
+        self.tour = Tour(self.sol)
+
+    # Up to 'iterations' ILS iterations, returns whether the criterion stopped it
+    def run(self, iterations):
+        for _ in range(iterations):
+            if self.criterion.stop():
+                return True
+            self.tour.load(self.sol)
+            self.perturbation(self.tour, self.perturbance_percentage, self.rng)
+            (self.weight, self.sol) = self.local_search(self.graph, self.tour.tolist())
+            if self.weight < self.inc_weight:
+                (self.inc_weight, self.inc_sol) = (self.weight, self.sol)
+
+            self.criterion.update(self.inc_weight)
+            if self.trace is not None:
+                self.trace.step(self.inc_weight)
+        return self.criterion.stop()
+
+    def receive(self, migrants, acceptance):
+        if not migrants:
+            return
+        (weight, sol) = min(migrants, key=lambda migrant: migrant[0])
+        if acceptance == 'always' or weight < self.weight:
+            (self.weight, self.sol) = (weight, sol)
+            if weight < self.inc_weight:
+                (self.inc_weight, self.inc_sol) = (weight, sol)
+
+    # What the island sends at a migration
+    def message(self, stopped):
+        return (self.inc_weight, self.inc_sol, stopped, trace_counts(self.trace) if stopped else None)
+
+# Body of an island's process: talks to the hub through 'conn'
+def island_process(conn, island_args, interval, acceptance, deadline):
+    with use_deadline(deadline):
+        island = Island(*island_args)
+        while True:
+            stopped = island.run(interval)
+            conn.send(island.message(stopped))
+            if stopped:
+                break
+            island.receive(conn.recv(), acceptance)
+    conn.close()
+
+"""
+Who gets whose incumbent: island i gets migrants[i], from the incumbents of
+the islands that reached this migration ('bests', by island) and for the
+islands that go on ('active')
+"""
+def route(bests, active, topology, rng):
+    migrants = {i: [] for i in active}
+    senders = sorted(bests)
+    if topology == 'ring':
+        for i in active:
+            k = senders.index(i)
+            if len(senders) > 1:
+                migrants[i].append(bests[senders[k - 1]])
+    elif topology == 'full':
+        for i in active:
+            migrants[i] = [bests[j] for j in senders if j != i]
+    elif topology == 'random':
+        for j in senders:
+            others = [i for i in active if i != j]
+            if others:
+                migrants[rng.choice(others)].append(bests[j])
+    else:
+        raise ValueError(f'Unknown topology {topology}')
+    return migrants
+
+def can_fork():
+    return 'fork' in mp.get_all_start_methods() and not mp.current_process().daemon
+
+def island_ils(graph, make_local_search, make_criterion, perturbance_percentage, workers,\
+        interval=MIGRATION_INTERVAL, topology='ring', acceptance='better', initial=None, rng=random, trace=None, perturbation=perturb):
+    if topology not in TOPOLOGIES:
+        raise ValueError(f'Unknown topology {topology}')
+    if acceptance not in ACCEPTANCES:
+        raise ValueError(f'Unknown acceptance {acceptance}')
+
+    # The given initial solution goes to island 0, the others start from random ones
+    seeds = [rng.getrandbits(64) for _ in range(workers)]
+    island_args = [\
+        (graph, make_local_search, make_criterion, perturbance_percentage, perturbation, initial if i == 0 else None, seeds[i], trace is not None)\
+        for i in range(workers)\
+    ]
+
+    forked = can_fork()
+    processes = []
+    if forked:
+        context = mp.get_context('fork')
+        conns = []
+        for args in island_args:
+            (hub_end, island_end) = context.Pipe()
+            process = context.Process(target=island_process, args=(island_end, args, interval, acceptance, active_deadline()), daemon=True)
+            process.start()
+            island_end.close()
+            conns.append(hub_end)
+            processes.append(process)
+        collect = lambda i: conns[i].recv()
+        send = lambda i, migrants: conns[i].send(migrants)
+    else:
+        islands = [Island(*args) for args in island_args]
+        collect = lambda i: islands[i].message(islands[i].run(interval))
+        send = lambda i, migrants: islands[i].receive(migrants, acceptance)
+
+    (inc_weight, inc_sol) = (float('inf'), None)
+    active = list(range(workers))
+    try:
+        while active:
+            messages = {i: collect(i) for i in active}
+            for i in active:
+                (weight, sol, stopped, island_counts) = messages[i]
+                if weight < inc_weight:
+                    (inc_weight, inc_sol) = (weight, sol)
+                if island_counts is not None and trace is not None:
+                    add_counts(trace, island_counts)
+            if trace is not None:
+                trace.step(inc_weight)
+
+            bests = {i: messages[i][:2] for i in active}
+            active = [i for i in active if not messages[i][2]]
+            migrants = route(bests, active, topology, rng)
+            for i in active:
+                send(i, migrants[i])
+    except BaseException:
+        # an island died (or we were interrupted): don't leave the others waiting
+        for process in processes:
+            process.terminate()
+        raise
+    for process in processes:
+        process.join()
+
+    return (inc_weight, list(inc_sol))
+
+"""
+Parallel GRASP
+
+The iterations of GRASP (a construction followed by a local search) don't
+depend on each other, so 'workers' processes run them at the same time,
+each taking the next iteration to run from the hub and sending back its
+(weight, sol).
+
+The construct_solution and local_search are the same callables grasp takes,
+which make their choices with some rng they were built with: that same rng
+has to be given here, and it's reseeded before each iteration, from the
+iteration's index (in the worker, it's the worker's copy of it). So
+iteration i gives the same solution whichever worker runs it, and the hub
+goes through the results in the order of the iterations (holding back the
+ones that come early), updating the incumbent and the criterion as grasp
+would, so any criterion stops at the same iteration with the same result as
+running them one after another. When it stops, the workers are killed right
+away, even in the middle of an iteration. Like grasp, it starts from one
+construction (made here, with rng reseeded from the base seed too), so there
+is a tour to return even if the criterion is met before the first iteration.
+
+Only as many iterations as the criterion can still take (remaining(), see
+criterion.py) are handed out, and at most two per worker at a time, so
+iteration limits don't waste work. As with the islands, without fork the
+iterations run here one after another, with the same results.
+
+A worker whose iteration raises sends the exception back instead of a
+result (or, if it can't be pickled, a RuntimeError with its traceback), and
+the hub raises it. A worker that dies without sending anything (killed, or
+a crash in native code) is noticed by the hub, which waits for the results
+at most WORKER_POLL_INTERVAL seconds at a time and checks the workers in
+between. Either way the other workers are killed.
+"""
+
+WORKER_POLL_INTERVAL = 1.0
+
+def grasp_iteration(graph, construct_solution, local_search, rng, trace, base, i):
+    rng.seed(f'{base}:{i}')
+    before = trace_counts(trace)
+    (weight, sol) = construct_solution(graph)
+    (weight, sol) = local_search(graph, sol)
+    counts = None
+    if trace is not None:
+        counts = tuple(after - b for (after, b) in zip(trace_counts(trace), before))
+    return (i, weight, sol, counts)
+
+# What a worker sends back when its iteration raised
+def worker_error(error):
+    try:
+        pickle.dumps(error)
+    except Exception:
+        error = RuntimeError(f'{type(error).__name__}: {error}\n{traceback.format_exc()}')
+    return ('error', error)
+
+def grasp_process(tasks, results, graph, construct_solution, local_search, rng, trace, base, deadline):
+    with use_deadline(deadline):
+        while True:
+            i = tasks.get()
+            if i is None:
+                break
+            try:
+                result = grasp_iteration(graph, construct_solution, local_search, rng, trace, base, i)
+            except Exception as error:
+                results.put(worker_error(error))
+                break
+            results.put(result)
+
+# The next result from the workers, raising what a worker raised, or an
+# error if one of them died without a word
+def next_result(results, processes):
+    while True:
+        try:
+            result = results.get(timeout=WORKER_POLL_INTERVAL)
+        except queue.Empty:
+            dead = [process for process in processes if not process.is_alive()]
+            if dead:
+                raise RuntimeError(f'GRASP worker {dead[0].pid} died (exit code {dead[0].exitcode})')
+            continue
+        if result[0] == 'error':
+            raise result[1]
+        return result
+
+def parallel_grasp(graph, construct_solution, local_search, make_criterion, workers, rng=random, trace=None):
+    criterion = make_criterion()
+    base = rng.getrandbits(64)
+    rng.seed(f'{base}:initial')
+    (inc_weight, inc_sol) = construct_solution(graph)
+
+    if not can_fork() or workers <= 1:
+        i = 0
+        while not criterion.stop():
+            (_, weight, sol, _) = grasp_iteration(graph, construct_solution, local_search, rng, trace, base, i)
+            if weight < inc_weight:
+                (inc_weight, inc_sol) = (weight, sol)
+            criterion.update(inc_weight)
+            if trace is not None:
+                trace.step(inc_weight)
+            i += 1
+        return (inc_weight, inc_sol)
+
+    context = mp.get_context('fork')
+    tasks = context.Queue()
+    results = context.Queue()
+    processes = [\
+        context.Process(\
+            target=grasp_process,\
+            args=(tasks, results, graph, construct_solution, local_search, rng, trace, base, active_deadline()),\
+            daemon=True\
+        )\
+        for _ in range(workers)\
+    ]
+    for process in processes:
+        process.start()
+
+    (next_i, done, in_flight) = (0, 0, 0)
+    early = {}  # results that came before the ones of earlier iterations
+    try:
+        while not criterion.stop():
+            remaining = criterion.remaining()
+            while in_flight < 2 * workers and (remaining is None or next_i < done + remaining):
+                tasks.put(next_i)
+                (next_i, in_flight) = (next_i + 1, in_flight + 1)
+
+            result = next_result(results, processes)
+            in_flight -= 1
+            early[result[0]] = result
+
+            while done in early and not criterion.stop():
+                (_, weight, sol, counts) = early.pop(done)
+                if weight < inc_weight:
+                    (inc_weight, inc_sol) = (weight, sol)
+                criterion.update(inc_weight)
+                if trace is not None:
+                    add_counts(trace, counts)
+                    trace.step(inc_weight)
+                done += 1
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+    return (inc_weight, inc_sol)
@@ -0,0 +1,82 @@
+import numpy as np
+from math import sqrt
+
+"""
+Spatial index (uniform grid)
+
+The points are bucketed in square cells of side 'size', chosen so that there
+are about 'per_cell' points per cell. The buckets are kept CSR style: the
+point indices sorted by cell in 'order', and the ones in cell c are
+order[start[c]:start[c + 1]]. Cells are numbered row by row (c = cy * gx + cx),
+so the cells of a row of a square are a single slice of 'order'.
+
+Everything is O(n) memory, and finding what's near a point only looks at
+the cells around it.
+"""
+
+class Grid:
+    def __init__(self, points, per_cell=2):
+        points = np.asarray(points, dtype=np.float64)[:, :2]
+        n = len(points)
+        lo = points.min(axis=0)
+        extent = points.max(axis=0) - lo
+
+        area = extent[0] * extent[1]
+        if area > 0:
+            size = sqrt(area * per_cell / n)
+        elif extent.max() > 0:  # all on a line
+            size = extent.max() * per_cell / n
+        else:  # all on the same point
+            size = 1.0
+
+        self.lo = lo
+        self.size = size
+        self.gx = int(extent[0] // size) + 1
+        self.gy = int(extent[1] // size) + 1
+
+        self.cx = np.minimum(((points[:, 0] - lo[0]) // size).astype(np.int64), self.gx - 1)
+        self.cy = np.minimum(((points[:, 1] - lo[1]) // size).astype(np.int64), self.gy - 1)
+        cell = self.cy * self.gx + self.cx
+
+        self.order = np.argsort(cell, kind='stable')
+        self.start = np.searchsorted(cell[self.order], np.arange(self.gx * self.gy + 1))
+
+    """
+    The points in the cells up to r cells away (in x and in y) from the cell
+    (cx, cy). Any point not returned is at least r * size away from any point
+    of the cell (cx, cy).
+    """
+    def square(self, cx, cy, r):
+        (x0, x1) = (max(cx - r, 0), min(cx + r, self.gx - 1))
+        (y0, y1) = (max(cy - r, 0), min(cy + r, self.gy - 1))
+        order, start, gx = self.order, self.start, self.gx
+        return np.concatenate([order[start[y * gx + x0]:start[y * gx + x1 + 1]] for y in range(y0, y1 + 1)])
+
+    def covers_all(self, cx, cy, r):
+        return cx - r <= 0 and cy - r <= 0 and cx + r >= self.gx - 1 and cy + r >= self.gy - 1
+
+    """
+    Nearest alive point to the point v (alive is a boolean array, so points
+    are deleted just by clearing their entry), or -1 if there's none
+
+    weights_of(others) gives the weights from v to the points in 'others', and
+    bound(distance) the smallest weight a point at that euclidean distance
+    from v can have. The square around v doubles until the best weight found
+    is below the bound of what's outside it, so the result is the same as
+    looking at every point: the smallest weight, the first point on ties.
+    """
+    def nearest(self, v, alive, weights_of, bound):
+        (cx, cy) = (int(self.cx[v]), int(self.cy[v]))
+        r = 1
+        while True:
+            others = self.square(cx, cy, r)
+            others = others[alive[others]]
+            everything = self.covers_all(cx, cy, r)
+            if len(others) > 0:
+                w = weights_of(others)
+                best = w.min()
+                if everything or bound(r * self.size) > best:
+                    return int(others[w == best].min())
+            elif everything:
+                return -1
+            r *= 2
@@ -2,10 +2,21 @@ from criterion import *
 from common import *
 from local_search import *
 from construction import *
+from instance import from_problem, load_cached, cached_value, CACHE_DIR
+from bounds import lower_bound
+from tracing import Trace
+from memo import TourCache
+from acceptance import *
+from genetic import genetic_algorithm, CROSSOVERS
+from parallel import island_ils, parallel_grasp, TOPOLOGIES, ACCEPTANCES
+from kernels import NUMBA, kernel_randomized_local_search, kernel_perturb, kernel_best_neighbour, kernel_best_two_opt_neighbour
 from pprint import pprint
 import tsplib95
 import argparse as argp
 import json
+import os
+import random
+from multiprocessing import Pool
 
 
 # 'n' is the problem size (number of nodes)
@@ -32,6 +43,20 @@ instances = {
     'kroE100':  { 'n':  100, 'path': 'instances/kroE100.tsp',  'bks':  22068 },
     'pr76':     { 'n':   76, 'path': 'instances/pr76.tsp',     'bks': 108159 },
     'st70':     { 'n':   70, 'path': 'instances/st70.tsp',     'bks':    675 },
+
+    # Larger instances, not bundled (download them from TSPLIB into
+    # instances/ to use them) and not in 'all' (name them in --instances)
+    # From 5000 nodes up they're loaded without a distance matrix (LazyInstance)
+    'pr1002':    { 'n':  1002, 'path': 'instances/pr1002.tsp',    'bks':    259045, 'large': True },
+    'pr2392':    { 'n':  2392, 'path': 'instances/pr2392.tsp',    'bks':    378032, 'large': True },
+    'pcb3038':   { 'n':  3038, 'path': 'instances/pcb3038.tsp',   'bks':    137694, 'large': True },
+    'fnl4461':   { 'n':  4461, 'path': 'instances/fnl4461.tsp',   'bks':    182566, 'large': True },
+    'rl5915':    { 'n':  5915, 'path': 'instances/rl5915.tsp',    'bks':    565530, 'large': True },
+    'rl11849':   { 'n': 11849, 'path': 'instances/rl11849.tsp',   'bks':    923288, 'large': True },
+    'usa13509':  { 'n': 13509, 'path': 'instances/usa13509.tsp',  'bks':  19982859, 'large': True },
+    'd15112':    { 'n': 15112, 'path': 'instances/d15112.tsp',    'bks':   1573084, 'large': True },
+    'pla33810':  { 'n': 33810, 'path': 'instances/pla33810.tsp',  'bks':  66048945, 'large': True },
+    'pla85900':  { 'n': 85900, 'path': 'instances/pla85900.tsp',  'bks': 142382641, 'large': True },
 }
 
 
@@ -47,6 +72,22 @@ algos = {
     'ILSRR': { 'name': 'Iterated local search (with randomized local search and random initial solution) '},
     'ILSRG': { 'name': 'Iterated local search (with randomized local search and greedy initial solution) '},
     'GRASPR': { 'name': 'GRASP (randomized local search)' },
+    'SLS2OPT': { 'name': 'Simple local search (2-opt, first better neighbour)' },
+    'SLSOR': { 'name': 'Simple local search (Or-opt, first better neighbour)' },
+    'LS2OR': { 'name': '2-opt + Or-opt local search with don\'t-look bits' },
+    'ILS2OPT': { 'name': 'Iterated local search (with 2-opt + Or-opt local search and random initial solution)' },
+    'SLSB2OPT': { 'name': 'Simple local search (2-opt, best neighbour)' },
+    'LKOR': { 'name': 'Lin-Kernighan style + Or-opt local search with don\'t-look bits' },
+    'ILSLK': { 'name': 'Iterated local search (with Lin-Kernighan style + Or-opt local search and random initial solution)' },
+    'GRASPLK': { 'name': 'GRASP (Lin-Kernighan style + Or-opt local search)' },
+    'PILS': { 'name': 'Island model parallel ILS (randomized local search, --workers processes)' },
+    'PILS2OPT': { 'name': 'Island model parallel ILS (2-opt + Or-opt local search, --workers processes)' },
+    'PGRASPR': { 'name': 'Parallel GRASP (randomized local search, --workers processes)' },
+    'PGRASPLK': { 'name': 'Parallel GRASP (Lin-Kernighan style + Or-opt local search, --workers processes)' },
+    'GA2OPT': { 'name': 'Genetic algorithm (--crossover, 2-opt + Or-opt local search as mutation)' },
+    'GALK': { 'name': 'Genetic algorithm (--crossover, Lin-Kernighan style + Or-opt local search as mutation)' },
+    'ACO': { 'name': 'Ant colony optimization (MAX-MIN ant system, --ants ants per iteration)' },
+    'ACO2OPT': { 'name': 'Ant colony optimization (MAX-MIN ant system, 2-opt + Or-opt local search on the best ant of each iteration)' },
 }
 # Later each entry will also have a 'fn' entry with the function that implements the algorithm
 # So when adding algorithms here don't forget to also add them there too
@@ -66,11 +107,38 @@ parser.add_argument('--rlsprob', type=float, default=0.4,\
 parser.add_argument('--ilsperc', type=float, default=0.1,\
     help='The percentage of a perturbance at each iteration of the iterated local search (default 0.1)')
 
+parser.add_argument('--ilsaccept', type=str, default='always', choices=['always', 'better', 'anneal', 'threshold', 'restart'],\
+    help='Which new solutions the iterated local search (ILSRR, ILSRG, ILS2OPT, ILSLK) takes as its current one: always, better (only better ones), anneal (worse ones with probability exp(-increase / T), see --temperature), threshold (up to --threshold worse than the best so far) or restart (better ones, and a new random solution after --restart iterations without improving the best) (default always)')
+
+parser.add_argument('--temperature', type=float, default=0.01,\
+    help='Initial temperature of --ilsaccept anneal, relative to the weight of the current solution (0.01: a solution 1%% worse is accepted with probability 1/e) (default 0.01)')
+
+parser.add_argument('--cooling', type=float, default=0.95,\
+    help='The temperature of --ilsaccept anneal is multiplied by this at each iteration (default 0.95)')
+
+parser.add_argument('--threshold', type=float, default=0.02,\
+    help='How much worse than the best solution so far a solution accepted by --ilsaccept threshold can be (default 0.02, i.e. 2%%)')
+
+parser.add_argument('--restart', type=int, default=10,\
+    help='Iterations without improving the best solution before --ilsaccept restart starts over from a random solution (default 10)')
+
+parser.add_argument('--ilsmaxperc', type=float, default=0,\
+    help='Adaptive perturbation: start at --ilsperc and grow it by 1.5 times (up to this) after every local search that doesn\'t improve on its start, back to --ilsperc when one does (default 0, fixed --ilsperc)')
+
 parser.add_argument('--alpha', type=float, default=0.1,\
     help='The alpha for greedy-alpha (default 0.1)')
 
+constructions = {
+    'greedy': nearest_neighbour,
+    'edge': greedy_edge,
+    'curve': space_filling_curve,
+}
+
+parser.add_argument('--initial', type=str, default='greedy', choices=constructions.keys(),\
+    help='The constructor of the initial solution of the algorithms that start from a greedy one (RLSG, ILSRG): greedy (nearest neighbour), edge (greedy edge) or curve (space-filling curve) (default greedy)')
+
 parser.add_argument('--criterion', type=str, default='iters,3000',\
-    help='The stop criterion for each algorithm; options: iters,N for N iterations, time,N for N seconds or seen,N for N times seen the best solution so far (default iters,3000)')
+    help='The stop criterion for each algorithm; options: iters,N for N iterations, time,N for N seconds or seen,N for N times seen the best solution so far; combine them with / to stop at the first one met (e.g. iters,3000/time,60/seen,50), or prefix with all: to stop only when all are met (default iters,3000)')
 
 parser.add_argument('--subcriterion', type=str, default='iters,1000',\
     help='Some algorithms use other algorithms at each iteration (e.g. GRASP does a local search at each iteration), so you can use this parameter to set the criterion for these sub-algorithms (default: iters,100)')
@@ -78,46 +146,96 @@ parser.add_argument('--subcriterion', type=str, default='iters,1000',\
 parser.add_argument('--supercriterion', type=str, default='iters,30',\
     help='Stop criterion for the outer loop of algorithms like GRASP and ILS in which each iteration is itself another algorithm (the idea is to allow for something like --criterion iters,3000 --supercriterion iters,30 --subcriterion iters,100 if you don\'t want those algorithms to take too long) (default: iters,30)')
 
+parser.add_argument('--target', type=float,\
+    help='Stop each run (and its sub-searches) as soon as it\'s within this gap (relative, e.g. 0.01 for 1%%) of the BKS, or of the lower bound for instances without a BKS, and report the time it took to get there (time-to-target); 0 stops at the BKS (default: none, always run until --criterion)')
+
+parser.add_argument('--bound', action='store_true',\
+    help=f'Also report the gaps to the Held-Karp lower bound of each instance (always done for instances without a BKS); it takes a while on big instances, so it\'s computed once and kept in {CACHE_DIR}/')
+
 parser.add_argument('--algos', type=str, default='all',\
     help='Which algorithms to run, separated by comma (no spaces!), or \'all\' to run all of them (example: RAND,RGA) (default all)')
 
 parser.add_argument('--instances', type=str, default='all',\
-    help='Which instances to run, separated by comma (no spaces!), or \'all\' to run all of them (example: brazil58,bier127,pr76) (default all)')
+    help='Which instances to run, separated by comma (no spaces!), or \'all\' to run all of the bundled ones (example: brazil58,bier127,pr76) (default all)')
+
+parser.add_argument('--memo', type=int, default=0,\
+    help='Cache the results of the local searches of ILS and GRASP by start tour, keeping up to this many per run (LRU), so repeated tours skip the search (results then differ from runs without it, as randomized local searches aren\'t run again); the hits and misses go to the JSON output (default 0, no cache)')
+
+parser.add_argument('--kernels', action='store_true',\
+    help='Run the swap scans, the perturbation of ILS and the whole iterations of RLS in the compiled kernels (kernels.py; with Numba if it\'s installed, in plain Python with the same results if not); RLS and ILS then make different random choices than without it, SLSB and SLSB2OPT give the same results')
+
+parser.add_argument('--workers', type=int, default=4,\
+    help='Number of processes of the parallel algorithms: islands of the island model ILS (PILS, PILS2OPT), each running its own ILS with --supercriterion, or workers running the iterations of the parallel GRASP (PGRASPR, PGRASPLK) (default 4)')
+
+parser.add_argument('--migration', type=int, default=10,\
+    help='The islands exchange their best solutions every this many ILS iterations (default 10)')
+
+parser.add_argument('--topology', type=str, default='ring', choices=TOPOLOGIES,\
+    help='Where the islands send their best solutions: ring (to the next one), full (to all the others) or random (to a random one at each migration) (default ring)')
+
+parser.add_argument('--migrantaccept', type=str, default='better', choices=ACCEPTANCES,\
+    help='When an island takes the best solution it got as its current one: better (if it\'s better than the current one) or always (default better)')
+
+parser.add_argument('--population', type=int, default=50,\
+    help='Population size of the genetic algorithms (GA2OPT, GALK), half of it built by greedy-alpha (--alpha) and half random (default 50)')
+
+parser.add_argument('--crossover', type=str, default='ox', choices=CROSSOVERS.keys(),\
+    help='Crossover of the genetic algorithms: ox (order crossover) or erx (edge recombination) (default ox)')
+
+parser.add_argument('--mutation', type=float, default=0.2,\
+    help='Probability of each child of the genetic algorithms going through the local search (with --subcriterion); each generation is an iteration of --supercriterion (default 0.2)')
+
+parser.add_argument('--ants', type=int, default=20,\
+    help='Ants built at each iteration of the ant colony optimization (ACO, ACO2OPT) (default 20)')
+
+parser.add_argument('--acoalpha', type=float, default=1.0,\
+    help='Weight of the pheromone in the choices of the ants: the probability of an edge is proportional to pheromone^acoalpha * (1/weight)^acobeta (default 1)')
+
+parser.add_argument('--acobeta', type=float, default=3.0,\
+    help='Weight of the edge weight in the choices of the ants, see --acoalpha (default 3)')
+
+parser.add_argument('--evaporation', type=float, default=0.02,\
+    help='Fraction of the pheromone that evaporates at each iteration of the ant colony optimization (default 0.02)')
 
 parser.add_argument('--out', type=str, help='Output the generated statistics as JSON to this file')
 
 parser.add_argument('--csv', type=str, help='Output the generated statistics as CSV to this file')
 
-args = parser.parse_args()
+parser.add_argument('--trace', type=str,\
+    help='Trace every run (improvements over time and counts of evaluations, moves and local optima) and output the traces as JSON to this file')
 
-if args.runs < 1 or args.runs > 100:
-    print('--runs must be in [1, 100]')
-    quit()
+parser.add_argument('--tracecsv', type=str,\
+    help='Like --trace, but output the improvements of each run as CSV (instance;algo;run;elapsed_ns;iteration;weight) to this file')
 
-if args.rlsprob < 0 or args.rlsprob > 1:
-    print('--rlsprob must be in [0, 1]')
-    quit()
+parser.add_argument('--nocache', action='store_true',\
+    help=f'Always parse the instance files, instead of loading them from the cache of preprocessed instances in {CACHE_DIR}/')
 
-if args.alpha < 0 or args.alpha > 1:
-    print('--alpha must be in [0, 1]')
-    quit()
+parser.add_argument('--seed', type=int, default=0,\
+    help='Base seed; each (instance, algorithm, run) gets its own random stream derived from it (default 0)')
 
-if args.ilsperc < 0 or args.ilsperc > 1:
-    print('--ilsperc must be in [0, 1]')
-    quit()
+parser.add_argument('--jobs', type=int, default=1,\
+    help='Number of worker processes; each (instance, algorithm, run) is run as a separate task (default 1, no pool)')
 
-def criterion_from_arg(criterion_string):
+parser.add_argument('--log', type=str,\
+    help='Append a JSON line to this file as soon as each (instance, algorithm, run) finishes (instance, algo, run, seed, weight, elapsed_ns, evaluated and the parameters), and compute the statistics from it at the end')
+
+parser.add_argument('--resume', action='store_true',\
+    help='With --log, skip the (instance, algorithm, run) cells already in the log with the same parameters, so an interrupted run can be continued (if they all are, just rebuilds the statistics from the log)')
+
+def single_criterion_from_arg(criterion_string):
     toks = criterion_string.split(',')
     if len(toks) != 2:
         print('Malformed criterion argument ' + criterion_string)
         quit()
     [crit, n] = toks
-    n = int(n)
     if crit == 'time':
+        n = float(n)
         mk = lambda: TimeCriterion(n)
     elif crit == 'iters':
+        n = int(n)
         mk = lambda: IterationCriterion(n)
     elif crit == 'seen':
+        n = int(n)
         mk = lambda: TimesSeenBestCriterion(n)
     else:
         print(f'Unknown criterion {crit}')
@@ -125,166 +243,691 @@ def criterion_from_arg(criterion_string):
 
     return mk
 
-make_criterion = criterion_from_arg(args.criterion)
-make_supercriterion = make_criterion if args.supercriterion is None else criterion_from_arg(args.supercriterion)
-make_subcriterion = criterion_from_arg(args.subcriterion)
-
-sub_rls_fn = lambda graph, initial: randomized_local_search(graph, RLS_PROBABILITY, make_subcriterion, initial)
-
-RLS_PROBABILITY      = args.rlsprob
-ALPHA                = args.alpha
-RUNS                 = args.runs
-ILS_PERTURBANCE_PERC = args.ilsperc
-
-algos['SLSF']['fn'] = lambda graph: simple_local_search(graph, make_criterion, first_better_neighbour)
-algos['SLSB']['fn'] = lambda graph: simple_local_search(graph, make_criterion, best_neighbour)
-algos['RAND']['fn'] = lambda graph: random_walk(graph, make_criterion)
-algos['RLS']['fn'] = lambda graph: randomized_local_search(graph, RLS_PROBABILITY, make_criterion)
-algos['RGA']['fn'] = lambda graph: repeated_greedy(graph, lambda graph: greedy_alpha(graph, ALPHA), make_criterion)
-algos['RLSG']['fn'] = lambda graph: randomized_local_search(graph, RLS_PROBABILITY, make_criterion, greedy(graph)[1])
-algos['ILSRR']['fn'] = lambda graph: iterated_local_search(\
-    graph,\
-    sub_rls_fn,\
-    make_supercriterion,\
-    ILS_PERTURBANCE_PERC\
-)
-algos['ILSRG']['fn'] = lambda graph: iterated_local_search(\
-    graph,\
-    sub_rls_fn,\
-    make_supercriterion,\
-    ILS_PERTURBANCE_PERC,\
-    greedy(graph)[1]\
-)
-algos['GRASPR']['fn'] = lambda graph: grasp(\
+# 'a/b/c' stops at whichever of a, b or c comes first, 'all:a/b' only when both a and b are met
+def criterion_from_arg(criterion_string):
+    combine = AnyCriterion
+    if criterion_string.startswith('all:'):
+        combine = AllCriterion
+        criterion_string = criterion_string[len('all:'):]
+    mks = [single_criterion_from_arg(s) for s in criterion_string.split('/')]
+    if len(mks) == 1:
+        return mks[0]
+    return lambda: combine(*(mk() for mk in mks))
+
+# make_criterion, with a stop at the target of the cell being run (if it has one)
+def with_target(make_criterion):
+    return lambda: make_criterion() if CELL_TARGET is None else AnyCriterion(make_criterion(), TargetCriterion(CELL_TARGET))
+
+# The time limit that a criterion argument can't go over, if it has one
+def time_limit_from_arg(criterion_string):
+    if criterion_string.startswith('all:'):
+        return None
+    limits = [float(s.split(',')[1]) for s in criterion_string.split('/') if s.startswith('time,')]
+    return min(limits) if limits else None
+
+def setup(args):
+    global make_criterion, make_supercriterion, make_subcriterion
+    global RLS_PROBABILITY, ALPHA, RUNS, ILS_PERTURBANCE_PERC, SEED, USE_CACHE, DEADLINE, TRACE, INITIAL, MEMO, TARGET_GAP
+
+    make_criterion = criterion_from_arg(args.criterion)
+    make_supercriterion = make_criterion if args.supercriterion is None else criterion_from_arg(args.supercriterion)
+    make_subcriterion = criterion_from_arg(args.subcriterion)
+
+    # When the outer loop of ILS/GRASP has a time limit, each cell runs inside
+    # a shared deadline (see run_cell) and the sub-searches stop at it too
+    DEADLINE = time_limit_from_arg(args.supercriterion)
+    if DEADLINE is not None:
+        make_inner_subcriterion = make_subcriterion
+        make_subcriterion = lambda: AnyCriterion(make_inner_subcriterion(), DeadlineCriterion())
+
+    # With --target, all of them also stop at the target of the cell being run
+    if args.target is not None:
+        make_criterion = with_target(make_criterion)
+        make_supercriterion = with_target(make_supercriterion)
+        make_subcriterion = with_target(make_subcriterion)
+
+    # Each run has its own rng and trace (None unless --trace/--tracecsv),
+    # shared by the algorithm and its sub-searches, so these build the
+    # sub-search for a given rng and trace
+    # (and its own CELL_CACHE, see run_cell)
+    acceptances = {
+        'always': AlwaysAcceptance,
+        'better': BetterAcceptance,
+        'anneal': lambda: AnnealingAcceptance(args.temperature, args.cooling),
+        'threshold': lambda: ThresholdAcceptance(args.threshold),
+        'restart': lambda: RestartAcceptance(args.restart),
+    }
+    make_acceptance = acceptances[args.ilsaccept]
+    make_strength = None
+    if args.ilsmaxperc > 0:
+        make_strength = lambda: AdaptiveStrength(args.ilsperc, args.ilsmaxperc)
+
+    # With --kernels, the same algorithms with the kernels' loops
+    rls = kernel_randomized_local_search if args.kernels else randomized_local_search
+    perturbation = kernel_perturb if args.kernels else perturb
+    select_best = kernel_best_neighbour if args.kernels else best_neighbour
+    select_best_two_opt = kernel_best_two_opt_neighbour if args.kernels else best_two_opt_neighbour
+
+    sub_rls_fn = lambda rng, trace: lambda graph, initial: rls(graph, RLS_PROBABILITY, make_subcriterion, initial, rng, trace)
+    sub_2opt_fn = lambda rng, trace: lambda graph, initial: two_opt_local_search(graph, make_subcriterion, initial, rng=rng, trace=trace)
+    sub_lk_fn = lambda rng, trace: lambda graph, initial: lin_kernighan(graph, make_subcriterion, initial, rng, trace)
+
+    RLS_PROBABILITY      = args.rlsprob
+    ALPHA                = args.alpha
+    INITIAL              = constructions[args.initial]
+    RUNS                 = args.runs
+    ILS_PERTURBANCE_PERC = args.ilsperc
+    SEED                 = args.seed
+    USE_CACHE            = not args.nocache
+    # the log needs the elapsed time and evaluations of each run, and the
+    # time-to-target comes from the improvements
+    TRACE                = args.trace is not None or args.tracecsv is not None or args.log is not None or args.target is not None
+    MEMO                 = args.memo
+    TARGET_GAP           = args.target
+
+    fns = {}
+    fns['SLSF'] = lambda graph, rng, trace: simple_local_search(graph, make_criterion, first_better_neighbour, rng=rng, trace=trace)
+    fns['SLSB'] = lambda graph, rng, trace: simple_local_search(graph, make_criterion, select_best, rng=rng, trace=trace)
+    fns['RAND'] = lambda graph, rng, trace: random_walk(graph, make_criterion, rng, trace)
+    fns['RLS'] = lambda graph, rng, trace: rls(graph, RLS_PROBABILITY, make_criterion, rng=rng, trace=trace)
+    fns['RGA'] = lambda graph, rng, trace: repeated_greedy(graph, lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng), make_criterion, trace)
+    fns['RLSG'] = lambda graph, rng, trace: rls(graph, RLS_PROBABILITY, make_criterion, INITIAL(graph, trace)[1], rng, trace)
+    fns['ILSRR'] = lambda graph, rng, trace: iterated_local_search(\
+        graph,\
+        sub_rls_fn(rng, trace),\
+        make_supercriterion,\
+        ILS_PERTURBANCE_PERC,\
+        rng=rng,\
+        trace=trace,\
+        cache=CELL_CACHE,\
+        perturbation=perturbation,\
+        make_acceptance=make_acceptance,\
+        make_strength=make_strength\
+    )
+    fns['ILSRG'] = lambda graph, rng, trace: iterated_local_search(\
+        graph,\
+        sub_rls_fn(rng, trace),\
+        make_supercriterion,\
+        ILS_PERTURBANCE_PERC,\
+        INITIAL(graph, trace)[1],\
+        rng,\
+        trace,\
+        cache=CELL_CACHE,\
+        perturbation=perturbation,\
+        make_acceptance=make_acceptance,\
+        make_strength=make_strength\
+    )
+    fns['GRASPR'] = lambda graph, rng, trace: grasp(\
+            graph,\
+            lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng),\
+            sub_rls_fn(rng, trace),\
+            make_supercriterion,\
+            trace,\
+            cache=CELL_CACHE\
+    )
+    fns['SLS2OPT'] = lambda graph, rng, trace: simple_local_search(graph, make_criterion, two_opt_neighbour, rng=rng, trace=trace)
+    fns['SLSOR'] = lambda graph, rng, trace: simple_local_search(graph, make_criterion, or_opt_neighbour, rng=rng, trace=trace)
+    fns['SLSB2OPT'] = lambda graph, rng, trace: simple_local_search(graph, make_criterion, select_best_two_opt, rng=rng, trace=trace)
+    fns['LS2OR'] = lambda graph, rng, trace: two_opt_local_search(graph, make_criterion, rng=rng, trace=trace)
+    fns['ILS2OPT'] = lambda graph, rng, trace: iterated_local_search(\
+        graph,\
+        sub_2opt_fn(rng, trace),\
+        make_supercriterion,\
+        ILS_PERTURBANCE_PERC,\
+        rng=rng,\
+        trace=trace,\
+        cache=CELL_CACHE,\
+        perturbation=perturbation,\
+        make_acceptance=make_acceptance,\
+        make_strength=make_strength\
+    )
+    fns['LKOR'] = lambda graph, rng, trace: lin_kernighan(graph, make_criterion, rng=rng, trace=trace)
+    fns['ILSLK'] = lambda graph, rng, trace: iterated_local_search(\
+        graph,\
+        sub_lk_fn(rng, trace),\
+        make_supercriterion,\
+        ILS_PERTURBANCE_PERC,\
+        rng=rng,\
+        trace=trace,\
+        cache=CELL_CACHE,\
+        perturbation=perturbation,\
+        make_acceptance=make_acceptance,\
+        make_strength=make_strength\
+    )
+    fns['GRASPLK'] = lambda graph, rng, trace: grasp(\
+            graph,\
+            lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng),\
+            sub_lk_fn(rng, trace),\
+            make_supercriterion,\
+            trace,\
+            cache=CELL_CACHE\
+    )
+
+    fns['PILS'] = lambda graph, rng, trace: island_ils(\
         graph,\
-        lambda graph: greedy_alpha(graph, ALPHA),\
         sub_rls_fn,\
-        make_supercriterion\
-)
+        make_supercriterion,\
+        ILS_PERTURBANCE_PERC,\
+        args.workers,\
+        args.migration,\
+        args.topology,\
+        args.migrantaccept,\
+        rng=rng,\
+        trace=trace,\
+        perturbation=perturbation\
+    )
+    fns['PILS2OPT'] = lambda graph, rng, trace: island_ils(\
+        graph,\
+        sub_2opt_fn,\
+        make_supercriterion,\
+        ILS_PERTURBANCE_PERC,\
+        args.workers,\
+        args.migration,\
+        args.topology,\
+        args.migrantaccept,\
+        rng=rng,\
+        trace=trace,\
+        perturbation=perturbation\
+    )
+
+    fns['PGRASPR'] = lambda graph, rng, trace: parallel_grasp(\
+        graph,\
+        lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng),\
+        sub_rls_fn(rng, trace),\
+        make_supercriterion,\
+        args.workers,\
+        rng,\
+        trace\
+    )
+    fns['PGRASPLK'] = lambda graph, rng, trace: parallel_grasp(\
+        graph,\
+        lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng),\
+        sub_lk_fn(rng, trace),\
+        make_supercriterion,\
+        args.workers,\
+        rng,\
+        trace\
+    )
+
+    fns['GA2OPT'] = lambda graph, rng, trace: genetic_algorithm(\
+        graph,\
+        make_supercriterion,\
+        lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng),\
+        sub_2opt_fn(rng, trace),\
+        args.population,\
+        CROSSOVERS[args.crossover],\
+        args.mutation,\
+        rng=rng,\
+        trace=trace\
+    )
+    fns['GALK'] = lambda graph, rng, trace: genetic_algorithm(\
+        graph,\
+        make_supercriterion,\
+        lambda graph: greedy_alpha_vectorized(graph, ALPHA, rng),\
+        sub_lk_fn(rng, trace),\
+        args.population,\
+        CROSSOVERS[args.crossover],\
+        args.mutation,\
+        rng=rng,\
+        trace=trace\
+    )
+
+    fns['ACO'] = lambda graph, rng, trace: ant_colony(\
+        graph,\
+        make_criterion,\
+        None,\
+        args.ants,\
+        args.acoalpha,\
+        args.acobeta,\
+        args.evaporation,\
+        rng,\
+        trace\
+    )
+    fns['ACO2OPT'] = lambda graph, rng, trace: ant_colony(\
+        graph,\
+        make_supercriterion,\
+        sub_2opt_fn(rng, trace),\
+        args.ants,\
+        args.acoalpha,\
+        args.acobeta,\
+        args.evaporation,\
+        rng,\
+        trace\
+    )
+
+    # Only the selected algorithms are still in the table (in a forked worker too)
+    for algo in algos:
+        algos[algo]['fn'] = fns[algo]
+
+"""
+Each (instance, algorithm, run) cell is independent, so they can be run by a
+pool of worker processes. Each cell gets its own random.Random, seeded from
+--seed and the cell itself, so the results don't depend on which process
+runs it or in what order: --jobs N gives the same numbers as --jobs 1, and
+the same --seed replays the same runs.
+"""
+
+def cell_seed(seed, name, algo, run):
+    # string seeds are hashed with sha512, so they're the same in every process
+    return f'{seed}:{name}:{algo}:{run}'
+
+graphs = {}  # name -> Instance (distance matrix built from tsplib95.load, or loaded from the cache)
+
+def load_graph(name):
+    if name not in graphs:
+        instance = instances[name]
+        if USE_CACHE:
+            graphs[name] = load_cached(instance['path'], name, instance['bks'])
+        else:
+            problem = tsplib95.load(instance['path'])
+            graphs[name] = from_problem(problem, name)
+    return graphs[name]
+
+# Lower bounds (see bounds.py), None for the instances that don't have one
+bounds = {}
+
+def load_bound(name):
+    if name not in bounds:
+        graph = load_graph(name)
+        if USE_CACHE:
+            bounds[name] = cached_value(instances[name]['path'], 'lower_bound', lambda: lower_bound(graph))
+        else:
+            bounds[name] = lower_bound(graph)
+    return bounds[name]
+
+# The weight a run has to get to with --target: within TARGET_GAP of the BKS,
+# or of the lower bound if there's no BKS (None if there's neither)
+def target_weight(name):
+    reference = instances[name]['bks']
+    if reference is None:
+        reference = load_bound(name)
+    if reference is None:
+        return None
+    return reference * (1 + TARGET_GAP)
+
+CELL_CACHE = None   # the TourCache of the cell being run, None unless --memo
+CELL_TARGET = None  # the target weight of the cell being run, None unless --target
+
+def run_cell(cell):
+    global CELL_CACHE, CELL_TARGET
+    (name, algo, run) = cell
+    graph = load_graph(name)
+    rng = random.Random(cell_seed(SEED, name, algo, run))
+    trace = Trace() if TRACE else None
+    CELL_CACHE = TourCache(MEMO) if MEMO > 0 else None
+    CELL_TARGET = target_weight(name) if TARGET_GAP is not None else None
+    if DEADLINE is None:
+        (weight, sol) = algos[algo]['fn'](graph, rng, trace)
+    else:
+        with shared_deadline(DEADLINE):
+            (weight, sol) = algos[algo]['fn'](graph, rng, trace)
+    if trace is not None:
+        trace.finish()
+        target_ns = trace.time_to(CELL_TARGET) if CELL_TARGET is not None else None
+        trace = trace.to_dict()
+        if CELL_TARGET is not None:
+            trace['target_ns'] = target_ns
+    cache = CELL_CACHE.to_dict() if CELL_CACHE is not None else None
+    return (name, algo, run, weight, trace, cache)
+
+# Runs in each worker process once, before its first cell
+def init_worker(args):
+    setup(args)
+
+"""
+Results log
+
+One JSON object per line, one line per cell, appended and flushed to disk
+as soon as the cell is done, so killing the script loses at most the cells
+that were running. Each record has the parameters that change the results
+(RESULT_PARAMS), and --resume only counts the records with the same ones.
+"""
+
+RESULT_PARAMS = ['criterion', 'subcriterion', 'supercriterion', 'rlsprob', 'alpha', 'ilsperc', 'seed', 'initial', 'memo', 'kernels', 'workers', 'migration', 'topology', 'migrantaccept',\
+    'ilsaccept', 'temperature', 'cooling', 'threshold', 'restart', 'ilsmaxperc', 'target',\
+    'population', 'crossover', 'mutation', 'ants', 'acoalpha', 'acobeta', 'evaporation']
+
+def result_params(args):
+    return {param: getattr(args, param) for param in RESULT_PARAMS}
+
+def make_record(result, params):
+    (name, algo, run, weight, trace, cache) = result
+    record = {
+        'instance': name,
+        'algo': algo,
+        'run': run,
+        'seed': cell_seed(SEED, name, algo, run),
+        'weight': weight,
+        'elapsed_ns': trace['elapsed_ns'],
+        'evaluated': trace['evaluated'],
+        'params': params,
+    }
+    if cache is not None:
+        record['cache'] = cache
+    if 'target_ns' in trace:
+        record['target_ns'] = trace['target_ns']
+    return record
+
+def append_record(f, record):
+    f.write(json.dumps(record) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+# Opens the log for appending, first cutting off a last line cut in half by a
+# kill, so the next record doesn't end up glued to it
+def open_log(path):
+    if os.path.exists(path):
+        with open(path, 'rb+') as f:
+            keep = f.seek(0, os.SEEK_END)
+            while keep > 0:
+                start = max(keep - 4096, 0)
+                f.seek(start)
+                newline = f.read(keep - start).rfind(b'\n')
+                if newline >= 0:
+                    keep = start + newline + 1
+                    break
+                keep = start
+            f.truncate(keep)
+    return open(path, 'a')
+
+# The records of the log with these parameters, one at a time
+# (a line cut in half by a kill is skipped)
+def read_log(path, params):
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('params') == params:
+                yield record
+
+if __name__ == '__main__':
+
+    args = parser.parse_args()
+
+    if args.runs < 1 or args.runs > 100:
+        print('--runs must be in [1, 100]')
+        quit()
 
-algos_to_run = algos.keys()
-if args.algos != 'all':
-    algos_to_run = args.algos.split(',')
+    if args.jobs < 1:
+        print('--jobs must be at least 1')
+        quit()
+
+    if args.workers < 1 or args.migration < 1:
+        print('--workers and --migration must be at least 1')
+        quit()
 
-for algo in list(algos.keys()):
-    if algo not in algos_to_run:
-        del algos[algo]
+    if args.resume and args.log is None:
+        print('--resume needs --log')
+        quit()
 
-instances_to_run = instances.keys()
-if args.instances != 'all':
-    instances_to_run = args.instances.split(',')
+    if args.kernels and not NUMBA:
+        print('Numba is not available, the kernels will run as plain Python (same results, slower)')
 
-for instance in list(instances.keys()):
-    if instance not in instances_to_run:
-        del instances[instance]
+    if args.rlsprob < 0 or args.rlsprob > 1:
+        print('--rlsprob must be in [0, 1]')
+        quit()
 
-outpath = args.out
+    if args.alpha < 0 or args.alpha > 1:
+        print('--alpha must be in [0, 1]')
+        quit()
 
-csvpath = args.csv
+    if args.ilsperc < 0 or args.ilsperc > 1:
+        print('--ilsperc must be in [0, 1]')
+        quit()
 
-print('Parsing instances...')
+    if args.ilsmaxperc < 0 or args.ilsmaxperc > 1:
+        print('--ilsmaxperc must be in [0, 1]')
+        quit()
 
-problems = {}  # returns from tsplib95.load
-graphs = {}
-for name in instances:
-    print(f'    Parsing {name}...')
-    problem = tsplib95.load(instances[name]['path'])
-    problems[name] = problem
-    graphs[name] = problem.get_graph()
-print()
+    if args.population < 2:
+        print('--population must be at least 2')
+        quit()
 
-stats = {}
-for instance in instances:
-    stats[instance] = {}
-    stats[instance]['algos'] = {}
-    for algo in algos:
-        stats[instance]['algos'][algo] = {}
-        stats[instance]['algos'][algo]['runs'] = [-1 for _ in range(RUNS)]
+    if args.mutation < 0 or args.mutation > 1:
+        print('--mutation must be in [0, 1]')
+        quit()
 
-for run in range(RUNS):
-    for (name, graph) in graphs.items():
-        print('Run', run, name)
-        for algo in algos:
-            print('    ', algo)
-            (weight, sol) = algos[algo]['fn'](graph)
-            stats[name]['algos'][algo]['runs'][run] = weight
-    print()
+    if args.ants < 1:
+        print('--ants must be at least 1')
+        quit()
 
-for instance in stats:
-    bks = instances[instance]['bks']
-    stats[instance]['bks'] = bks
+    if args.evaporation <= 0 or args.evaporation > 1:
+        print('--evaporation must be in (0, 1]')
+        quit()
 
-    greedy_weight = greedy(graphs[instance])[0]
-    stats[instance]['greedy'] = {}
-    stats[instance]['greedy']['weight'] = greedy_weight
-    stats[instance]['greedy']['D%'] = ((greedy_weight - bks) / bks) * 100
+    if args.target is not None and args.target < 0:
+        print('--target must be at least 0')
+        quit()
 
-    if problems[instance].edge_weight_type == 'EUC_2D':
-        greedym_weight = greedy_manhattan(problems[instance])[0]
-        stats[instance]['greedy_manhattan'] = {}
-        stats[instance]['greedy_manhattan']['weight'] = greedym_weight
-        stats[instance]['greedy_manhattan']['D%'] = ((greedym_weight - bks) / bks) * 100
+    setup(args)
 
-    for algo in stats[instance]['algos']:
-        best  = float('inf')
-        worst = float('-inf')
-        avg   = 0
+    algos_to_run = algos.keys()
+    if args.algos != 'all':
+        algos_to_run = args.algos.split(',')
 
-        for weight in stats[instance]['algos'][algo]['runs']:
-            if weight < best:
-                best = weight
-            if weight > worst:
-                worst = weight
-            avg += weight
-        avg /= RUNS
+    for algo in list(algos.keys()):
+        if algo not in algos_to_run:
+            del algos[algo]
 
-        stats[instance]['algos'][algo]['best'] = best
-        stats[instance]['algos'][algo]['worst'] = worst
-        stats[instance]['algos'][algo]['avg'] = avg
+    if args.jobs > 1 and any(algo.startswith('PILS') or algo.startswith('PGRASP') for algo in algos):
+        print('The workers of --jobs can\'t start processes, so the parallel algorithms (PILS, PILS2OPT, PGRASPR, PGRASPLK) will run on a single process (same results, no speedup)')
 
-        stats[instance]['algos'][algo]['Dbest%'] = ((best - bks) / bks) * 100
-        stats[instance]['algos'][algo]['Davg%'] = ((avg - bks) / bks) * 100
+    instances_to_run = [name for name in instances if not instances[name].get('large')]
+    if args.instances != 'all':
+        instances_to_run = args.instances.split(',')
 
-pprint(stats)
+    for instance in list(instances.keys()):
+        if instance not in instances_to_run:
+            del instances[instance]
+        elif not os.path.exists(instances[instance]['path']):
+            print(f'Skipping {instance}: {instances[instance]["path"]} not found')
+            del instances[instance]
 
-if outpath is not None:
-    with open(outpath, 'w') as outfile:
-        output = json.dumps(stats, indent=4, sort_keys=True)
-        outfile.write(output)
-        print('Dumped JSON to ' + outpath)
+    outpath = args.out
 
-if csvpath is not None:
+    csvpath = args.csv
 
-    def write_line(f, line):
-        f.write(';'.join(str(x) for x in line))
-        f.write('\n')
+    tracepath = args.trace
 
-    def fmt_perc(perc):
-        return '{0:.2f}'.format(perc)
+    tracecsvpath = args.tracecsv
 
-    def fmt_avg(avg):
-        return '{0:.1f}'.format(avg)
+    print('Parsing instances...')
 
-    with open(csvpath, 'w') as f:
+    for name in instances:
+        print(f'    Parsing {name}...')
+        load_graph(name)
+        # computed here once, before the workers need it
+        if args.bound or instances[name]['bks'] is None:
+            print(f'    Lower bound of {name}: {load_bound(name)}')
+    print()
 
-        header = ['instance', 'BKS', 'G.W', 'G.D%', 'GM.W', 'GM.D%']
+    stats = {}
+    for instance in instances:
+        stats[instance] = {}
+        stats[instance]['algos'] = {}
         for algo in algos:
-            header.append(algo + '.W')
-            header.append(algo + '.D%')
-        write_line(f, header)
-
-        for instance in stats:
-            line = [\
-                instance,\
-                stats[instance]['bks'],\
-                stats[instance]['greedy']['weight'],\
-                fmt_perc(stats[instance]['greedy']['D%']),\
-                stats[instance]['greedy_manhattan']['weight'] if 'greedy_manhattan' in stats[instance] else '0',\
-                fmt_perc(stats[instance]['greedy_manhattan']['D%']) if 'greedy_manhattan' in stats[instance] else '0',\
-            ]
+            stats[instance]['algos'][algo] = {}
+            stats[instance]['algos'][algo]['runs'] = [-1 for _ in range(RUNS)]
+
+    traces = {name: {algo: [None for _ in range(RUNS)] for algo in algos} for name in instances}
+
+    params = result_params(args)
+
+    done = set()
+    if args.resume:
+        for record in read_log(args.log, params):
+            done.add((record['instance'], record['algo'], record['run']))
+
+    logfile = open_log(args.log) if args.log is not None else None
+
+    def record_result(result):
+        (name, algo, run, weight, trace, cache) = result
+        stats[name]['algos'][algo]['runs'][run] = weight
+        traces[name][algo][run] = trace
+        if cache is not None:
+            stats[name]['algos'][algo].setdefault('cache', [None for _ in range(RUNS)])[run] = cache
+        if trace is not None and 'target_ns' in trace:
+            stats[name]['algos'][algo].setdefault('target_ns', [None for _ in range(RUNS)])[run] = trace['target_ns']
+        if logfile is not None:
+            append_record(logfile, make_record(result, params))
+
+    cells = [(name, algo, run) for run in range(RUNS) for name in instances for algo in algos]
+    if done:
+        print(f'Resuming: {len([cell for cell in cells if cell in done])} of {len(cells)} cells already in {args.log}')
+        cells = [cell for cell in cells if cell not in done]
+
+    if args.jobs <= 1:
+        for (name, algo, run) in cells:
+            print('Run', run, name, algo)
+            record_result(run_cell((name, algo, run)))
+        print()
+    else:
+        print(f'Running {len(cells)} cells on {args.jobs} processes')
+        with Pool(args.jobs, initializer=init_worker, initargs=(args,)) as pool:
+            for result in pool.imap_unordered(run_cell, cells):
+                (name, algo, run, weight, _, _) = result
+                print('    Run', run, name, algo, weight)
+                record_result(result)
+        print()
+
+    if logfile is not None:
+        logfile.close()
+
+        # The statistics come from the log, in one pass over it, so they
+        # include the cells of the previous runs when resuming
+        for record in read_log(args.log, params):
+            (name, algo, run) = (record['instance'], record['algo'], record['run'])
+            if name in stats and algo in stats[name]['algos'] and run < RUNS:
+                stats[name]['algos'][algo]['runs'][run] = record['weight']
+                if 'cache' in record:
+                    stats[name]['algos'][algo].setdefault('cache', [None for _ in range(RUNS)])[run] = record['cache']
+                if 'target_ns' in record:
+                    stats[name]['algos'][algo].setdefault('target_ns', [None for _ in range(RUNS)])[run] = record['target_ns']
+
+    # % above the reference (the BKS or the lower bound), None without one
+    def gap(weight, reference):
+        return ((weight - reference) / reference) * 100 if reference is not None else None
+
+    for instance in stats:
+        bks = instances[instance]['bks']
+        stats[instance]['bks'] = bks
+
+        lb = None
+        if args.bound or bks is None:
+            lb = load_bound(instance)
+            stats[instance]['lower_bound'] = lb
+
+        greedy_weight = nearest_neighbour(graphs[instance])[0]
+        stats[instance]['greedy'] = {}
+        stats[instance]['greedy']['weight'] = greedy_weight
+        stats[instance]['greedy']['D%'] = gap(greedy_weight, bks)
+        if lb is not None:
+            stats[instance]['greedy']['Dlb%'] = gap(greedy_weight, lb)
+
+        if graphs[instance].edge_weight_type == 'EUC_2D':
+            greedym_weight = greedy_manhattan(graphs[instance])[0]
+            stats[instance]['greedy_manhattan'] = {}
+            stats[instance]['greedy_manhattan']['weight'] = greedym_weight
+            stats[instance]['greedy_manhattan']['D%'] = gap(greedym_weight, bks)
+            if lb is not None:
+                stats[instance]['greedy_manhattan']['Dlb%'] = gap(greedym_weight, lb)
+
+        if args.target is not None:
+            stats[instance]['target'] = target_weight(instance)
+
+        for algo in stats[instance]['algos']:
+            best  = float('inf')
+            worst = float('-inf')
+            avg   = 0
+
+            for weight in stats[instance]['algos'][algo]['runs']:
+                if weight < best:
+                    best = weight
+                if weight > worst:
+                    worst = weight
+                avg += weight
+            avg /= RUNS
+
+            stats[instance]['algos'][algo]['best'] = best
+            stats[instance]['algos'][algo]['worst'] = worst
+            stats[instance]['algos'][algo]['avg'] = avg
+
+            stats[instance]['algos'][algo]['Dbest%'] = gap(best, bks)
+            stats[instance]['algos'][algo]['Davg%'] = gap(avg, bks)
+            if lb is not None:
+                stats[instance]['algos'][algo]['Dbestlb%'] = gap(best, lb)
+                stats[instance]['algos'][algo]['Davglb%'] = gap(avg, lb)
+
+            # Time-to-target: how many runs got there, and how long they took on average
+            if 'target_ns' in stats[instance]['algos'][algo]:
+                times = [t for t in stats[instance]['algos'][algo]['target_ns'] if t is not None]
+                stats[instance]['algos'][algo]['reached'] = len(times)
+                stats[instance]['algos'][algo]['ttt_avg'] = sum(times) / len(times) / 1e9 if times else None
+
+    pprint(stats)
+
+    if outpath is not None:
+        with open(outpath, 'w') as outfile:
+            output = json.dumps(stats, indent=4, sort_keys=True)
+            outfile.write(output)
+            print('Dumped JSON to ' + outpath)
+
+    if csvpath is not None:
+
+        def write_line(f, line):
+            f.write(';'.join(str(x) for x in line))
+            f.write('\n')
+
+        def fmt_perc(perc):
+            return '{0:.2f}'.format(perc) if perc is not None else ''
+
+        def fmt_avg(avg):
+            return '{0:.1f}'.format(avg)
+
+        with open(csvpath, 'w') as f:
+
+            header = ['instance', 'BKS', 'G.W', 'G.D%', 'GM.W', 'GM.D%']
             for algo in algos:
-                line.append(fmt_avg(stats[instance]['algos'][algo]['avg']))
-                line.append(fmt_perc(stats[instance]['algos'][algo]['Davg%']))
-            write_line(f, line)
+                header.append(algo + '.W')
+                header.append(algo + '.D%')
+            write_line(f, header)
+
+            for instance in stats:
+                line = [\
+                    instance,\
+                    stats[instance]['bks'],\
+                    stats[instance]['greedy']['weight'],\
+                    fmt_perc(stats[instance]['greedy']['D%']),\
+                    stats[instance]['greedy_manhattan']['weight'] if 'greedy_manhattan' in stats[instance] else '0',\
+                    fmt_perc(stats[instance]['greedy_manhattan']['D%']) if 'greedy_manhattan' in stats[instance] else '0',\
+                ]
+                for algo in algos:
+                    line.append(fmt_avg(stats[instance]['algos'][algo]['avg']))
+                    line.append(fmt_perc(stats[instance]['algos'][algo]['Davg%']))
+                write_line(f, line)
     
-    print('Dumped CSV to ' + csvpath)
+        print('Dumped CSV to ' + csvpath)
+
+    if tracepath is not None:
+        with open(tracepath, 'w') as outfile:
+            output = json.dumps(traces, indent=4, sort_keys=True)
+            outfile.write(output)
+            print('Dumped traces to ' + tracepath)
+
+    if tracecsvpath is not None:
+        with open(tracecsvpath, 'w') as f:
+            f.write(';'.join(['instance', 'algo', 'run', 'elapsed_ns', 'iteration', 'weight']))
+            f.write('\n')
+            for name in traces:
+                for algo in traces[name]:
+                    for (run, trace) in enumerate(traces[name][algo]):
+                        if trace is None:  # resumed, not run now
+                            continue
+                        for (elapsed, iteration, weight) in trace['improvements']:
+                            f.write(';'.join(str(x) for x in [name, algo, run, elapsed, iteration, weight]))
+                            f.write('\n')
+            print('Dumped trace CSV to ' + tracecsvpath)
@@ -0,0 +1,63 @@
+import random
+import numpy as np
+import pytest
+from common import evaluate
+from criterion import IterationCriterion
+from construction import ant_colony, build_ants, pheromone_limits, nearest_neighbour
+from local_search import randomized_local_search
+from tracing import Trace
+from test_moves import asymmetric_instance
+from test_kernels import symmetric_instance
+
+def is_permutation(tour):
+    return sorted(tour) == list(range(len(tour)))
+
+# With few candidates the ants often find all of them visited and go by the
+# whole row instead
+@pytest.mark.parametrize('k', [1, 3, 10])
+def test_build_ants_builds_tours(k):
+    n = 30
+    gen = np.random.default_rng(k)
+    choice = gen.random((n, n))
+    np.fill_diagonal(choice, 0)
+    cand = np.argsort(-choice, axis=1)[:, :k]
+    tours = build_ants(choice, cand, choice[np.arange(n)[:, None], cand], 50, gen)
+    assert tours.shape == (50, n)
+    assert all(is_permutation(tour) for tour in tours.tolist())
+
+# All the attraction on the first candidate: the ants follow it while they can
+def test_build_ants_follows_the_attraction():
+    n = 12
+    cand = np.array([[(v + 1) % n, (v + 2) % n] for v in range(n)])
+    attraction = np.array([[1.0, 0.0]] * n)
+    tours = build_ants(np.ones((n, n)), cand, attraction, 5, np.random.default_rng(0))
+    for tour in tours.tolist():
+        assert all(tour[i + 1] == (tour[i] + 1) % n for i in range(n - 1))
+
+@pytest.mark.parametrize('n', [2, 3, 5, 10, 100])
+def test_pheromone_limits(n):
+    (tau_min, tau_max) = pheromone_limits(1000, 0.02, n)
+    assert tau_max == pytest.approx(1 / (0.02 * 1000))
+    assert 0 < tau_min <= tau_max
+
+INSTANCES = [lambda: symmetric_instance(25, seed=0), lambda: asymmetric_instance(25, seed=0), lambda: asymmetric_instance(4, seed=2)]
+
+@pytest.mark.parametrize('make_graph', INSTANCES)
+@pytest.mark.parametrize('with_local_search', [False, True])
+def test_ant_colony(make_graph, with_local_search):
+    graph = make_graph()
+    rng = random.Random(0)
+    local_search = None
+    if with_local_search:
+        local_search = lambda graph, initial: randomized_local_search(graph, 0.3, lambda: IterationCriterion(50), initial, rng)
+    trace = Trace()
+    (weight, sol) = ant_colony(graph, lambda: IterationCriterion(25), local_search, ants=8, rng=rng, trace=trace)
+    assert is_permutation(sol) and weight == evaluate(graph, sol)
+    assert all(type(v) is int for v in sol)
+    assert trace.iterations == 25
+    assert weight <= nearest_neighbour(graph)[0]
+
+def test_ant_colony_is_replayable():
+    graph = asymmetric_instance(25, seed=1)
+    run = lambda: ant_colony(graph, lambda: IterationCriterion(10), ants=5, rng=random.Random(3))
+    assert run() == run()
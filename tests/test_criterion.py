@@ -0,0 +1,113 @@
+import random
+import pytest
+import kernels
+import time
+from criterion import StopCriterion, IterationCriterion, TimesSeenBestCriterion, AnyCriterion, DeadlineCriterion,\
+    TimeCriterion, MAX_CHECK_EVERY, shared_deadline
+from kernels import kernel_randomized_local_search
+from local_search import simple_local_search, best_neighbour
+from tracing import Trace
+from test_moves import asymmetric_instance
+
+# The iteration at which the criterion stops, fed the incumbents one by one
+def stop_iteration(criterion, incumbents):
+    for (it, weight) in enumerate(incumbents):
+        if criterion.stop():
+            return it
+        criterion.update(weight)
+    return len(incumbents) if criterion.stop() else None
+
+# The same, fed in batches of up to 'batch' (and never past remaining()),
+# with 'stalled' counted as update_many's docstring says
+def batched_stop_iteration(criterion, incumbents, batch):
+    it = 0
+    while it < len(incumbents):
+        if criterion.stop():
+            return it
+        remaining = criterion.remaining()
+        size = min(batch, remaining if remaining is not None else batch, len(incumbents) - it)
+        chunk = incumbents[it:it + size]
+        stalled = 0
+        while stalled < size and chunk[size - 1 - stalled] == chunk[-1]:
+            stalled += 1
+        criterion.update_many(chunk[-1], size, stalled)
+        it += size
+    return len(incumbents) if criterion.stop() else None
+
+def random_incumbents(seed, length=500):
+    rng = random.Random(seed)
+    weight = 1000
+    incumbents = []
+    for _ in range(length):
+        if rng.random() < 0.1:
+            weight -= rng.randint(1, 5)
+        incumbents.append(weight)
+    return incumbents
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('batch', [1, 2, 7, 64])
+@pytest.mark.parametrize('make_criterion', [
+    lambda: TimesSeenBestCriterion(3),
+    lambda: TimesSeenBestCriterion(12),
+    lambda: IterationCriterion(100),
+    lambda: AnyCriterion(IterationCriterion(300), TimesSeenBestCriterion(8)),
+])
+def test_batched_updates_stop_at_the_same_iteration(seed, batch, make_criterion):
+    incumbents = random_incumbents(seed)
+    assert batched_stop_iteration(make_criterion(), incumbents, batch) == stop_iteration(make_criterion(), incumbents)
+
+# Takes one iteration at a time, through update() (the defaults of
+# remaining() and update_many())
+class OneAtATime(StopCriterion):
+    def __init__(self, criterion):
+        self.criterion = criterion
+
+    def update(self, solution_weight):
+        self.criterion.update(solution_weight)
+
+    def stop(self):
+        return self.criterion.stop()
+
+# The kernel's RLS, once one iteration at a time and once in batches as long
+# as the criterion allows: same moves, so they have to stop at the same
+# iteration. From a local optimum the first batch doesn't improve on the
+# initial weight, which the criterion still has to count as its first best.
+@pytest.mark.parametrize('k', [1, 3, 10])
+@pytest.mark.parametrize('local_optimum', [False, True])
+def test_kernel_rls_stops_like_the_unbatched_loop(monkeypatch, k, local_optimum):
+    graph = asymmetric_instance(30, seed=k)
+    initial = None
+    if local_optimum:
+        initial = simple_local_search(graph, lambda: IterationCriterion(10000), best_neighbour, rng=random.Random(k))[1]
+    monkeypatch.setattr(kernels, 'CHECK_INTERVAL_NS', 10**12)  # the batches only grow
+    results = []
+    for make_criterion in (lambda: OneAtATime(TimesSeenBestCriterion(k)), lambda: TimesSeenBestCriterion(k)):
+        trace = Trace()
+        (weight, sol) = kernel_randomized_local_search(graph, 0.4, make_criterion, initial, random.Random(0), trace)
+        results.append((weight, sol, trace.iterations))
+    assert results[0] == results[1]
+
+def test_deadline_needs_a_deadline():
+    with pytest.raises(ValueError):
+        DeadlineCriterion()
+    with shared_deadline(1) as deadline:
+        assert DeadlineCriterion().deadline is deadline
+
+# Iterations that turn from nothing to 5ms each: late by MAX_CHECK_EVERY of them at most
+def test_deadline_after_a_slowdown():
+    criterion = TimeCriterion(0.2)
+    end = criterion.deadline.end_ns
+    calls = 0
+    while not criterion.stop():
+        calls += 1
+        if time.perf_counter_ns() > end - 50_000_000:
+            time.sleep(0.005)
+    assert calls > 1000
+    assert time.perf_counter_ns() - end < MAX_CHECK_EVERY * 5_000_000
+
+def test_deadline_with_slow_iterations_checks_every_call():
+    criterion = TimeCriterion(0.05)
+    end = criterion.deadline.end_ns
+    while not criterion.stop():
+        time.sleep(0.005)
+    assert time.perf_counter_ns() - end < 5 * 5_000_000
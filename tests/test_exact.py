@@ -0,0 +1,66 @@
+import os
+import numpy as np
+import pytest
+from instance import Instance, load_instance
+from common import evaluate, brute_force
+from criterion import IterationCriterion
+from exact import held_karp, branch_and_bound
+from bounds import lagrangian_bound, lower_bound
+from construction import nearest_neighbour
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def random_instance(n, seed, symmetric, integral=True):
+    gen = np.random.default_rng(seed)
+    m = gen.integers(1, 100, size=(n, n)) if integral else gen.random((n, n)) * 100
+    if symmetric:
+        m = m + m.T
+    np.fill_diagonal(m, 0)
+    return Instance(m)
+
+CASES = [(n, seed) for n in range(1, 9) for seed in range(3)] + [(9, 0)]
+
+def assert_optimal(graph, result, optimum):
+    (weight, tour) = result
+    assert sorted(tour) == list(graph.nodes) and tour[0] == 0
+    assert weight == pytest.approx(evaluate(graph, tour))
+    assert weight == pytest.approx(optimum)
+
+@pytest.mark.parametrize('n, seed', CASES)
+@pytest.mark.parametrize('symmetric', [True, False])
+@pytest.mark.parametrize('integral', [True, False])
+def test_exact_solvers_match_brute_force(n, seed, symmetric, integral):
+    graph = random_instance(n, seed, symmetric, integral)
+    optimum = brute_force(graph)[0]
+    assert_optimal(graph, held_karp(graph), optimum)
+    assert_optimal(graph, branch_and_bound(graph), optimum)
+    # starting from the optimum, there's nothing better to find
+    assert_optimal(graph, branch_and_bound(graph, upper=held_karp(graph)), optimum)
+
+# Stopped early, it still returns a tour, no worse than where it started
+def test_branch_and_bound_with_a_criterion():
+    graph = random_instance(12, 0, symmetric=False)
+    upper = nearest_neighbour(graph)
+    (weight, tour) = branch_and_bound(graph, make_criterion=lambda: IterationCriterion(10))
+    assert sorted(tour) == list(graph.nodes) and weight == evaluate(graph, tour)
+    assert weight <= upper[0]
+
+@pytest.mark.parametrize('n', [4, 8, 12])
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('integral', [True, False])
+def test_lower_bound_is_below_the_optimum(n, seed, integral):
+    graph = random_instance(n, seed, True, integral)
+    optimum = held_karp(graph)[0]
+    bound = lower_bound(graph)
+    assert bound <= optimum + 1e-9
+    assert lagrangian_bound(graph, optimum)[0] <= optimum + 1e-9
+    if integral:
+        assert type(bound) is int
+
+def test_lower_bound_of_a_tsplib_instance():
+    graph = load_instance(os.path.join(ROOT, 'instances', 'att48.tsp'))
+    bound = lower_bound(graph)
+    assert 0.98 * 10628 <= bound <= 10628
+
+def test_no_lower_bound_for_asymmetric_instances():
+    assert lower_bound(random_instance(8, 0, symmetric=False)) is None
@@ -0,0 +1,87 @@
+import random
+import numpy as np
+import pytest
+from common import evaluate, random_cycle
+from criterion import IterationCriterion
+from construction import greedy_alpha_vectorized
+from genetic import population_weights, population_hashes, order_crossover, edge_recombination, genetic_algorithm
+from local_search import randomized_local_search
+from memo import tour_hash
+from tracing import Trace
+from test_moves import asymmetric_instance
+
+def random_population(m, n, seed):
+    rng = random.Random(seed)
+    return np.array([random_cycle(range(n), rng) for _ in range(m)], dtype=np.int32)
+
+def edges(tour):
+    return {frozenset((tour[i - 1], tour[i])) for i in range(len(tour))}
+
+def is_permutation(tour):
+    return sorted(tour) == list(range(len(tour)))
+
+# Some segment [i, j) of the first parent, in place, and the rest in the order
+# of the second parent, from j on
+def is_order_crossover(child, first, second):
+    n = len(child)
+    for i in range(n + 1):
+        for j in range(i, n + 1):
+            if child[i:j] != first[i:j]:
+                continue
+            segment = set(first[i:j])
+            rest = [v for v in second[j:] + second[:j] if v not in segment]
+            if [child[(j + k) % n] for k in range(n - (j - i))] == rest:
+                return True
+    return False
+
+@pytest.mark.parametrize('n', [2, 3, 12, 40])
+def test_order_crossover(n):
+    (first, second) = (random_population(30, n, seed=n), random_population(30, n, seed=n + 1))
+    children = order_crossover(first, second, np.random.default_rng(n))
+    for (child, a, b) in zip(children.tolist(), first.tolist(), second.tolist()):
+        assert is_permutation(child)
+        assert is_order_crossover(child, a, b)
+
+# Each edge of the child is an edge of a parent, unless none of the parents'
+# neighbours of the node was left to go to
+@pytest.mark.parametrize('n', [2, 3, 12, 40])
+def test_edge_recombination(n):
+    (first, second) = (random_population(30, n, seed=n), random_population(30, n, seed=n + 1))
+    children = edge_recombination(first, second, np.random.default_rng(n))
+    for (child, a, b) in zip(children.tolist(), first.tolist(), second.tolist()):
+        assert is_permutation(child)
+        assert child[0] == a[0]
+        parent_edges = edges(a) | edges(b)
+        for k in range(n - 1):
+            (u, v) = (child[k], child[k + 1])
+            if frozenset((u, v)) not in parent_edges:
+                neighbours = {w for e in parent_edges if u in e for w in e if w != u}
+                assert neighbours <= set(child[:k + 1])
+
+@pytest.mark.parametrize('crossover', [order_crossover, edge_recombination])
+def test_crossover_of_a_tour_with_itself(crossover):
+    parents = random_population(10, 25, seed=0)
+    children = crossover(parents, parents.copy(), np.random.default_rng(0))
+    for (child, parent) in zip(children.tolist(), parents.tolist()):
+        assert edges(child) == edges(parent)
+
+def test_population_weights_and_hashes():
+    graph = asymmetric_instance(15)
+    population = random_population(20, 15, seed=0)
+    assert population_weights(graph.matrix, population).tolist() == [evaluate(graph, tour) for tour in population.tolist()]
+    assert population_hashes(population).tolist() == [tour_hash(tour) for tour in population.tolist()]
+
+@pytest.mark.parametrize('crossover', [order_crossover, edge_recombination])
+@pytest.mark.parametrize('mutation', [False, True])
+def test_genetic_algorithm(crossover, mutation):
+    graph = asymmetric_instance(20, seed=1)
+    rng = random.Random(0)
+    local_search = None
+    if mutation:
+        local_search = lambda graph, initial: randomized_local_search(graph, 0.3, lambda: IterationCriterion(50), initial, rng)
+    trace = Trace()
+    (weight, sol) = genetic_algorithm(graph, lambda: IterationCriterion(15), lambda graph: greedy_alpha_vectorized(graph, 0.3, rng),\
+        local_search, size=12, crossover=crossover, mutation_rate=0.5, rng=rng, trace=trace)
+    assert is_permutation(sol) and weight == evaluate(graph, sol)
+    assert trace.iterations == 15
+    assert trace.best == weight
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pytest
+import instance
+from instance import Instance, LazyInstance, load_instance, load_cached
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_tsp(path, edge_weight_type, coords):
+    lines = [f'NAME: {path.stem}', 'TYPE: TSP', f'DIMENSION: {len(coords)}', f'EDGE_WEIGHT_TYPE: {edge_weight_type}', 'NODE_COORD_SECTION']
+    lines += [f'{v + 1} {x} {y}' for (v, (x, y)) in enumerate(coords)]
+    path.write_text('\n'.join(lines + ['EOF', '']))
+    return path
+
+# Small integer coordinates, so there are plenty of equal weights, and a few
+# nodes on the same point
+def tied_coords(n, seed, scale):
+    gen = np.random.default_rng(seed)
+    coords = gen.integers(0, 12, size=(n, 2)) * scale
+    coords[-3:] = coords[:3]
+    return coords.tolist()
+
+# DDD.MM: latitudes and longitudes with whole minutes
+def geo_coords(n, seed):
+    gen = np.random.default_rng(seed)
+    degrees = gen.integers(-60, 60, size=(n, 2))
+    minutes = gen.integers(0, 6, size=(n, 2)) * 10
+    coords = np.round(degrees + np.sign(degrees) * minutes / 100, 2)
+    coords[-2:] = coords[:2]
+    return coords.tolist()
+
+@pytest.fixture(params=['EUC_2D', 'CEIL_2D', 'ATT', 'GEO', 'a280', 'att48'])
+def tsp_file(request, tmp_path):
+    if request.param in ('a280', 'att48'):
+        return os.path.join(ROOT, 'instances', f'{request.param}.tsp')
+    if request.param == 'GEO':
+        return str(write_tsp(tmp_path / 'geo60.tsp', 'GEO', geo_coords(60, seed=0)))
+    scale = 100 if request.param == 'ATT' else 1
+    return str(write_tsp(tmp_path / f'{request.param.lower()}80.tsp', request.param, tied_coords(80, seed=1, scale=scale)))
+
+def assert_same_weights(dense, lazy):
+    n = dense.n
+    assert lazy.n == n and lazy.labels == dense.labels and lazy.edge_weight_type == dense.edge_weight_type
+    for v in dense.nodes:
+        assert [lazy.rows[v][w] for w in range(n)] == [dense.rows[v][w] for w in range(n)]
+        assert lazy.matrix[v].tolist() == dense.matrix[v].tolist()
+    gen = np.random.default_rng(n)
+    (a, b) = (gen.integers(0, n, size=(20, n)), gen.integers(0, n, size=(20, n)))
+    b[:, 0] = a[:, 0]  # from a node to itself too
+    assert lazy.matrix[a, b].tolist() == dense.matrix[a, b].tolist()
+
+def test_lazy_weights_match(tsp_file):
+    (dense, lazy) = (load_instance(tsp_file, lazy=False), load_instance(tsp_file, lazy=True))
+    assert type(dense) is Instance and type(lazy) is LazyInstance
+    assert_same_weights(dense, lazy)
+
+@pytest.mark.parametrize('k', [1, 2, 5, 10, 1000])
+def test_lazy_candidates_match(tsp_file, k):
+    (dense, lazy) = (load_instance(tsp_file, lazy=False), load_instance(tsp_file, lazy=True))
+    assert lazy.candidates(k) == dense.candidates(k)
+
+# The first load builds the cache, the second one reads it back
+@pytest.mark.parametrize('lazy', [False, True])
+def test_load_cached_round_trip(tsp_file, tmp_path, monkeypatch, lazy):
+    monkeypatch.setattr(instance, 'LAZY_MIN_NODES', 1 if lazy else 10**9)
+    cache_dir = str(tmp_path / 'cache')
+    built = load_cached(tsp_file, 'test', 1234, cache_dir)
+    loaded = load_cached(tsp_file, 'test', 1234, cache_dir)
+    for graph in (built, loaded):
+        assert type(graph) is (LazyInstance if lazy else Instance)
+        assert (graph.name, graph.bks) == ('test', 1234)
+    assert np.array_equal(loaded.coords, built.coords)
+    assert_same_weights(built, loaded)
+    assert loaded.candidates(8) == built.candidates(8)
+    if not lazy:
+        assert np.array_equal(loaded.matrix, built.matrix) and loaded.matrix.dtype == built.matrix.dtype
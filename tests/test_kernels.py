@@ -0,0 +1,155 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import numpy as np
+import pytest
+from array import array
+from instance import Instance
+from common import evaluate, random_cycle
+from criterion import StopCriterion, IterationCriterion, TimesSeenBestCriterion
+from kernels import python_kernels, jit_kernels, new_state, kernel_randomized_local_search
+from local_search import randomized_local_search
+from tour import Tour
+from tracing import Trace
+from test_moves import asymmetric_instance
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+needs_jit = pytest.mark.skipif(jit_kernels is None, reason='needs Numba (with the JIT enabled)')
+
+def symmetric_instance(n, seed=0):
+    gen = np.random.default_rng(seed)
+    m = gen.integers(1, 100, size=(n, n))
+    m = m + m.T
+    np.fill_diagonal(m, 0)
+    return Instance(m, name='sym')
+
+INSTANCES = [
+    lambda: symmetric_instance(4, seed=1),
+    lambda: symmetric_instance(30, seed=2),
+    lambda: asymmetric_instance(5, seed=3),
+    lambda: asymmetric_instance(40, seed=4),
+]
+
+# The same tour, as the Python kernels take it and as the compiled ones do
+def both_states(graph, seed):
+    order = array('i', random_cycle(graph.nodes, random.Random(seed)))
+    pos = array('i', Tour(order).position)
+    python = (graph.rows, array('i', order), array('i', pos))
+    jit = (np.asarray(graph.matrix), np.array(order, dtype=np.int32), np.array(pos, dtype=np.int32))
+    return (python, jit)
+
+@needs_jit
+@pytest.mark.parametrize('make_graph', INSTANCES)
+@pytest.mark.parametrize('seed', range(3))
+def test_scans_match(make_graph, seed):
+    graph = make_graph()
+    ((d, order, _), (jd, jorder, _)) = both_states(graph, seed)
+    assert python_kernels.tour_weight(d, order) == jit_kernels.tour_weight(jd, jorder) == evaluate(graph, order)
+    for i in range(graph.n):
+        assert python_kernels.swap_delta(d, order, i) == jit_kernels.swap_delta(jd, jorder, i)
+    assert python_kernels.best_swap(d, order) == tuple(jit_kernels.best_swap(jd, jorder))
+    if graph.symmetric:
+        assert python_kernels.best_two_opt(d, order) == tuple(jit_kernels.best_two_opt(jd, jorder))
+
+@needs_jit
+@pytest.mark.parametrize('make_graph', INSTANCES)
+@pytest.mark.parametrize('k', [1, 7, 50])
+def test_perturb_matches(make_graph, k):
+    graph = make_graph()
+    ((_, order, pos), (_, jorder, jpos)) = both_states(graph, k)
+    state = new_state(random.Random(k))
+    assert python_kernels.perturb(order, pos, k, state) == jit_kernels.perturb(jorder, jpos, k, state)
+    assert list(order) == jorder.tolist() and list(pos) == jpos.tolist()
+
+@needs_jit
+@pytest.mark.parametrize('make_graph', INSTANCES)
+@pytest.mark.parametrize('probability', [0.0, 0.4, 1.0])
+def test_rls_matches(make_graph, probability):
+    graph = make_graph()
+    ((d, order, pos), (jd, jorder, jpos)) = both_states(graph, 0)
+    weight = evaluate(graph, order)
+    (inc, jinc) = (array('i', order), jorder.copy())
+    state = new_state(random.Random(1))
+    for iterations in (1, 10, 500):
+        result = python_kernels.rls(d, order, pos, weight, inc, weight, probability, iterations, state)
+        jresult = jit_kernels.rls(jd, jorder, jpos, weight, jinc, weight, probability, iterations, state)
+        assert result == tuple(jresult)
+        assert list(order) == jorder.tolist() and list(pos) == jpos.tolist() and list(inc) == jinc.tolist()
+        (weight, state) = (result[0], result[2])
+
+# The module as imported with NUMBA_DISABLE_JIT runs the Python kernels, with the same results
+@needs_jit
+def test_disable_jit_gives_the_same_run():
+    graph = asymmetric_instance(40, seed=5)
+    run = lambda: kernel_randomized_local_search(graph, 0.4, lambda: IterationCriterion(2000), rng=random.Random(0))
+    script = '\n'.join([
+        'import json, random, kernels',
+        'from criterion import IterationCriterion',
+        'from test_moves import asymmetric_instance',
+        'assert kernels.jit_kernels is None',
+        'graph = asymmetric_instance(40, seed=5)',
+        'print(json.dumps(kernels.kernel_randomized_local_search(graph, 0.4, lambda: IterationCriterion(2000), rng=random.Random(0))))',
+    ])
+    env = dict(os.environ, NUMBA_DISABLE_JIT='1', PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, 'tests')]))
+    output = subprocess.run([sys.executable, '-c', script], env=env, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    assert json.loads(output) == list(run())
+
+"""
+The kernel RLS and randomized_local_search draw their random numbers
+differently, so their runs aren't the same, but they have to do the same
+number of iterations under an iteration limit and stop the same way under
+TimesSeenBestCriterion
+"""
+
+# The incumbent of each iteration, as far as the criterion was told: None for
+# the iterations of a batch before the improvement (worse than the batch's
+# final incumbent)
+class Recorder(StopCriterion):
+    def __init__(self, criterion):
+        self.criterion = criterion
+        self.incumbents = []
+
+    def stop(self):
+        return self.criterion.stop()
+
+    def remaining(self):
+        return self.criterion.remaining()
+
+    def update(self, solution_weight):
+        self.incumbents.append(solution_weight)
+        self.criterion.update(solution_weight)
+
+    def update_many(self, solution_weight, iterations, stalled):
+        self.incumbents += [None] * (iterations - stalled) + [solution_weight] * stalled
+        self.criterion.update_many(solution_weight, iterations, stalled)
+
+RLS = [kernel_randomized_local_search, randomized_local_search]
+
+@pytest.mark.parametrize('rls', RLS)
+@pytest.mark.parametrize('make_graph', INSTANCES)
+@pytest.mark.parametrize('iterations', [1, 100, 1500])
+def test_rls_iteration_limit(rls, make_graph, iterations):
+    graph = make_graph()
+    trace = Trace()
+    (weight, sol) = rls(graph, 0.3, lambda: IterationCriterion(iterations), rng=random.Random(iterations), trace=trace)
+    assert trace.iterations == iterations
+    assert sorted(sol) == list(graph.nodes) and weight == evaluate(graph, sol)
+
+@pytest.mark.parametrize('rls', RLS)
+@pytest.mark.parametrize('make_graph', INSTANCES)
+@pytest.mark.parametrize('k', [1, 5, 40])
+def test_rls_times_seen_best(rls, make_graph, k):
+    graph = make_graph()
+    trace = Trace()
+    recorder = Recorder(TimesSeenBestCriterion(k))
+    (weight, sol) = rls(graph, 0.3, lambda: recorder, rng=random.Random(k), trace=trace)
+    assert sorted(sol) == list(graph.nodes) and weight == evaluate(graph, sol)
+    incumbents = recorder.incumbents
+    assert len(incumbents) == trace.iterations
+    # stopped when the final incumbent had been seen k more times after it was
+    # found, not later
+    assert incumbents[-k - 1:] == [weight] * (k + 1)
+    assert len(incumbents) == k + 1 or incumbents[-k - 2] != weight
@@ -0,0 +1,65 @@
+import random
+import numpy as np
+import pytest
+from array import array
+from common import random_cycle
+from memo import tour_hash, TourCache, memoized
+from tour import Tour
+
+@pytest.mark.parametrize('n', [3, 10, 200])
+def test_tour_hash_is_the_same_for_the_same_cycle(n):
+    tour = random_cycle(range(n), random.Random(n))
+    h = tour_hash(tour)
+    for shift in range(0, n, max(n // 7, 1)):
+        rotated = tour[shift:] + tour[:shift]
+        assert tour_hash(rotated) == h
+        assert tour_hash(rotated[::-1]) == h
+    assert tour_hash(array('i', tour)) == tour_hash(Tour(tour)) == tour_hash(np.array(tour)) == h
+
+@pytest.mark.parametrize('n', [5, 10, 200])
+def test_tour_hash_tells_cycles_apart(n):
+    rng = random.Random(n)
+    tour = random_cycle(range(n), rng)
+    hashes = {tour_hash(tour)}
+    for i in range(1, n - 1):  # each of these is another cycle
+        other = list(tour)
+        (other[i], other[i + 1]) = (other[i + 1], other[i])
+        hashes.add(tour_hash(other))
+    assert len(hashes) == n - 1
+
+def test_tour_cache_lru():
+    cache = TourCache(2)
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    assert cache.get(1) == 'a'  # 1 is now the most recently used
+    cache.put(3, 'c')  # so 2 goes
+    assert cache.get(2) is None
+    assert (cache.get(1), cache.get(3)) == ('a', 'c')
+    cache.put(4, 'd')  # 1 is the least recently used now
+    assert cache.get(1) is None
+    assert cache.to_dict() == {
+        'capacity': 2,
+        'size': 2,
+        'hits': 3,
+        'misses': 2,
+        'evictions': 2,
+        'hit_rate': 3 / 5,
+    }
+
+def test_memoized():
+    calls = []
+    def local_search(graph, initial):
+        calls.append(list(initial))
+        return (len(calls), list(initial))
+
+    assert memoized(local_search, None) is local_search
+    cache = TourCache(10)
+    search = memoized(local_search, cache)
+    tour = random_cycle(range(8), random.Random(0))
+    assert search(None, tour) == (1, tour)
+    assert search(None, tour[3:] + tour[:3]) == (1, tour)  # the same cycle, from the cache
+    assert search(None, list(reversed(tour))) == (1, tour)
+    assert len(calls) == 1 and (cache.hits, cache.misses) == (2, 1)
+    other = tour[1:2] + tour[:1] + tour[2:]
+    assert search(None, other) == (2, other)
+    assert (cache.hits, cache.misses) == (2, 2)
@@ -0,0 +1,88 @@
+import random
+import numpy as np
+from array import array
+import pytest
+from instance import Instance
+from common import evaluate, random_walk
+from criterion import IterationCriterion
+from moves import swap_delta, apply_swap
+from tour import Tour
+from local_search import *
+from kernels import python_kernels, jit_kernels, kernel_evaluate, kernel_best_neighbour, kernel_best_two_opt_neighbour, kernel_randomized_local_search
+
+def asymmetric_instance(n, seed=0):
+    gen = np.random.default_rng(seed)
+    m = gen.integers(1, 100, size=(n, n))
+    np.fill_diagonal(m, 0)
+    return Instance(m, name='asym')
+
+# n = 80 goes through best_neighbour_batched
+SIZES = [3, 20, 80]
+
+@pytest.mark.parametrize('n', SIZES)
+def test_swap_delta_on_asymmetric_matrix(n):
+    graph = asymmetric_instance(n)
+    sol = random_cycle(graph.nodes, random.Random(n))
+    for i in range(n):
+        moved = list(sol)
+        apply_swap(moved, i)
+        expected = evaluate(graph, moved) - evaluate(graph, sol)
+        assert swap_delta(graph.rows, sol, i) == expected
+        assert python_kernels.swap_delta(graph.rows, sol, i) == expected
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('select', [first_better_neighbour, best_neighbour, kernel_best_neighbour])
+def test_swap_searches_report_the_real_weight(n, select):
+    graph = asymmetric_instance(n)
+    (weight, sol) = simple_local_search(graph, lambda: IterationCriterion(1000), select, rng=random.Random(0))
+    assert weight == evaluate(graph, sol)
+
+@pytest.mark.parametrize('n', SIZES)
+def test_randomized_searches_report_the_real_weight(n):
+    graph = asymmetric_instance(n)
+    for search in (randomized_local_search, kernel_randomized_local_search):
+        (weight, sol) = search(graph, 0.4, lambda: IterationCriterion(500), rng=random.Random(0))
+        assert weight == evaluate(graph, sol)
+    (weight, sol) = random_walk(graph, lambda: IterationCriterion(500), random.Random(0))
+    assert weight == evaluate(graph, sol)
+
+def test_segment_reversals_refuse_asymmetric_instances():
+    graph = asymmetric_instance(20)
+    criterion = lambda: IterationCriterion(100)
+    tour = Tour(list(graph.nodes))
+    with pytest.raises(ValueError, match='symmetric'):
+        two_opt_local_search(graph, criterion)
+    with pytest.raises(ValueError, match='symmetric'):
+        lin_kernighan(graph, criterion)
+    for select in (two_opt_neighbour, or_opt_neighbour, best_two_opt_neighbour, kernel_best_two_opt_neighbour):
+        with pytest.raises(ValueError, match='symmetric'):
+            select(graph, tour, evaluate(graph, tour.order))
+
+# Swapping the two nodes of a 2-cycle (or the one of a 1-cycle) gives the same cycle
+@pytest.mark.parametrize('matrix', [[[0]], [[0, 3], [5, 0]]])
+def test_swap_delta_below_three_nodes(matrix):
+    graph = Instance(np.array(matrix))
+    sol = list(graph.nodes)
+    for i in range(graph.n):
+        assert swap_delta(graph.rows, sol, i) == 0
+        assert python_kernels.swap_delta(graph.rows, array('i', sol), i) == 0
+        if jit_kernels is not None:
+            assert jit_kernels.swap_delta(graph.matrix, np.array(sol, dtype=np.int32), i) == 0
+    for rls in (randomized_local_search, kernel_randomized_local_search):
+        (weight, sol) = rls(graph, 0.5, lambda: IterationCriterion(20), rng=random.Random(0))
+        assert weight == evaluate(graph, sol) == sum(map(sum, matrix))
+
+def test_evaluate_empty_tour():
+    graph = asymmetric_instance(3)
+    assert evaluate(graph, []) == 0
+    assert kernel_evaluate(graph, []) == 0
+
+# A local search that changes the list it's given and returns it as its solution
+def reversing_search(graph, initial):
+    initial[:] = initial[::-1]
+    return (evaluate(graph, initial), initial)
+
+def test_ils_gives_the_local_search_a_list_of_its_own():
+    graph = asymmetric_instance(20)
+    (weight, sol) = iterated_local_search(graph, reversing_search, lambda: IterationCriterion(30), 0.2, rng=random.Random(0))
+    assert sorted(sol) == list(graph.nodes) and weight == evaluate(graph, sol)
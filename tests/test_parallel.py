@@ -0,0 +1,49 @@
+import os
+import random
+import numpy as np
+import pytest
+from instance import Instance
+from construction import greedy_alpha_vectorized
+from common import evaluate
+from criterion import IterationCriterion, TimeCriterion
+from parallel import Island, parallel_grasp, can_fork
+from local_search import perturb
+from test_moves import reversing_search
+
+def small_instance(n=12, seed=0):
+    gen = np.random.default_rng(seed)
+    m = gen.integers(1, 100, size=(n, n))
+    m = m + m.T
+    np.fill_diagonal(m, 0)
+    return Instance(m)
+
+def failing_search(graph, sol):
+    raise RuntimeError('local search failed')
+
+def dying_search(graph, sol):
+    os._exit(3)
+
+@pytest.mark.skipif(not can_fork(), reason='needs fork')
+@pytest.mark.parametrize('local_search, message', [(failing_search, 'local search failed'), (dying_search, 'died')])
+def test_parallel_grasp_worker_failure_is_raised(local_search, message):
+    graph = small_instance()
+    rng = random.Random(0)
+    with pytest.raises(RuntimeError, match=message):
+        parallel_grasp(graph, lambda graph: greedy_alpha_vectorized(graph, 0.5, rng), local_search,\
+            lambda: IterationCriterion(10), 2, rng)
+
+# A criterion met before the first iteration still gets the initial construction back
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parallel_grasp_criterion_met_at_once(workers):
+    graph = small_instance()
+    rng = random.Random(0)
+    (weight, sol) = parallel_grasp(graph, lambda graph: greedy_alpha_vectorized(graph, 0.5, rng), lambda graph, sol: (evaluate(graph, sol), sol),\
+        lambda: TimeCriterion(0), workers, rng)
+    assert sorted(sol) == list(graph.nodes)
+    assert weight == evaluate(graph, sol)
+
+def test_island_gives_the_local_search_a_list_of_its_own():
+    graph = small_instance()
+    island = Island(graph, lambda rng, trace: reversing_search, lambda: IterationCriterion(30), 0.3, perturb, None, 0, False)
+    island.run(30)
+    assert sorted(island.inc_sol) == list(graph.nodes) and island.inc_weight == evaluate(graph, island.inc_sol)
@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from stats import open_log, read_log
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.mark.parametrize('content, kept', [
+    ('', ''),
+    ('{"a": 1}\n', '{"a": 1}\n'),
+    ('{"a": 1}\n{"b": ', '{"a": 1}\n'),
+    ('{"b": ', ''),
+    ('{"a": 1}\n' + 'x' * 10000, '{"a": 1}\n'),
+])
+def test_open_log_cuts_a_torn_last_line(tmp_path, content, kept):
+    path = tmp_path / 'log.jsonl'
+    path.write_text(content)
+    with open_log(path) as f:
+        f.write('{"c": 2}\n')
+    assert path.read_text() == kept + '{"c": 2}\n'
+
+def test_open_log_new_file(tmp_path):
+    path = tmp_path / 'log.jsonl'
+    with open_log(path) as f:
+        f.write('{"c": 2}\n')
+    assert path.read_text() == '{"c": 2}\n'
+
+def run_stats(log, out):
+    subprocess.run([sys.executable, os.path.join(ROOT, 'stats.py'), '--runs', '3', '--algos', 'RAND', '--instances', 'att48',\
+        '--criterion', 'iters,100', '--log', str(log), '--out', str(out), '--resume'], cwd=ROOT, check=True, capture_output=True)
+
+# A run killed while writing its last record, resumed: that cell runs again and every line of the log parses
+def test_resume_from_a_torn_log(tmp_path):
+    (log, out) = (tmp_path / 'log.jsonl', tmp_path / 'out.json')
+    run_stats(log, out)
+    lines = log.read_text().splitlines(keepends=True)
+    assert len(lines) == 3
+    complete = json.loads(out.read_text())
+
+    log.write_text(''.join(lines[:2]) + lines[2][:len(lines[2]) // 2])
+    run_stats(log, out)
+    lines = log.read_text().splitlines()
+    assert len(lines) == 3
+    records = [json.loads(line) for line in lines]
+    assert sorted(record['run'] for record in records) == [0, 1, 2]
+    params = records[0]['params']
+    assert len(list(read_log(log, params))) == 3
+    assert json.loads(out.read_text()) == complete
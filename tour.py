@@ -0,0 +1,83 @@
+from array import array
+from moves import apply_swap, reverse_segment
+
+"""
+Tour representation
+
+The order of the nodes is kept in an array('i'), along with the inverse
+permutation (position[v] is where node v is in the order), so finding a node,
+its successor or its predecessor is O(1) instead of a scan of the list.
+
+Both are flat arrays of C ints: copying them is a memcpy, and they aren't
+tracked by the garbage collector like lists are, so keeping snapshots of
+incumbents is cheap.
+
+The move functions in moves.py take (order, position) and work on these
+arrays directly, the methods here are just shorthands for them.
+"""
+
+class Tour:
+    def __init__(self, nodes):
+        if isinstance(nodes, Tour):
+            self.order = array('i', nodes.order)
+            self.position = array('i', nodes.position)
+        else:
+            self.order = array('i', nodes)
+            self.position = array('i', [0]) * len(self.order)
+            self.reindex()
+
+    def reindex(self):
+        position = self.position
+        for i, v in enumerate(self.order):
+            position[v] = i
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __getitem__(self, i):
+        return self.order[i]
+
+    def pos(self, v):
+        return self.position[v]
+
+    def next(self, v):
+        i = self.position[v] + 1
+        return self.order[i if i < len(self.order) else 0]
+
+    def prev(self, v):
+        return self.order[self.position[v] - 1]
+
+    def swap(self, i):
+        apply_swap(self.order, i, self.position)
+
+    def reverse(self, i, j):
+        reverse_segment(self.order, self.position, i, j)
+
+    """
+    A snapshot is a copy of both arrays, restore() copies them back
+    Passing a previous snapshot overwrites it instead of allocating a new one
+    """
+
+    def snapshot(self, snap=None):
+        if snap is None:
+            return (array('i', self.order), array('i', self.position))
+        snap[0][:] = self.order
+        snap[1][:] = self.position
+        return snap
+
+    def restore(self, snap):
+        self.order[:] = snap[0]
+        self.position[:] = snap[1]
+
+    """
+    Loads another order into this tour, reusing its arrays
+    """
+    def load(self, nodes):
+        self.order[:] = array('i', nodes)
+        self.reindex()
+
+    def tolist(self):
+        return self.order.tolist()
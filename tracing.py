@@ -0,0 +1,64 @@
+from time import perf_counter_ns
+
+"""
+Convergence traces
+
+All the algorithms take an optional 'trace'. When it's None (the default)
+the only cost is an 'is not None' check per iteration. When it's a Trace,
+each iteration of any loop (including the loops of sub-searches) calls
+step() with the weight of that loop's incumbent, and the trace records
+(elapsed_ns, iteration, weight) whenever that's better than anything it has
+seen, which gives the anytime-performance curve of the whole run.
+
+Besides that it counts:
+    evaluated:    neighbours evaluated (deltas computed)
+    scanned:      nodes whose candidate moves were searched (2-opt/Or-opt with
+                  candidate lists, where counting each delta would cost too much)
+    moves:        moves applied to the current solution
+    local_optima: local optima reached
+"""
+
+class Trace:
+    def __init__(self):
+        self.start_ns = perf_counter_ns()
+        self.end_ns = None
+        self.iterations = 0
+        self.evaluated = 0
+        self.scanned = 0
+        self.moves = 0
+        self.local_optima = 0
+        self.best = float('inf')
+        self.improvements = []
+
+    def step(self, weight):
+        self.iterations += 1
+        if weight < self.best:
+            self.best = weight
+            self.improvements.append((perf_counter_ns() - self.start_ns, self.iterations, weight))
+
+    # When the run first got to 'weight' or better (ns from the start), None if it never did
+    def time_to(self, weight):
+        for (elapsed, _, w) in self.improvements:
+            if w <= weight:
+                return elapsed
+        return None
+
+    def finish(self):
+        self.end_ns = perf_counter_ns()
+
+    def elapsed_ns(self):
+        end = self.end_ns if self.end_ns is not None else perf_counter_ns()
+        return end - self.start_ns
+
+    def to_dict(self):
+        elapsed = self.elapsed_ns()
+        return {
+            'elapsed_ns': elapsed,
+            'iterations': self.iterations,
+            'evaluated': self.evaluated,
+            'scanned': self.scanned,
+            'moves': self.moves,
+            'local_optima': self.local_optima,
+            'evaluations_per_second': self.evaluated / (elapsed / 1e9) if elapsed > 0 else 0,
+            'improvements': self.improvements,
+        }